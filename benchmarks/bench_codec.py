@@ -0,0 +1,51 @@
+# Compares pywechat.codec with the xmltodict + pydantic path it replaced.
+#
+#     python -m benchmarks.bench_codec
+import timeit
+import xmltodict
+from pywechat.codec import model_to_xml, xml_to_model
+from pywechat.models.message import GenericMessage, MessageType, TextMessage
+
+
+EVENT_XML = "<xml><ToUserName><![CDATA[gh_399908c3505e]]></ToUserName><FromUserName><![CDATA[oIqny6t2aR0L7dhDHr6qkm27kvxA]]></FromUserName><CreateTime>1727187078</CreateTime><MsgType><![CDATA[event]]></MsgType><Event><![CDATA[CLICK]]></Event><EventKey><![CDATA[menu_1]]></EventKey></xml>"  # noqa
+TEXT_MESSAGE = TextMessage(
+    ToUserName="oIqny6t2aR0L7dhDHr6qkm27kvxA",
+    FromUserName="gh_399908c3505e",
+    CreateTime=1727188435,
+    MsgType=MessageType.TEXT,
+    Content="Received text message: hello",
+)
+
+
+def xmltodict_xml_to_message(xml: str) -> GenericMessage:
+    return GenericMessage.model_validate(xmltodict.parse(xml).get("xml"))
+
+
+def xmltodict_message_to_xml(message) -> str:
+    return xmltodict.unparse(
+        {"xml": message.model_dump(mode="json", exclude_none=True)},
+        full_document=False,
+    )
+
+
+def bench(name: str, baseline, candidate, number: int = 20000):
+    baseline_time = min(timeit.repeat(baseline, number=number, repeat=5))
+    candidate_time = min(timeit.repeat(candidate, number=number, repeat=5))
+    print(
+        f"{name:<16} xmltodict {baseline_time / number * 1e6:7.2f} us  "
+        f"codec {candidate_time / number * 1e6:7.2f} us  "
+        f"speedup {baseline_time / candidate_time:5.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    bench(
+        "xml_to_message",
+        lambda: xmltodict_xml_to_message(EVENT_XML),
+        lambda: xml_to_model(EVENT_XML, GenericMessage),
+    )
+    bench(
+        "message_to_xml",
+        lambda: xmltodict_message_to_xml(TEXT_MESSAGE),
+        lambda: model_to_xml(TEXT_MESSAGE),
+    )
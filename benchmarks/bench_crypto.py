@@ -0,0 +1,78 @@
+# Compares BaseWechatClient.encrypt/decrypt with the copy-heavy
+# implementation they replaced, in messages/sec and peak bytes allocated.
+#
+#     python -m benchmarks.bench_crypto
+import base64
+import secrets
+import socket
+import struct
+import time
+import tracemalloc
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import algorithms
+from pywechat.client import WechatClient
+
+
+KEY = base64.b64encode(bytes(range(32))).decode()[:-1]
+
+
+def legacy_encrypt(client: WechatClient, xml: str) -> str:
+    text = xml.encode("utf-8")
+    tmp_list = []
+    tmp_list.append(secrets.token_bytes(16))
+    tmp_list.append(struct.pack(b"I", socket.htonl(len(text))))
+    tmp_list.append(text)
+    tmp_list.append(client._appid.encode("utf-8"))
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded = padder.update(b"".join(tmp_list)) + padder.finalize()
+    encryptor = client._chipper.encryptor()
+    ciphertext = encryptor.update(padded) + encryptor.finalize()
+    return base64.b64encode(ciphertext).decode("utf-8")
+
+
+def legacy_decrypt(client: WechatClient, encrypt: str) -> str:
+    decryptor = client._chipper.decryptor()
+    plain_text = decryptor.update(base64.b64decode(encrypt)) + decryptor.finalize()
+    pad = plain_text[-1]
+    content = plain_text[16:-pad]
+    xml_length = socket.ntohl(struct.unpack(b"I", content[:4])[0])
+    xml_content = (content[4 : xml_length + 4]).decode("utf-8")
+    from_appid = (content[xml_length + 4 :]).decode("utf-8")
+    if from_appid != client._appid:
+        raise Exception("Invalid AppID")
+    return xml_content
+
+
+def measure(func, *args, seconds: float = 0.5):
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func(*args)
+        count += 100
+    return count / (time.perf_counter() - start), peak
+
+
+def report(name: str, legacy, current, *args):
+    legacy_rate, legacy_peak = measure(legacy, *args)
+    rate, peak = measure(current, *args)
+    print(
+        f"{name:<14} legacy {legacy_rate:9.0f} msg/s {legacy_peak:8d} B  "
+        f"current {rate:9.0f} msg/s {peak:8d} B"
+    )
+
+
+if __name__ == "__main__":
+    client = WechatClient("wx0000000000000000", "secret", "token", KEY)
+    for size in (256, 4096, 65536):
+        xml = "<xml><Content><![CDATA[" + "x" * size + "]]></Content></xml>"
+        encrypt = client.encrypt(xml)
+        assert legacy_decrypt(client, encrypt) == xml
+        assert client.decrypt(legacy_encrypt(client, xml)) == xml
+        report(f"encrypt {size}", legacy_encrypt, type(client).encrypt, client, xml)
+        report(f"decrypt {size}", legacy_decrypt, type(client).decrypt, client, encrypt)
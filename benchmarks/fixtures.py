@@ -0,0 +1,90 @@
+# Synthetic messages and offline clients for the benchmarks. Nothing here
+# talks to WeChat: credentials are fake and API calls go to a mock transport.
+import base64
+import json
+import os
+from typing import Dict, Optional
+import httpx
+from pydantic import BaseModel
+from pywechat.client import AsyncWechatClient, WechatClient
+from pywechat.simulator.pushes import sample_messages
+
+
+APPID = "wx0000000000000000"
+APP_SECRET = "secret"
+APP_TOKEN = "token"
+ENCODING_AES_KEY = base64.b64encode(bytes(range(32))).decode()[:-1]
+
+MESSAGES: Dict[str, BaseModel] = sample_messages()
+
+
+def set_fake_environment():
+    # The example server reads its credentials from the environment.
+    os.environ.setdefault("APPID", APPID)
+    os.environ.setdefault("APPSECRET", APP_SECRET)
+    os.environ.setdefault("APPTOKEN", APP_TOKEN)
+    os.environ.setdefault("ENCODING_AES_KEY", ENCODING_AES_KEY)
+
+
+def _token_handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/cgi-bin/token":
+        return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+    if request.url.path == "/cgi-bin/ticket/getticket":
+        return httpx.Response(200, json={"ticket": "t" * 86, "expires_in": 7200})
+    return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+
+def offline_client() -> WechatClient:
+    return WechatClient(
+        APPID,
+        APP_SECRET,
+        APP_TOKEN,
+        ENCODING_AES_KEY,
+        http_client=httpx.Client(transport=httpx.MockTransport(_token_handler)),
+    )
+
+
+def offline_async_client(
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> AsyncWechatClient:
+    return AsyncWechatClient(
+        APPID,
+        APP_SECRET,
+        APP_TOKEN,
+        ENCODING_AES_KEY,
+        http_client=httpx.AsyncClient(
+            transport=transport or httpx.MockTransport(_token_handler)
+        ),
+    )
+
+
+def follower_api(total: int) -> httpx.MockTransport:
+    # user/get and user/info/batchget for `total` synthetic followers.
+    openids = [f"o{i:027d}" for i in range(total)]
+    positions = {openid: i for i, openid in enumerate(openids)}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/cgi-bin/user/get":
+            start = request.url.params.get("next_openid")
+            index = positions[start] + 1 if start else 0
+            page = openids[index : index + 10000]
+            return httpx.Response(
+                200,
+                json={
+                    "total": total,
+                    "count": len(page),
+                    "data": {"openid": page},
+                    "next_openid": page[-1] if page else "",
+                },
+            )
+        if path == "/cgi-bin/user/info/batchget":
+            users = json.loads(request.content)["user_list"]
+            profiles = [
+                {"subscribe": 1, "openid": user["openid"], "language": "zh_CN"}
+                for user in users
+            ]
+            return httpx.Response(200, json={"user_info_list": profiles})
+        return _token_handler(request)
+
+    return httpx.MockTransport(handler)
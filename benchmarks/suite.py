@@ -0,0 +1,371 @@
+# Offline benchmarks of the push-message hot path with machine-readable
+# results, so runs of different versions can be compared.
+#
+#     python -m benchmarks.suite --json results.json
+#     python -m benchmarks.suite --filter crypto --compare results.json
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from importlib import metadata
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from pywechat.location import LocationStore
+from pywechat.models.message import EncryptedRequestMessage, MessageType
+from pywechat.router import MessageRouter
+from pywechat.simulator.pushes import PushFactory
+from .fixtures import (
+    MESSAGES,
+    follower_api,
+    offline_async_client,
+    offline_client,
+    set_fake_environment,
+)
+
+
+# A batch runs the operation under test n times.
+Batch = Callable[[int], Union[None, Awaitable[None]]]
+
+BENCHMARKS: Dict[str, Callable[[], Union[Batch, Awaitable[Batch]]]] = {}
+
+
+def benchmark(name: str):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def _repeat(op: Callable[[], object]) -> Batch:
+    def batch(n: int):
+        for _ in range(n):
+            op()
+
+    return batch
+
+
+@benchmark("signature/generate")
+def _generate_signature():
+    client = offline_client()
+    return _repeat(lambda: client.generate_signature("1700000000", "123456789"))
+
+
+@benchmark("signature/check")
+def _check_signature():
+    client = offline_client()
+    signature = client.generate_signature("1700000000", "123456789")
+    return _repeat(lambda: client.check_signature(signature, "1700000000", "123456789"))
+
+
+@benchmark("signature/reject_forged")
+def _reject_forged():
+    client = offline_client()
+    timestamp = str(int(time.time()))
+    verifier = client.signature_verifier
+    return _repeat(lambda: verifier.check_request("0" * 40, timestamp, "123456789"))
+
+
+def _codec(name, message):
+    @benchmark(f"codec/xml_to_message/{name}")
+    def parse():
+        client = offline_client()
+        xml = client.message_to_xml(message).encode()
+        return _repeat(lambda: client.xml_to_message(xml))
+
+    @benchmark(f"codec/message_to_xml/{name}")
+    def serialize():
+        client = offline_client()
+        return _repeat(lambda: client.message_to_xml(message))
+
+    @benchmark(f"crypto/round_trip/{name}")
+    def round_trip():
+        client = offline_client()
+
+        def op():
+            encrypted = client.encrypt_message(message)
+            client.decrypt_message(
+                EncryptedRequestMessage(
+                    ToUserName=message.ToUserName, Encrypt=encrypted.Encrypt
+                )
+            )
+
+        return _repeat(op)
+
+
+for _name, _message in MESSAGES.items():
+    _codec(_name, _message)
+
+
+@benchmark("startup/import_client")
+def _import_client():
+    # A fresh interpreter per op, so this includes interpreter startup.
+    # `python -X importtime -c "import pywechat.client"` breaks it down.
+    def op():
+        subprocess.run([sys.executable, "-c", "import pywechat.client"], check=True)
+
+    return _repeat(op)
+
+
+@benchmark("jssdk/sign")
+def _jssdk_sign():
+    client = offline_client()
+    client.generate_jssdk_signature("https://example.com/")
+    return _repeat(lambda: client.generate_jssdk_signature("https://example.com/a?b=c"))
+
+
+@benchmark("location/update_100k_users")
+def _location_update():
+    # One op is a fix of one of 100000 users, most of them coalesced.
+    store = LocationStore()
+    openids = [f"o{i:027d}" for i in range(100000)]
+    fixes = itertools.cycle(enumerate(openids))
+
+    def op():
+        i, openid = next(fixes)
+        store.update(openid, 23.0 + (i % 1000) * 1e-4, 113.0, 10.0)
+
+    return _repeat(op)
+
+
+@benchmark("location/nearby_100k_users")
+def _location_nearby():
+    store = LocationStore()
+    for i in range(100000):
+        store.update(f"o{i:027d}", 23.0 + (i % 1000) * 1e-4, 113.0 + i * 1e-6)
+    return _repeat(lambda: store.nearby(23.05, 113.05, 500))
+
+
+@benchmark("token/sync_contended_8_threads")
+def _sync_token():
+    client = offline_client()
+    client.get_access_token()
+
+    def batch(n: int):
+        per_thread = max(1, n // 8)
+
+        def worker():
+            for _ in range(per_thread):
+                client.get_access_token()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return batch
+
+
+@benchmark("token/async_contended_100_tasks")
+async def _async_token():
+    client = offline_async_client()
+    await client.get_access_token()
+
+    async def batch(n: int):
+        for i in range(0, n, 100):
+            await asyncio.gather(
+                *(client.get_access_token() for _ in range(min(100, n - i)))
+            )
+
+    return batch
+
+
+@benchmark("api/follower_sync_25k")
+async def _follower_sync():
+    # One op streams all 25000 profiles through paging and batchget.
+    client = offline_async_client(follower_api(25000))
+
+    async def batch(n: int):
+        for _ in range(n):
+            async for _ in client.iter_follower_profiles(concurrency=10):
+                pass
+
+    return batch
+
+
+def _push_requests(client, encrypted: bool):
+    # Yields (query string, body) of distinct, correctly signed text pushes.
+    factory = PushFactory(
+        client._app_token, client._encoding_aes_key, client._appid, ["text"]
+    )
+    for push in factory.pushes(1.0 if encrypted else 0.0):
+        yield push.query, push.body
+
+
+def _router_push(encrypted: bool):
+    async def setup():
+        client = offline_async_client()
+        router = MessageRouter(client)
+
+        @router.message(MessageType.TEXT)
+        async def echo(message):
+            return message.Content
+
+        requests = _push_requests(client, encrypted)
+
+        async def batch(n: int):
+            for _ in range(n):
+                query, body = next(requests)
+                await _asgi_call(router, "POST", query, body)
+
+        return batch
+
+    return setup
+
+
+benchmark("asgi/router_push")(_router_push(False))
+benchmark("asgi/router_push_encrypted")(_router_push(True))
+
+
+@benchmark("asgi/example_server_push")
+async def _example_push():
+    set_fake_environment()
+    try:
+        import httpx
+        from examples.server.main import app
+        from examples.server.wechat import wechat_client
+    except ImportError as e:
+        raise _Skip(f"example server unavailable: {e}")
+    requests = _push_requests(wechat_client, False)
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://b")
+
+    async def batch(n: int):
+        for _ in range(n):
+            query, body = next(requests)
+            response = await http.post(f"/push?{query}", content=body)
+            assert response.status_code == 200, response.text
+
+    return batch
+
+
+async def _asgi_call(app, method: str, query: str, body: bytes):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "query_string": query.encode()}
+    await app(scope, receive, send)
+    assert sent[0]["status"] == 200, sent[1]["body"]
+
+
+class _Skip(Exception):
+    pass
+
+
+def _summary(n: int, timings: List[float]) -> dict:
+    per_op = [t / n for t in timings]
+    return {
+        "ops_per_sec": n / statistics.median(timings),
+        "mean_us": statistics.mean(per_op) * 1e6,
+        "min_us": min(per_op) * 1e6,
+        "stdev_us": statistics.stdev(per_op) * 1e6 if len(per_op) > 1 else 0.0,
+        "rounds": len(timings),
+        "iterations": n,
+    }
+
+
+async def _measure(batch: Batch, seconds: float, rounds: int) -> dict:
+    async def timed(n: int) -> float:
+        started = time.perf_counter()
+        result = batch(n)
+        if asyncio.iscoroutine(result):
+            await result
+        return time.perf_counter() - started
+
+    # Grow the batch until one round takes its share of the time budget.
+    n = 1
+    while await timed(n) < seconds / rounds / 2 and n < 1 << 24:
+        n *= 2
+    return _summary(n, [await timed(n) for _ in range(rounds)])
+
+
+async def _run_one(name: str, seconds: float, rounds: int) -> dict:
+    batch = BENCHMARKS[name]()
+    if asyncio.iscoroutine(batch):
+        batch = await batch
+    return await _measure(batch, seconds, rounds)
+
+
+def run(pattern: str = "", seconds: float = 0.5, rounds: int = 5) -> dict:
+    results = {}
+    for name in BENCHMARKS:
+        if pattern not in name:
+            continue
+        try:
+            results[name] = asyncio.run(_run_one(name, seconds, rounds))
+        except _Skip as e:
+            results[name] = {"skipped": str(e)}
+    return {
+        "meta": {
+            "pywechat": _version(),
+            "revision": _revision(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "time": int(time.time()),
+        },
+        "results": results,
+    }
+
+
+def _version() -> Optional[str]:
+    try:
+        return metadata.version("pywechat")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print(report: dict, baseline: Optional[dict]):
+    previous = baseline["results"] if baseline else {}
+    for name, result in report["results"].items():
+        if "skipped" in result:
+            print(f"{name:<44} skipped: {result['skipped']}")
+            continue
+        line = f"{name:<44} {result['ops_per_sec']:12.0f} ops/s"
+        line += f" {result['mean_us']:10.2f} us"
+        old = previous.get(name, {}).get("ops_per_sec")
+        if old:
+            line += f" {result['ops_per_sec'] / old:7.2f}x"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filter", default="", help="only run matching names")
+    parser.add_argument("--time", type=float, default=0.5, help="seconds per case")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="results file of a previous run")
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report = run(args.filter, args.time, args.rounds)
+    _print(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
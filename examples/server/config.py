@@ -10,3 +10,5 @@ APPID = os.getenv("APPID")
 APPSECRET = os.getenv("APPSECRET")
 APPTOKEN = os.getenv("APPTOKEN")
 ENCODING_AES_KEY = os.getenv("ENCODING_AES_KEY")
+# Archive every push as gzipped NDJSON to this file when set.
+PUSH_ARCHIVE_PATH = os.getenv("PUSH_ARCHIVE_PATH")
@@ -1,18 +1,28 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from .config import APP_TITLE, DOCS_URL
-from .routers.push import router as push_router
+from .routers.push import push_archive, router as push_router
 from .routers.client import router as client_router
 
 
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write out pushes still buffered for the archive.
+    if push_archive is not None:
+        await push_archive.stop()
+
+
 app = FastAPI(
     title=APP_TITLE,
     docs_url=DOCS_URL,
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
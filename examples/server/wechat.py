@@ -6,7 +6,7 @@ from .config import APPID, APPSECRET, APPTOKEN, ENCODING_AES_KEY
 logger = logging.getLogger(__name__)
 
 
-logger.debug(f"Initializing Wechat Client with APPID={APPID}, {APPSECRET}, {APPTOKEN}")
+logger.debug("Initializing Wechat Client with APPID=%s", APPID)
 wechat_client = AsyncWechatClient(
     APPID, APPSECRET, APPTOKEN, ENCODING_AES_KEY, MemoryCache()
 )
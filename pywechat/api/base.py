@@ -0,0 +1,64 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Awaitable, Type, TypeVar, Union
+from ..models.api import APIResponse
+
+if TYPE_CHECKING:
+    from httpx import Response
+    from ..client import BaseWechatClient
+
+
+API_BASE_URL = "https://api.weixin.qq.com/cgi-bin"
+
+ResponseT = TypeVar("ResponseT", bound=APIResponse)
+# Methods of the API groups return the result directly on WechatClient and an
+# awaitable on AsyncWechatClient.
+Result = Union[ResponseT, Awaitable[ResponseT]]
+
+
+class WechatAPIError(Exception):
+    def __init__(self, errcode: int, errmsg: str | None = None):
+        super().__init__(f"WeChat API error {errcode}: {errmsg}")
+        self.errcode = errcode
+        self.errmsg = errmsg
+
+
+def is_json_response(response: "Response") -> bool:
+    # WeChat reports errors of file endpoints as JSON, sometimes text/plain.
+    return response.headers.get("content-type", "").startswith(
+        ("application/json", "text/plain")
+    )
+
+
+def parse_response(response: "Response", model: Type[ResponseT]) -> ResponseT:
+    data = response.json()
+    errcode = data.get("errcode", 0)
+    if errcode != 0:
+        raise WechatAPIError(errcode, data.get("errmsg"))
+    return model.model_validate(data)
+
+
+class BaseAPI:
+    # One group of endpoints bound to a client. Calls go through the client's
+    # request(), which injects the access token and handles retries.
+    def __init__(self, client: "BaseWechatClient"):
+        self._client = client
+        self._is_async = asyncio.iscoroutinefunction(client.request)
+
+    def _call(
+        self,
+        method: str,
+        path: str,
+        model: Type[ResponseT] = APIResponse,
+        **kwargs: Any,
+    ) -> Result[ResponseT]:
+        if self._is_async:
+            return self._acall(method, path, model, **kwargs)
+        return parse_response(
+            self._client.request(method, API_BASE_URL + path, **kwargs), model
+        )
+
+    async def _acall(
+        self, method: str, path: str, model: Type[ResponseT], **kwargs: Any
+    ) -> ResponseT:
+        response = await self._client.request(method, API_BASE_URL + path, **kwargs)
+        return parse_response(response, model)
@@ -0,0 +1,30 @@
+from typing import Any, Dict
+from ..models.api import APIResponse
+from .base import BaseAPI, Result
+
+
+class CustomMessageAPI(BaseAPI):
+    # Customer-service messages, allowed within 48 hours of the user's last
+    # interaction.
+    def send(self, body: Dict[str, Any]) -> Result[APIResponse]:
+        return self._call("POST", "/message/custom/send", json=body)
+
+    def send_text(self, openid: str, content: str) -> Result[APIResponse]:
+        return self.send(
+            {"touser": openid, "msgtype": "text", "text": {"content": content}}
+        )
+
+    def send_image(self, openid: str, media_id: str) -> Result[APIResponse]:
+        return self.send(
+            {"touser": openid, "msgtype": "image", "image": {"media_id": media_id}}
+        )
+
+    def send_voice(self, openid: str, media_id: str) -> Result[APIResponse]:
+        return self.send(
+            {"touser": openid, "msgtype": "voice", "voice": {"media_id": media_id}}
+        )
+
+    def typing(self, openid: str, typing: bool = True) -> Result[APIResponse]:
+        command = "Typing" if typing else "CancelTyping"
+        body = {"touser": openid, "command": command}
+        return self._call("POST", "/message/custom/typing", json=body)
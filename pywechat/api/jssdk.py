@@ -0,0 +1,138 @@
+import hashlib
+import secrets
+import time
+from dataclasses import dataclass
+from functools import partial
+import logging
+from typing import Any, Dict, Optional, Tuple
+from ..client import BaseWechatClient, CachedCredential, TokenRefreshStats
+from ..models.api import JSSDKSignature, Ticket
+from .base import BaseAPI, Result
+
+
+logger = logging.getLogger(__name__)
+
+JSAPI_TICKET = "jsapi"
+# api_ticket of the card JS-SDK (wx.addCard, wx.chooseCard).
+WX_CARD_TICKET = "wx_card"
+
+# (ticket, expire time, sha1 state of the signature prefix), replaced as a
+# whole so concurrent readers never see parts of two tickets.
+_Current = Tuple[str, Optional[float], Any]
+
+
+@dataclass
+class _TicketState:
+    credential: CachedCredential
+    current: Optional[_Current] = None
+
+
+class JSSDKAPI(BaseAPI):
+    # Tickets from ticket/getticket, cached like the access token: stored in
+    # the client's cache under a lease so one process fetches for all, and
+    # renewed TOKEN_REFRESH_MARGIN before they expire by a single fetch.
+    # The current ticket is also kept in memory together with the hashing
+    # state of "jsapi_ticket=...&noncestr=", so signing a page only hashes
+    # the nonce, timestamp and url, without touching the cache or network.
+    def __init__(self, client: BaseWechatClient):
+        super().__init__(client)
+        self._states: Dict[str, _TicketState] = {}
+        self.stats = TokenRefreshStats()
+
+    def get_ticket(self, ticket_type: str = JSAPI_TICKET) -> Result[str]:
+        if self._is_async:
+            return self._aget_ticket(ticket_type)
+        return self._current(ticket_type)[0]
+
+    def sign(
+        self,
+        url: str,
+        noncestr: Optional[str] = None,
+        timestamp: Optional[int] = None,
+    ) -> Result[JSSDKSignature]:
+        # wx.config() arguments for the page at url, the part after # is
+        # not signed.
+        if self._is_async:
+            return self._asign(url, noncestr, timestamp)
+        return self._sign(self._current(JSAPI_TICKET), url, noncestr, timestamp)
+
+    async def _asign(
+        self, url: str, noncestr: Optional[str], timestamp: Optional[int]
+    ) -> JSSDKSignature:
+        current = await self._acurrent(JSAPI_TICKET)
+        return self._sign(current, url, noncestr, timestamp)
+
+    def _sign(
+        self,
+        current: _Current,
+        url: str,
+        noncestr: Optional[str],
+        timestamp: Optional[int],
+    ) -> JSSDKSignature:
+        noncestr = noncestr or secrets.token_hex(8)
+        timestamp = timestamp or int(time.time())
+        sha1 = current[2].copy()
+        sha1.update(
+            f"{noncestr}&timestamp={timestamp}&url={url.split('#')[0]}".encode()
+        )
+        return JSSDKSignature(
+            appId=self._client._appid,
+            timestamp=timestamp,
+            nonceStr=noncestr,
+            signature=sha1.hexdigest(),
+        )
+
+    def _state(self, ticket_type: str) -> _TicketState:
+        state = self._states.get(ticket_type)
+        if state is None:
+            appid = self._client._appid
+            fetch = self._afetch if self._is_async else self._fetch
+            credential = CachedCredential(
+                self._client._cache,
+                f"{appid}:ticket:{ticket_type}",
+                f"{appid}:ticket_lease:{ticket_type}",
+                partial(fetch, ticket_type),
+                self.stats,
+                f"{ticket_type} ticket",
+            )
+            state = self._states.setdefault(ticket_type, _TicketState(credential))
+        return state
+
+    def _remember(
+        self, state: _TicketState, ticket: str, expire_time: Optional[float]
+    ) -> _Current:
+        if state.current is None or state.current[0] != ticket:
+            prefix = hashlib.sha1(f"jsapi_ticket={ticket}&noncestr=".encode())
+            state.current = (ticket, expire_time, prefix)
+        elif state.current[1] != expire_time:
+            state.current = (ticket, expire_time, state.current[2])
+        return state.current
+
+    def _current(self, ticket_type: str) -> _Current:
+        state = self._state(ticket_type)
+        current = state.current
+        if current is not None and CachedCredential.is_fresh(*current[:2]):
+            return current
+        return self._remember(state, *state.credential.get())
+
+    def _fetch(self, ticket_type: str) -> Tuple[str, int]:
+        result = self._call(
+            "GET", "/ticket/getticket", Ticket, params={"type": ticket_type}
+        )
+        return result.ticket, result.expires_in
+
+    async def _aget_ticket(self, ticket_type: str) -> str:
+        return (await self._acurrent(ticket_type))[0]
+
+    async def _acurrent(self, ticket_type: str) -> _Current:
+        state = self._state(ticket_type)
+        current = state.current
+        if current is not None and CachedCredential.is_fresh(*current[:2]):
+            return current
+        return self._remember(state, *await state.credential.aget())
+
+    async def _afetch(self, ticket_type: str) -> Tuple[str, int]:
+        result = await self._call(
+            "GET", "/ticket/getticket", Ticket, params={"type": ticket_type}
+        )
+        return result.ticket, result.expires_in
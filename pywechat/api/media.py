@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import secrets
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    AsyncIterable,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    Optional,
+    Union,
+)
+from ..cache import BaseCache
+from ..models.api import MediaUpload
+from .base import (
+    API_BASE_URL,
+    BaseAPI,
+    Result,
+    WechatAPIError,
+    is_json_response,
+    parse_response,
+)
+
+if TYPE_CHECKING:
+    from httpx import Response
+    from ..client import BaseWechatClient
+
+
+CHUNK_SIZE = 64 * 1024
+# Temporary media expire after 3 days, cached ids are dropped an hour early.
+TEMPORARY_MEDIA_TTL = 3 * 24 * 3600
+MEDIA_CACHE_MARGIN = 3600
+
+# A path, bytes, a binary file object or an (async) iterable of chunks.
+MediaSource = Union[
+    str, os.PathLike, bytes, IO[bytes], Iterable[bytes], AsyncIterable[bytes]
+]
+Destination = Union[str, os.PathLike, IO[bytes]]
+
+
+class _MultipartStream:
+    # multipart/form-data body with the single "media" field WeChat expects,
+    # produced chunk by chunk. Paths, bytes and seekable files can be
+    # iterated again, so the client may replay the upload after a token
+    # error. Other sources can be sent once, a replay raises instead of
+    # silently sending an empty file.
+    def __init__(self, source: MediaSource, filename: str, content_type: Optional[str]):
+        boundary = secrets.token_hex(16)
+        content_type = (
+            content_type
+            or mimetypes.guess_type(filename)[0]
+            or "application/octet-stream"
+        )
+        self._source = source
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="media"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{boundary}--\r\n".encode()
+        self._start = source.tell() if _is_seekable(source) else None
+        self._replayable = (
+            _is_path(source) or isinstance(source, bytes) or self._start is not None
+        )
+        self._sent = False
+        self.headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        size = _source_size(source)
+        if size is not None:
+            self.headers["Content-Length"] = str(
+                len(self._head) + size + len(self._tail)
+            )
+
+    def __iter__(self) -> Iterator[bytes]:
+        self._check_replay()
+        yield self._head
+        yield from _iter_source(self._source, self._start)
+        yield self._tail
+
+    def _check_replay(self):
+        if self._sent and not self._replayable:
+            raise Exception(
+                "Cannot send an upload from an iterator twice, "
+                "pass a path, bytes or a seekable file to allow retries"
+            )
+        self._sent = True
+
+
+class _AsyncMultipartStream(_MultipartStream):
+    # httpx picks the sync or async body by the iteration protocol offered,
+    # so the async variant must not look iterable.
+    __iter__ = None
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self._check_replay()
+        yield self._head
+        if hasattr(self._source, "__aiter__"):
+            async for chunk in self._source:
+                yield chunk
+        elif _is_path(self._source) or hasattr(self._source, "read"):
+            # File reads can block on slow disks, they run on a worker thread.
+            chunks = _iter_source(self._source, self._start)
+            try:
+                while chunk := await asyncio.to_thread(next, chunks, b""):
+                    yield chunk
+            finally:
+                chunks.close()
+        else:
+            for chunk in _iter_source(self._source, self._start):
+                yield chunk
+        yield self._tail
+
+
+def _is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _is_seekable(source) -> bool:
+    return hasattr(source, "read") and hasattr(source, "seek") and source.seekable()
+
+
+def _source_size(source) -> Optional[int]:
+    if _is_path(source):
+        return os.path.getsize(source)
+    if isinstance(source, bytes):
+        return len(source)
+    if _is_seekable(source):
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+        return size
+    return None
+
+
+def _iter_source(source, start: Optional[int] = None) -> Iterator[bytes]:
+    if _is_path(source):
+        with open(source, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+    elif isinstance(source, bytes):
+        for i in range(0, len(source), CHUNK_SIZE):
+            yield source[i : i + CHUNK_SIZE]
+    elif hasattr(source, "read"):
+        if start is not None:
+            source.seek(start)
+        while chunk := source.read(CHUNK_SIZE):
+            yield chunk
+    else:
+        yield from source
+
+
+def content_hash(source: MediaSource) -> Optional[str]:
+    # sha256 of a path, bytes or seekable file, read in chunks. None for
+    # one-shot iterables, which cannot be read twice.
+    if not (_is_path(source) or isinstance(source, bytes) or _is_seekable(source)):
+        return None
+    start = source.tell() if _is_seekable(source) else None
+    sha256 = hashlib.sha256()
+    for chunk in _iter_source(source, start):
+        sha256.update(chunk)
+    if start is not None:
+        source.seek(start)
+    return sha256.hexdigest()
+
+
+class MediaAPI(BaseAPI):
+    # Temporary media. Uploads and downloads stream in CHUNK_SIZE pieces, so
+    # memory use does not grow with the file. Uploaded ids are cached by
+    # content hash for as long as WeChat keeps the media, re-sending the
+    # same file skips the upload. The ids live in the client's cache unless
+    # another is passed; they only survive a restart with a persistent one
+    # such as SQLiteCache or RedisCache, the default MemoryCache loses them.
+    def __init__(self, client: "BaseWechatClient", cache: Optional[BaseCache] = None):
+        super().__init__(client)
+        self._cache = cache if cache is not None else client._cache
+
+    def upload(
+        self,
+        media_type: str,
+        source: MediaSource,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+        use_cache: bool = True,
+    ) -> Result[MediaUpload]:
+        # media_type is one of image, voice, video, thumb.
+        if filename is None:
+            filename = os.path.basename(source) if _is_path(source) else media_type
+        if self._is_async:
+            return self._aupload(media_type, source, filename, content_type, use_cache)
+        key = self._cache_key(media_type, content_hash(source)) if use_cache else None
+        if key is not None:
+            cached = _decode(*self._cache.get(key))
+            if cached is not None:
+                return cached
+        stream = _MultipartStream(source, filename, content_type)
+        result = parse_response(
+            self._client.request(
+                "POST",
+                f"{API_BASE_URL}/media/upload",
+                params={"type": media_type},
+                content=stream,
+                headers=stream.headers,
+            ),
+            MediaUpload,
+        )
+        if key is not None:
+            self._cache.set(key, result.model_dump_json(), ex=_ttl(result))
+        return result
+
+    async def _aupload(
+        self,
+        media_type: str,
+        source: MediaSource,
+        filename: str,
+        content_type: Optional[str],
+        use_cache: bool,
+    ) -> MediaUpload:
+        key = None
+        if use_cache:
+            digest = await asyncio.to_thread(content_hash, source)
+            key = self._cache_key(media_type, digest)
+        if key is not None:
+            cached = _decode(*await self._cache.aget(key))
+            if cached is not None:
+                return cached
+        stream = _AsyncMultipartStream(source, filename, content_type)
+        response = await self._client.request(
+            "POST",
+            f"{API_BASE_URL}/media/upload",
+            params={"type": media_type},
+            content=stream,
+            headers=stream.headers,
+        )
+        result = parse_response(response, MediaUpload)
+        if key is not None:
+            await self._cache.aset(key, result.model_dump_json(), ex=_ttl(result))
+        return result
+
+    def download(self, media_id: str) -> Result[bytes]:
+        # Whole file in memory, use download_to for large media.
+        url = f"{API_BASE_URL}/media/get"
+        params = {"media_id": media_id}
+        if self._is_async:
+            return self._adownload(url, params)
+        return _media_content(self._client.request("GET", url, params=params))
+
+    async def _adownload(self, url: str, params: dict) -> bytes:
+        return _media_content(await self._client.request("GET", url, params=params))
+
+    def download_to(
+        self, media_id: str, destination: Destination, chunk_size: int = CHUNK_SIZE
+    ) -> Result[int]:
+        # Streams the media into a path or binary file, returns bytes written.
+        url = f"{API_BASE_URL}/media/get"
+        params = {"media_id": media_id}
+        if self._is_async:
+            return self._adownload_to(url, params, destination, chunk_size)
+        with self._client.stream("GET", url, params=params) as response:
+            if is_json_response(response):
+                response.read()
+                _check_media_response(response)
+            with _open_destination(destination) as f:
+                written = 0
+                for chunk in response.iter_bytes(chunk_size):
+                    written += f.write(chunk)
+        return written
+
+    async def _adownload_to(
+        self, url: str, params: dict, destination: Destination, chunk_size: int
+    ) -> int:
+        async with self._client.stream("GET", url, params=params) as response:
+            if is_json_response(response):
+                await response.aread()
+                _check_media_response(response)
+            async with _aopen_destination(destination) as f:
+                written = 0
+                async for chunk in response.aiter_bytes(chunk_size):
+                    written += await asyncio.to_thread(f.write, chunk)
+        return written
+
+    def _cache_key(self, media_type: str, digest: Optional[str]) -> Optional[str]:
+        if digest is None:
+            return None
+        return f"{self._client._appid}:media:{media_type}:{digest}"
+
+
+def _ttl(result: MediaUpload) -> int:
+    expires = result.created_at + TEMPORARY_MEDIA_TTL - MEDIA_CACHE_MARGIN
+    return max(1, int(expires - time.time()))
+
+
+def _decode(value: Optional[str], _) -> Optional[MediaUpload]:
+    return MediaUpload.model_validate_json(value) if value is not None else None
+
+
+@contextmanager
+def _open_destination(destination: Destination) -> Iterator[IO[bytes]]:
+    # Paths are opened for writing, file objects are used as they are and
+    # left open.
+    if _is_path(destination):
+        with open(destination, "wb") as f:
+            yield f
+    else:
+        yield destination
+
+
+@asynccontextmanager
+async def _aopen_destination(destination: Destination) -> AsyncIterator[IO[bytes]]:
+    # _open_destination with the blocking open and close on a worker thread.
+    if not _is_path(destination):
+        yield destination
+        return
+    f = await asyncio.to_thread(open, destination, "wb")
+    try:
+        yield f
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _check_media_response(response: "Response"):
+    # Errors come back as JSON instead of the file.
+    if is_json_response(response):
+        data = response.json()
+        if data.get("errcode", 0) != 0:
+            raise WechatAPIError(data["errcode"], data.get("errmsg"))
+
+
+def _media_content(response: "Response") -> bytes:
+    _check_media_response(response)
+    return response.content
@@ -0,0 +1,15 @@
+from typing import Any, Dict
+from ..models.api import APIResponse, MenuInfo
+from .base import BaseAPI, Result
+
+
+class MenuAPI(BaseAPI):
+    def create(self, menu: Dict[str, Any]) -> Result[APIResponse]:
+        # menu is the documented body, e.g. {"button": [{"type": "click", ...}]}
+        return self._call("POST", "/menu/create", json=menu)
+
+    def get(self) -> Result[MenuInfo]:
+        return self._call("GET", "/menu/get", MenuInfo)
+
+    def delete(self) -> Result[APIResponse]:
+        return self._call("GET", "/menu/delete")
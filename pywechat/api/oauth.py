@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Type
+from urllib.parse import urlencode
+from ..models.api import OAuthAccessToken, OAuthUserInfo
+from ..oauth import OAuthToken, OAuthTokenStore
+from .base import BaseAPI, ResponseT, WechatAPIError, parse_response
+
+if TYPE_CHECKING:
+    from ..client import BaseWechatClient
+
+
+logger = logging.getLogger(__name__)
+
+SNS_BASE_URL = "https://api.weixin.qq.com/sns"
+AUTHORIZE_URL = "https://open.weixin.qq.com/connect/oauth2/authorize"
+# Web access tokens live 2 hours, refresh tokens 30 days.
+REFRESH_TOKEN_TTL = 30 * 24 * 3600
+# A token this close to expiry is refreshed before it is handed out.
+OAUTH_TOKEN_MARGIN = 60
+BULK_REFRESH_AHEAD = 600
+BULK_REFRESH_CONCURRENCY = 10
+# refresh_token invalid (40030) or expired (42002): the user has to
+# authorize again.
+INVALID_REFRESH_ERRCODES = frozenset([40030, 42002])
+
+
+@dataclass
+class OAuthRefreshStats:
+    refreshes: int = 0
+    # Callers that reused a refresh of the same user already in flight.
+    coalesced_waiters: int = 0
+    # Users whose refresh token was rejected and who were removed.
+    revoked: int = 0
+    failed: int = 0
+
+
+class OAuthAPI(BaseAPI):
+    # Web page authorization (sns/oauth2). Tokens are per user and kept in an
+    # OAuthTokenStore, not the client's cache. An expired token is refreshed
+    # when it is next used, once per user however many requests need it,
+    # and refresh_expiring() renews tokens ahead of time in bulk.
+    #
+    # These endpoints authenticate with the app secret or the user's token,
+    # so calls skip the client's access token handling.
+    def __init__(
+        self, client: "BaseWechatClient", store: Optional[OAuthTokenStore] = None
+    ):
+        super().__init__(client)
+        if not self._is_async:
+            raise Exception("OAuthAPI requires an AsyncWechatClient")
+        self.store = store if store is not None else OAuthTokenStore()
+        self._refreshing: Dict[str, asyncio.Future] = {}
+        self.stats = OAuthRefreshStats()
+
+    def authorize_url(
+        self, redirect_uri: str, scope: str = "snsapi_base", state: str = ""
+    ) -> str:
+        # snsapi_base only yields the openid, snsapi_userinfo also allows
+        # userinfo() after the user agreed.
+        query = urlencode(
+            {
+                "appid": self._client._appid,
+                "redirect_uri": redirect_uri,
+                "response_type": "code",
+                "scope": scope,
+                "state": state,
+            }
+        )
+        return f"{AUTHORIZE_URL}?{query}#wechat_redirect"
+
+    async def exchange_code(self, code: str) -> OAuthToken:
+        # The code from the authorization redirect, valid once for 5 minutes.
+        params = {
+            "appid": self._client._appid,
+            "secret": self._client._app_secret,
+            "code": code,
+            "grant_type": "authorization_code",
+        }
+        result = await self._sns("/oauth2/access_token", params, OAuthAccessToken)
+        now = time.time()
+        token = OAuthToken(
+            result.openid,
+            result.access_token,
+            result.refresh_token,
+            now + result.expires_in,
+            now + REFRESH_TOKEN_TTL,
+            result.scope,
+            result.unionid,
+        )
+        await self.store.aput(token)
+        return token
+
+    async def get_token(self, openid: str) -> Optional[OAuthToken]:
+        # None when the user never authorized or has to authorize again.
+        token = await self.store.aget(openid)
+        if token is None or not token.expires_within(OAUTH_TOKEN_MARGIN):
+            return token
+        return await self.refresh(openid)
+
+    async def refresh(self, openid: str) -> Optional[OAuthToken]:
+        future = self._refreshing.get(openid)
+        if future is not None:
+            self.stats.coalesced_waiters += 1
+        else:
+            future = asyncio.ensure_future(self._refresh(openid))
+            self._refreshing[openid] = future
+            future.add_done_callback(lambda _: self._refreshing.pop(openid, None))
+        return await asyncio.shield(future)
+
+    async def userinfo(self, openid: str, lang: str = "zh_CN") -> OAuthUserInfo:
+        token = await self.get_token(openid)
+        if token is None:
+            raise Exception(f"No OAuth token for {openid}")
+        params = {"access_token": token.access_token, "openid": openid, "lang": lang}
+        return await self._sns("/userinfo", params, OAuthUserInfo)
+
+    async def refresh_expiring(
+        self,
+        within: float = BULK_REFRESH_AHEAD,
+        concurrency: int = BULK_REFRESH_CONCURRENCY,
+    ) -> int:
+        # Refreshes every token expiring within `within` seconds with
+        # `concurrency` workers, returns how many were renewed. Openids are
+        # streamed from the store, so memory stays flat for any number of
+        # users. Run it periodically so users rarely wait for a refresh.
+        iterator = self.store.aexpiring(within)
+        lock = asyncio.Lock()
+        renewed = 0
+
+        async def worker():
+            nonlocal renewed
+            while True:
+                async with lock:
+                    try:
+                        openid = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                try:
+                    if await self.refresh(openid) is not None:
+                        renewed += 1
+                except Exception as e:
+                    self.stats.failed += 1
+                    logger.warning(f"Failed to refresh OAuth token of {openid}: {e}")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            await iterator.aclose()
+        return renewed
+
+    async def _refresh(self, openid: str) -> Optional[OAuthToken]:
+        token = await self.store.aget(openid)
+        if token is None:
+            return None
+        if not token.refreshable():
+            await self._revoke(openid)
+            return None
+        params = {
+            "appid": self._client._appid,
+            "grant_type": "refresh_token",
+            "refresh_token": token.refresh_token,
+        }
+        try:
+            result = await self._sns("/oauth2/refresh_token", params, OAuthAccessToken)
+        except WechatAPIError as e:
+            if e.errcode not in INVALID_REFRESH_ERRCODES:
+                raise
+            await self._revoke(openid)
+            return None
+        self.stats.refreshes += 1
+        refreshed = OAuthToken(
+            openid,
+            result.access_token,
+            result.refresh_token,
+            time.time() + result.expires_in,
+            token.refresh_expires_at,
+            result.scope or token.scope,
+            result.unionid or token.unionid,
+        )
+        await self.store.aput(refreshed)
+        return refreshed
+
+    async def _revoke(self, openid: str):
+        self.stats.revoked += 1
+        await self.store.adelete(openid)
+
+    async def _sns(self, path: str, params: dict, model: Type[ResponseT]) -> ResponseT:
+        client = self._client
+        url = SNS_BASE_URL + path
+        started = time.perf_counter() if client.metrics.enabled else 0.0
+        response = await client._request_client.get(url, params=params)
+        if client.metrics.enabled:
+            client._record_request(url, started, response)
+        return parse_response(response, model)
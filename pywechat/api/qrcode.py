@@ -0,0 +1,33 @@
+from typing import Optional, Union
+from urllib.parse import quote
+from ..models.api import QRCodeTicket
+from .base import BaseAPI, Result
+
+
+SHOW_QRCODE_URL = "https://mp.weixin.qq.com/cgi-bin/showqrcode"
+# Temporary QR codes live at most 30 days.
+MAX_EXPIRE_SECONDS = 2592000
+
+
+class QRCodeAPI(BaseAPI):
+    def create(
+        self, scene: Union[int, str], expire_seconds: Optional[int] = None
+    ) -> Result[QRCodeTicket]:
+        # Temporary when expire_seconds is given, permanent otherwise. Integer
+        # scenes become scene_id, strings scene_str.
+        temporary = expire_seconds is not None
+        if isinstance(scene, int):
+            action = "QR_SCENE" if temporary else "QR_LIMIT_SCENE"
+            scene_info = {"scene_id": scene}
+        else:
+            action = "QR_STR_SCENE" if temporary else "QR_LIMIT_STR_SCENE"
+            scene_info = {"scene_str": scene}
+        body = {"action_name": action, "action_info": {"scene": scene_info}}
+        if temporary:
+            body["expire_seconds"] = min(expire_seconds, MAX_EXPIRE_SECONDS)
+        return self._call("POST", "/qrcode/create", QRCodeTicket, json=body)
+
+    @staticmethod
+    def image_url(ticket: str) -> str:
+        # The image is public, no access token needed.
+        return f"{SHOW_QRCODE_URL}?ticket={quote(ticket)}"
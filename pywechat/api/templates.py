@@ -0,0 +1,38 @@
+from typing import Any, Dict, Optional
+from ..models.api import APIResponse, TemplateList, TemplateSendResult
+from .base import BaseAPI, Result
+
+
+class TemplateAPI(BaseAPI):
+    def send(
+        self,
+        openid: str,
+        template_id: str,
+        data: Dict[str, Any],
+        url: Optional[str] = None,
+        miniprogram: Optional[Dict[str, str]] = None,
+    ) -> Result[TemplateSendResult]:
+        # data maps keywords to values, plain strings are wrapped as
+        # {"value": ...}.
+        body: Dict[str, Any] = {
+            "touser": openid,
+            "template_id": template_id,
+            "data": {
+                key: value if isinstance(value, dict) else {"value": value}
+                for key, value in data.items()
+            },
+        }
+        if url is not None:
+            body["url"] = url
+        if miniprogram is not None:
+            body["miniprogram"] = miniprogram
+        return self._call(
+            "POST", "/message/template/send", TemplateSendResult, json=body
+        )
+
+    def list(self) -> Result[TemplateList]:
+        return self._call("GET", "/template/get_all_private_template", TemplateList)
+
+    def delete(self, template_id: str) -> Result[APIResponse]:
+        body = {"template_id": template_id}
+        return self._call("POST", "/template/del_private_template", json=body)
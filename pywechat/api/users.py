@@ -0,0 +1,120 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Sequence
+from ..models.api import APIResponse, FollowerList, UserInfo, UserInfoList
+from .base import BaseAPI, Result
+
+
+# user/info/batchget accepts at most 100 openids per call.
+BATCHGET_SIZE = 100
+BATCHGET_CONCURRENCY = 5
+# user/get returns at most 10000 openids per page.
+FOLLOWERS_PAGE_SIZE = 10000
+
+
+class UserAPI(BaseAPI):
+    def followers(self, next_openid: Optional[str] = None) -> Result[FollowerList]:
+        # One page of up to 10000 openids, pass next_openid for the next one.
+        params = {"next_openid": next_openid} if next_openid else {}
+        return self._call("GET", "/user/get", FollowerList, params=params)
+
+    def info(self, openid: str, lang: str = "zh_CN") -> Result[UserInfo]:
+        params = {"openid": openid, "lang": lang}
+        return self._call("GET", "/user/info", UserInfo, params=params)
+
+    def batchget(
+        self,
+        openids: Sequence[str],
+        lang: str = "zh_CN",
+        concurrency: int = BATCHGET_CONCURRENCY,
+    ) -> Result[List[UserInfo]]:
+        # Any number of openids, split into chunks of 100 fetched in parallel.
+        # Profiles are returned in the order of openids.
+        chunks = [
+            openids[i : i + BATCHGET_SIZE]
+            for i in range(0, len(openids), BATCHGET_SIZE)
+        ]
+        if self._is_async:
+            return self._abatchget(chunks, lang, concurrency)
+        if len(chunks) <= 1:
+            results = [self._batchget_chunk(chunk, lang) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(min(concurrency, len(chunks))) as executor:
+                results = executor.map(lambda c: self._batchget_chunk(c, lang), chunks)
+        return [user for result in results for user in result.user_info_list]
+
+    async def _abatchget(
+        self, chunks: List[Sequence[str]], lang: str, concurrency: int
+    ) -> List[UserInfo]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(chunk: Sequence[str]) -> UserInfoList:
+            async with semaphore:
+                return await self._batchget_chunk(chunk, lang)
+
+        results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        return [user for result in results for user in result.user_info_list]
+
+    def _batchget_chunk(
+        self, openids: Sequence[str], lang: str
+    ) -> Result[UserInfoList]:
+        body = {"user_list": [{"openid": openid, "lang": lang} for openid in openids]}
+        return self._call("POST", "/user/info/batchget", UserInfoList, json=body)
+
+    def update_remark(self, openid: str, remark: str) -> Result[APIResponse]:
+        body = {"openid": openid, "remark": remark}
+        return self._call("POST", "/user/info/updateremark", json=body)
+
+    async def iter_profiles(
+        self,
+        lang: str = "zh_CN",
+        concurrency: int = BATCHGET_CONCURRENCY,
+        checkpoint_key: Optional[str] = None,
+    ) -> AsyncIterator[UserInfo]:
+        # Streams the profiles of all followers. The next page of openids is
+        # fetched while the current one is enriched by up to `concurrency`
+        # batchget calls, and profiles are yielded as their chunk completes,
+        # so only about one page is held in memory.
+        #
+        # With checkpoint_key the position is stored in the client's cache
+        # after every page, and a later call resumes from there. Profiles of
+        # a page interrupted halfway are yielded again on resume. The
+        # checkpoint is removed once the whole list has been streamed.
+        if not self._is_async:
+            raise Exception("iter_profiles requires an AsyncWechatClient")
+        cache = self._client._cache
+        next_openid = None
+        if checkpoint_key is not None:
+            next_openid, _ = await cache.aget(checkpoint_key)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(chunk: Sequence[str]) -> UserInfoList:
+            async with semaphore:
+                return await self._batchget_chunk(chunk, lang)
+
+        page_task = asyncio.ensure_future(self.followers(next_openid))
+        tasks: List[asyncio.Future] = []
+        try:
+            while page_task is not None:
+                page = await page_task
+                page_task = None
+                openids = page.openids
+                if page.next_openid and len(openids) >= FOLLOWERS_PAGE_SIZE:
+                    page_task = asyncio.ensure_future(self.followers(page.next_openid))
+                tasks = [
+                    asyncio.ensure_future(fetch(openids[i : i + BATCHGET_SIZE]))
+                    for i in range(0, len(openids), BATCHGET_SIZE)
+                ]
+                for task in asyncio.as_completed(tasks):
+                    for user in (await task).user_info_list:
+                        yield user
+                if checkpoint_key is not None:
+                    if page_task is not None:
+                        await cache.aset(checkpoint_key, page.next_openid)
+                    else:
+                        await cache.adelete(checkpoint_key)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if page_task is not None:
+                page_task.cancel()
@@ -1,41 +1,184 @@
+import asyncio
+import heapq
 import logging
+import secrets
+import sqlite3
+import threading
 import time
-from typing import Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
 
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class LeaseStats:
+    # Leases this cache instance obtained.
+    acquired: int = 0
+    # Attempts that found the lease held by another owner.
+    contended: int = 0
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Live entries dropped to stay within max_size.
+    evictions: int = 0
+    # Entries removed because their TTL passed.
+    expirations: int = 0
+
+
 class BaseCache:
+    # Backends implement the sync methods. The async ones default to running
+    # them on a worker thread so that backends doing real I/O never block the
+    # event loop; backends with native async clients override them.
+    # Per-instance state is created on first use, so subclasses that do not
+    # call super().__init__() still work.
+    @cached_property
+    def _owner(self) -> str:
+        # Identifies this instance as a lease owner across processes.
+        return secrets.token_hex(8)
+
+    @cached_property
+    def lease_stats(self) -> LeaseStats:
+        return LeaseStats()
+
+    @cached_property
+    def stats(self) -> CacheStats:
+        return CacheStats()
+
     def get(self, key: str) -> Tuple[Optional[str], Optional[int]]:
         raise NotImplementedError
 
     def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
         raise NotImplementedError
 
+    def delete(self, key: str) -> bool:
+        # Backends without a delete overwrite the key with an entry that
+        # expired a second ago, which readers treat as missing.
+        return self.set(key, "", ex=-1)
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, mapping: Mapping[str, str], ex: Optional[int] = None) -> bool:
+        return all([self.set(key, value, ex) for key, value in mapping.items()])
+
     async def aget(self, key: str) -> Tuple[Optional[str], Optional[int]]:
-        raise NotImplementedError
+        return await asyncio.to_thread(self.get, key)
 
     async def aset(self, key: str, value: str, ex: Optional[int] = None) -> bool:
-        raise NotImplementedError
+        return await asyncio.to_thread(self.set, key, value, ex)
+
+    async def adelete(self, key: str) -> bool:
+        return await asyncio.to_thread(self.delete, key)
+
+    async def aget_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        return await asyncio.to_thread(self.get_many, list(keys))
+
+    async def aset_many(
+        self, mapping: Mapping[str, str], ex: Optional[int] = None
+    ) -> bool:
+        return await asyncio.to_thread(self.set_many, dict(mapping), ex)
+
+    # Refresh leases make sure only one process fetches a shared value such as
+    # the access token. A lease is held by at most one caller at a time, even
+    # one sharing this instance. Caches that are not shared between processes
+    # keep their leases in memory.
+    @cached_property
+    def _leases(self) -> Dict[str, float]:
+        return {}
+
+    @cached_property
+    def _lease_lock(self) -> threading.Lock:
+        return threading.Lock()
+
+    def acquire_lease(self, key: str, ttl: int) -> bool:
+        now = time.time()
+        with self._lease_lock:
+            for held, expiry in list(self._leases.items()):
+                if expiry < now:
+                    del self._leases[held]
+            acquired = key not in self._leases
+            if acquired:
+                self._leases[key] = now + ttl
+        return self._record_lease(acquired)
+
+    def release_lease(self, key: str) -> bool:
+        with self._lease_lock:
+            return self._leases.pop(key, None) is not None
+
+    async def aacquire_lease(self, key: str, ttl: int) -> bool:
+        return self.acquire_lease(key, ttl)
+
+    async def arelease_lease(self, key: str) -> bool:
+        return self.release_lease(key)
+
+    def _record_lease(self, acquired: bool) -> bool:
+        if acquired:
+            self.lease_stats.acquired += 1
+        else:
+            self.lease_stats.contended += 1
+        return acquired
+
+    def _record_get(
+        self, entry: Tuple[Optional[str], Optional[int]]
+    ) -> Tuple[Optional[str], Optional[int]]:
+        if entry[0] is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return entry
 
 
 class MemoryCache(BaseCache):
-    def __init__(self):
-        self._cache: dict[str, str] = {}
-        self._expiry: dict[str, int] = {}
+    # Bounded LRU cache. Expired entries are removed on lookup, before any
+    # live entry is evicted and by the optional background sweeper.
+    def __init__(self, max_size: Optional[int] = 10000):
+        super().__init__()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, Tuple[str, Optional[float]]] = OrderedDict()
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._cache)
 
     def get(self, key: str) -> Tuple[Optional[str], Optional[int]]:
-        if key in self._expiry and self._expiry[key] < time.time():
-            del self._cache[key]
-            del self._expiry[key]
-            return None, None
-        return self._cache.get(key), self._expiry.get(key)
+        with self._lock:
+            return self._get(key, time.time())
 
     def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
-        self._cache[key] = value
-        if ex is not None:
-            self._expiry[key] = time.time() + ex
+        with self._lock:
+            self._set(key, value, ex, time.time())
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._cache.pop(key, None) is not None
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        now = time.time()
+        with self._lock:
+            return {key: self._get(key, now) for key in keys}
+
+    def set_many(self, mapping: Mapping[str, str], ex: Optional[int] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            for key, value in mapping.items():
+                self._set(key, value, ex, now)
         return True
 
     async def aget(self, key: str) -> Tuple[Optional[str], Optional[int]]:
@@ -43,3 +186,335 @@ class MemoryCache(BaseCache):
 
     async def aset(self, key: str, value: str, ex: Optional[int] = None) -> bool:
         return self.set(key, value, ex)
+
+    async def adelete(self, key: str) -> bool:
+        return self.delete(key)
+
+    async def aget_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        return self.get_many(keys)
+
+    async def aset_many(
+        self, mapping: Mapping[str, str], ex: Optional[int] = None
+    ) -> bool:
+        return self.set_many(mapping, ex)
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep(time.time())
+
+    def start_sweeper(self, interval: float = 60) -> threading.Thread:
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper_stop.clear()
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop,
+                args=(interval,),
+                name="pywechat-cache-sweeper",
+                daemon=True,
+            )
+            self._sweeper.start()
+        return self._sweeper
+
+    def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._sweeper_stop.set()
+        self._sweeper.join()
+        self._sweeper = None
+
+    def _sweep_loop(self, interval: float):
+        while not self._sweeper_stop.wait(interval):
+            removed = self.sweep()
+            logger.debug("Swept %d expired cache entries", removed)
+
+    def _get(self, key: str, now: float) -> Tuple[Optional[str], Optional[int]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None, None
+        if entry[1] is not None and entry[1] < now:
+            del self._cache[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None, None
+        self._cache.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    def _set(self, key: str, value: str, ex: Optional[int], now: float):
+        expiry = now + ex if ex is not None else None
+        self._cache[key] = (value, expiry)
+        self._cache.move_to_end(key)
+        if expiry is not None:
+            heapq.heappush(self._expiry_heap, (expiry, key))
+        if self._max_size is not None and len(self._cache) > self._max_size:
+            self._sweep(now)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                self.stats.evictions += 1
+
+    def _sweep(self, now: float) -> int:
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expiry, key = heapq.heappop(heap)
+            entry = self._cache.get(key)
+            # Skip heap records left behind by overwritten or deleted keys.
+            if entry is not None and entry[1] == expiry:
+                del self._cache[key]
+                removed += 1
+        self.stats.expirations += removed
+        if len(heap) > 2 * len(self._cache) + 64:
+            self._expiry_heap = [
+                (expiry, key)
+                for key, (_, expiry) in self._cache.items()
+                if expiry is not None
+            ]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+
+class SQLiteCache(BaseCache):
+    # Shares values and refresh leases between all processes on one host
+    # through a single SQLite file in WAL mode.
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__()
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expiry REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases "
+            "(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expiry REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expiry FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return self._record_get(self._decode(row, time.time()))
+
+    def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        return self.set_many({key: value}, ex)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        keys = list(keys)
+        rows = {}
+        with self._lock:
+            # Stay below SQLite's default limit on bound parameters.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows.update(
+                    (key, (value, expiry))
+                    for key, value, expiry in self._conn.execute(
+                        "SELECT key, value, expiry FROM cache WHERE key IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+        now = time.time()
+        return {key: self._record_get(self._decode(rows.get(key), now)) for key in keys}
+
+    def set_many(self, mapping: Mapping[str, str], ex: Optional[int] = None) -> bool:
+        expiry = time.time() + ex if ex is not None else None
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expiry) "
+                    "VALUES (?, ?, ?)",
+                    [(key, value, expiry) for key, value in mapping.items()],
+                )
+        return True
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache WHERE expiry < ?", (time.time(),)
+            )
+        self.stats.expirations += cursor.rowcount
+        return cursor.rowcount
+
+    async def aacquire_lease(self, key: str, ttl: int) -> bool:
+        return await asyncio.to_thread(self.acquire_lease, key, ttl)
+
+    async def arelease_lease(self, key: str) -> bool:
+        return await asyncio.to_thread(self.release_lease, key)
+
+    @staticmethod
+    def _decode(row, now: float) -> Tuple[Optional[str], Optional[int]]:
+        if row is None:
+            return None, None
+        value, expiry = row
+        if expiry is not None and expiry < now:
+            return None, None
+        return value, expiry
+
+    def acquire_lease(self, key: str, ttl: int) -> bool:
+        # Expired leases are purged first, a held one is never taken over,
+        # not even by this instance.
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM leases WHERE expiry < ?", (now,))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO leases (key, owner, expiry) "
+                    "VALUES (?, ?, ?)",
+                    (key, self._owner, now + ttl),
+                )
+        return self._record_lease(cursor.rowcount == 1)
+
+    def release_lease(self, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner)
+            )
+        return cursor.rowcount == 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCache(BaseCache):
+    # Shares values and refresh leases between processes on any number of
+    # hosts. Requires the optional `redis` package.
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "pywechat:",
+        client=None,
+        async_client=None,
+    ):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as e:
+            raise ImportError(
+                "RedisCache requires the redis package: pip install pywechat[redis]"
+            ) from e
+        self._prefix = prefix
+        self._client = client if client is not None else redis.Redis.from_url(url)
+        self._async_client = (
+            async_client
+            if async_client is not None
+            else redis.asyncio.Redis.from_url(url)
+        )
+
+    def _key(self, key: str) -> str:
+        return self._prefix + key
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[int]]:
+        return self.get_many([key])[key]
+
+    def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        return bool(self._client.set(self._key(key), value, ex=ex))
+
+    def delete(self, key: str) -> bool:
+        return bool(self._client.delete(self._key(key)))
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        keys = list(keys)
+        pipe = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(self._key(key))
+            pipe.pttl(self._key(key))
+        return self._decode_many(keys, pipe.execute())
+
+    def set_many(self, mapping: Mapping[str, str], ex: Optional[int] = None) -> bool:
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(self._key(key), value, ex=ex)
+        return all(pipe.execute())
+
+    async def aget(self, key: str) -> Tuple[Optional[str], Optional[int]]:
+        return (await self.aget_many([key]))[key]
+
+    async def aset(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        return bool(await self._async_client.set(self._key(key), value, ex=ex))
+
+    async def adelete(self, key: str) -> bool:
+        return bool(await self._async_client.delete(self._key(key)))
+
+    async def aget_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        keys = list(keys)
+        pipe = self._async_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(self._key(key))
+            pipe.pttl(self._key(key))
+        return self._decode_many(keys, await pipe.execute())
+
+    async def aset_many(
+        self, mapping: Mapping[str, str], ex: Optional[int] = None
+    ) -> bool:
+        pipe = self._async_client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(self._key(key), value, ex=ex)
+        return all(await pipe.execute())
+
+    def _decode_many(
+        self, keys: List[str], results: list
+    ) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        now = time.time()
+        entries = {}
+        for key, value, pttl in zip(keys, results[::2], results[1::2]):
+            if value is None:
+                entries[key] = self._record_get((None, None))
+                continue
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            expiry = now + pttl / 1000 if pttl is not None and pttl > 0 else None
+            entries[key] = self._record_get((value, expiry))
+        return entries
+
+    def acquire_lease(self, key: str, ttl: int) -> bool:
+        acquired = self._client.set(self._key(key), self._owner, nx=True, ex=ttl)
+        return self._record_lease(bool(acquired))
+
+    def release_lease(self, key: str) -> bool:
+        released = self._client.eval(
+            _RELEASE_LEASE_SCRIPT, 1, self._key(key), self._owner
+        )
+        return bool(released)
+
+    async def aacquire_lease(self, key: str, ttl: int) -> bool:
+        acquired = await self._async_client.set(
+            self._key(key), self._owner, nx=True, ex=ttl
+        )
+        return self._record_lease(bool(acquired))
+
+    async def arelease_lease(self, key: str) -> bool:
+        released = await self._async_client.eval(
+            _RELEASE_LEASE_SCRIPT, 1, self._key(key), self._owner
+        )
+        return bool(released)
@@ -1,26 +1,330 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
 import logging
+import random
+import threading
 import time
-import hashlib
-import socket
-import struct
 import secrets
-import xmltodict
-from httpx import AsyncClient, Client
-import base64
-from typing import Optional, Union
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from .models.message import (
-    EncryptedResponseMessage,
-    EncryptedRequestMessage,
-    GenericMessage,
-    Message,
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager, contextmanager
+from functools import cached_property
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
 )
 from .cache import BaseCache, MemoryCache
+from .metrics import NOOP_METRICS, Metrics, response_errcode
+from .signature import SignatureVerifier
+
+# httpx, cryptography, the pydantic models and the API groups are imported
+# on first use, so importing the client (e.g. in a CLI or a worker that only
+# verifies signatures) stays cheap. tests/test_imports.py guards this.
+if TYPE_CHECKING:
+    from httpx import AsyncClient, Client, Limits, Response, Timeout
+    from .api.custom import CustomMessageAPI
+    from .api.jssdk import JSSDKAPI
+    from .api.media import MediaAPI
+    from .api.menus import MenuAPI
+    from .api.oauth import OAuthAPI
+    from .api.qrcode import QRCodeAPI
+    from .api.templates import TemplateAPI
+    from .api.users import UserAPI
+    from .crypto import MessageCrypto
+    from .models.api import JSSDKSignature, UserInfo
+    from .models.message import (
+        EncryptedResponseMessage,
+        EncryptedRequestMessage,
+        IncomingMessage,
+        Message,
+    )
 
 
 logger = logging.getLogger(__name__)
 
+# Refresh the access token this many seconds before it expires.
+TOKEN_REFRESH_MARGIN = 60 * 5
+# Delay before the background refresher retries a failed refresh.
+TOKEN_REFRESH_RETRY_INTERVAL = 10
+# How long one process may hold the shared token refresh lease.
+TOKEN_LEASE_TTL = 30
+# How often processes waiting on another's refresh re-read the cache.
+TOKEN_LEASE_POLL_INTERVAL = 0.05
+# Payloads smaller than this many characters are processed on the event loop,
+# handing them to an executor would cost more than the work itself.
+OFFLOAD_THRESHOLD = 16 * 1024
+
+# access_token invalid (40001, 40014) or expired (42001).
+TOKEN_ERRCODES = frozenset([40001, 40014, 42001])
+
+T = TypeVar("T")
+
+
+def default_limits() -> Limits:
+    from httpx import Limits
+
+    return Limits(
+        max_connections=100, max_keepalive_connections=20, keepalive_expiry=60
+    )
+
+
+def default_timeout() -> Timeout:
+    from httpx import Timeout
+
+    return Timeout(10.0, connect=5.0)
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class TokenRefreshStats:
+    # Number of token fetches actually sent to cgi-bin/token.
+    refreshes: int = 0
+    # Number of callers that reused a refresh started by someone else.
+    coalesced_waiters: int = 0
+    # Total time callers spent waiting for a refresh to complete.
+    blocked_seconds: float = 0.0
+    # Number of tokens picked up from a refresh done by another process.
+    lease_waits: int = 0
+    # Time spent waiting for another process to finish its refresh.
+    lease_wait_seconds: float = 0.0
+
+
+class CachedCredential:
+    # A credential such as the access token or a JS-SDK ticket, stored in the
+    # cache under key and renewed TOKEN_REFRESH_MARGIN before it expires. One
+    # refresh is in flight at a time: threads queue on a lock and reuse the
+    # result of the refresh they waited for, coroutines share a single task,
+    # and processes sharing the cache take the lease at lease_key so only one
+    # of them calls fetch. fetch returns (value, expires_in), awaitably on
+    # async clients, which use the a-prefixed methods.
+    def __init__(
+        self,
+        cache: BaseCache,
+        key: str,
+        lease_key: str,
+        fetch: Callable[[], Any],
+        stats: TokenRefreshStats,
+        name: str,
+    ):
+        self._cache = cache
+        self._key = key
+        self._lease_key = lease_key
+        self._fetch = fetch
+        self.stats = stats
+        self._name = name
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._task: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def is_fresh(value: Optional[str], expire_time: Optional[float]) -> bool:
+        if value is None:
+            return False
+        return expire_time is None or expire_time > time.time() + TOKEN_REFRESH_MARGIN
+
+    def get(self) -> Tuple[str, Optional[float]]:
+        value, expire_time = self._cache.get(self._key)
+        if self.is_fresh(value, expire_time):
+            return value, expire_time
+        return self.refresh()
+
+    def refresh(self) -> Tuple[str, Optional[float]]:
+        # Threads that queue up behind an in-flight refresh reuse its result
+        # instead of fetching (and invalidating) yet another one.
+        generation = self._generation
+        start = time.monotonic()
+        try:
+            with self._lock:
+                if generation != self._generation:
+                    value, expire_time = self._cache.get(self._key)
+                    if value is not None:
+                        self.stats.coalesced_waiters += 1
+                        return value, expire_time
+                entry = self._fetch_leased()
+                self._generation += 1
+                return entry
+        finally:
+            self.stats.blocked_seconds += time.monotonic() - start
+
+    def invalidate(self, value: str):
+        # Only drop the value if nobody replaced it since it was handed out,
+        # so a burst of failures leads to a single refresh.
+        with self._lock:
+            cached, _ = self._cache.get(self._key)
+            if cached == value:
+                self._cache.delete(self._key)
+
+    def _fetch_leased(self) -> Tuple[str, Optional[float]]:
+        # Only the lease holder talks to WeChat, other processes sharing the
+        # cache wait for the value it stores.
+        stale, _ = self._cache.get(self._key)
+        start = time.monotonic()
+        while not self._cache.acquire_lease(self._lease_key, TOKEN_LEASE_TTL):
+            time.sleep(TOKEN_LEASE_POLL_INTERVAL)
+            value, expire_time = self._cache.get(self._key)
+            if value is not None and value != stale:
+                self.stats.lease_waits += 1
+                self.stats.lease_wait_seconds += time.monotonic() - start
+                return value, expire_time
+        try:
+            # Another process may have refreshed right before we got the lease.
+            value, expire_time = self._cache.get(self._key)
+            if self.is_fresh(value, expire_time):
+                self.stats.lease_waits += 1
+                return value, expire_time
+            self.stats.refreshes += 1
+            value, expires_in = self._fetch()
+            self._cache.set(self._key, value, ex=int(expires_in))
+            return value, time.time() + expires_in
+        finally:
+            self._cache.release_lease(self._lease_key)
+
+    async def aget(self) -> Tuple[str, Optional[float]]:
+        value, expire_time = await self._cache.aget(self._key)
+        if value is None:
+            return await self.arefresh()
+        if not self.is_fresh(value, expire_time):
+            if expire_time <= time.time():
+                return await self.arefresh()
+            # The cached value is still valid, renew it without blocking.
+            self.start_refresh()
+        return value, expire_time
+
+    async def arefresh(self) -> Tuple[str, Optional[float]]:
+        start = time.monotonic()
+        try:
+            return await asyncio.shield(self.start_refresh())
+        finally:
+            self.stats.blocked_seconds += time.monotonic() - start
+
+    def start_refresh(self) -> asyncio.Future:
+        # At most one fetch is in flight, every caller shares its result.
+        if self._task is not None:
+            self.stats.coalesced_waiters += 1
+            return self._task
+        task = asyncio.ensure_future(self._afetch_leased())
+        task.add_done_callback(self._on_refresh_done)
+        self._task = task
+        return task
+
+    def _on_refresh_done(self, task: asyncio.Future):
+        if self._task is task:
+            self._task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to refresh {self._name}: {task.exception()}")
+
+    async def ainvalidate(self, value: str):
+        # Concurrent failures then share the single-flight refresh.
+        cached, _ = await self._cache.aget(self._key)
+        if cached == value:
+            await self._cache.adelete(self._key)
+
+    async def _afetch_leased(self) -> Tuple[str, Optional[float]]:
+        stale, _ = await self._cache.aget(self._key)
+        start = time.monotonic()
+        while not await self._cache.aacquire_lease(self._lease_key, TOKEN_LEASE_TTL):
+            await asyncio.sleep(TOKEN_LEASE_POLL_INTERVAL)
+            value, expire_time = await self._cache.aget(self._key)
+            if value is not None and value != stale:
+                self.stats.lease_waits += 1
+                self.stats.lease_wait_seconds += time.monotonic() - start
+                return value, expire_time
+        try:
+            value, expire_time = await self._cache.aget(self._key)
+            if self.is_fresh(value, expire_time):
+                self.stats.lease_waits += 1
+                return value, expire_time
+            self.stats.refreshes += 1
+            value, expires_in = await self._fetch()
+            await self._cache.aset(self._key, value, ex=int(expires_in))
+            return value, time.time() + expires_in
+        finally:
+            await self._cache.arelease_lease(self._lease_key)
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 2
+    backoff: float = 0.2
+    max_backoff: float = 5.0
+    retry_statuses: FrozenSet[int] = frozenset([500, 502, 503, 504])
+    # A request that may have reached WeChat is only replayed for these
+    # methods, connection failures are always safe to retry.
+    idempotent_methods: FrozenSet[str] = frozenset(["GET", "HEAD", "OPTIONS"])
+
+    def should_retry(
+        self,
+        method: str,
+        attempt: int,
+        error: Optional[Exception] = None,
+        status_code: Optional[int] = None,
+    ) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        from httpx import ConnectError, ConnectTimeout, PoolTimeout
+
+        if isinstance(error, (ConnectError, ConnectTimeout, PoolTimeout)):
+            return True
+        if method.upper() not in self.idempotent_methods:
+            return False
+        return error is not None or status_code in self.retry_statuses
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+
+@dataclass
+class RequestStats:
+    # Requests replayed after a network error or 5xx response.
+    retries: int = 0
+    # Requests replayed with a new token after WeChat rejected the old one.
+    token_retries: int = 0
+
+
+def is_token_error(response: Response) -> bool:
+    # Error bodies are tiny, skip parsing anything that does not start like
+    # {"errcode":...} so large payloads are never decoded twice.
+    head = response.content[:32]
+    if not head.startswith(b"{") or b"errcode" not in head:
+        return False
+    try:
+        return response.json().get("errcode") in TOKEN_ERRCODES
+    except ValueError:
+        return False
+
+
+@dataclass
+class OffloadStats:
+    # Calls processed on the event loop because they were below the threshold.
+    inline: int = 0
+    # Calls handed to the executor.
+    offloaded: int = 0
+    # Calls currently submitted to the executor and not yet finished.
+    pending: int = 0
+    max_pending: int = 0
+    # Time offloaded calls waited for an executor worker.
+    queue_seconds: float = 0.0
+    # Time offloaded calls spent running, including the result hand-off.
+    run_seconds: float = 0.0
+
 
 class BaseWechatClient:
     def __init__(
@@ -29,58 +333,135 @@ class BaseWechatClient:
         app_secret: str,
         app_token: str,
         encoding_aes_key: str,
-        cache: BaseCache,
+        cache: Optional[BaseCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        metrics: Optional[Metrics] = None,
     ):
         self._appid = appid
         self._app_secret = app_secret
         self._app_token = app_token
         self._encoding_aes_key = encoding_aes_key
-        self._encoded_key = base64.b64decode(encoding_aes_key + "=")
-        self._chipper = Cipher(
-            algorithms.AES(self._encoded_key), modes.CBC(self._encoded_key[:16])
-        )
-        self._cache = cache
+        self.signature_verifier = SignatureVerifier(app_token)
+        # Every client gets its own cache unless one is shared explicitly.
+        self._cache = cache if cache is not None else MemoryCache()
         self._request_client: Union[Client, AsyncClient]
+        self.token_stats = TokenRefreshStats()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.request_stats = RequestStats()
+        self.metrics = metrics or NOOP_METRICS
+        self._token_lease_key = f"{appid}:token_lease"
 
     def request(self, method: str, url: str, **kwargs):
         raise NotImplementedError
 
+    @cached_property
+    def _crypto(self) -> MessageCrypto:
+        # Built on the first encrypt or decrypt, which imports cryptography.
+        from .crypto import MessageCrypto
+
+        return MessageCrypto(self._encoding_aes_key, self._appid)
+
+    @property
+    def _encoded_key(self) -> bytes:
+        return self._crypto.key
+
+    @property
+    def _chipper(self):
+        return self._crypto.cipher
+
+    # Typed API groups. Their methods return results directly on WechatClient
+    # and awaitables on AsyncWechatClient.
+    @cached_property
+    def users(self) -> UserAPI:
+        from .api.users import UserAPI
+
+        return UserAPI(self)
+
+    @cached_property
+    def menus(self) -> MenuAPI:
+        from .api.menus import MenuAPI
+
+        return MenuAPI(self)
+
+    @cached_property
+    def media(self) -> MediaAPI:
+        from .api.media import MediaAPI
+
+        return MediaAPI(self)
+
+    @cached_property
+    def qrcode(self) -> QRCodeAPI:
+        from .api.qrcode import QRCodeAPI
+
+        return QRCodeAPI(self)
+
+    @cached_property
+    def custom(self) -> CustomMessageAPI:
+        from .api.custom import CustomMessageAPI
+
+        return CustomMessageAPI(self)
+
+    @cached_property
+    def templates(self) -> TemplateAPI:
+        from .api.templates import TemplateAPI
+
+        return TemplateAPI(self)
+
+    @cached_property
+    def jssdk(self) -> JSSDKAPI:
+        from .api.jssdk import JSSDKAPI
+
+        return JSSDKAPI(self)
+
+    def generate_jssdk_signature(
+        self, url: str, noncestr: Optional[str] = None, timestamp: Optional[int] = None
+    ) -> Union[JSSDKSignature, Awaitable[JSSDKSignature]]:
+        # wx.config() arguments for the page at url. Only a ticket refresh
+        # goes to the network.
+        return self.jssdk.sign(url, noncestr, timestamp)
+
+    def _record_request(
+        self, url: str, started: float, response: Optional[Response] = None
+    ):
+        if response is None:
+            status, errcode = "error", None
+        else:
+            status, errcode = response.status_code, response_errcode(response)
+        self.metrics.timing(
+            "http.request",
+            time.perf_counter() - started,
+            path=urlsplit(url).path,
+            status=status,
+            errcode=errcode,
+        )
+
     def generate_signature(
         self, timestamp: str, nonce: str, encrypt: Optional[str] = None
     ):
-        data = [self._app_token, timestamp, nonce]
-        if encrypt is not None:
-            data.append(encrypt)
-        data.sort()
-        sha1 = hashlib.sha1()
-        sha1.update("".join(data).encode())
-        return sha1.hexdigest()
+        return self.signature_verifier.sign(timestamp, nonce, encrypt)
 
     def check_signature(
         self, signature: str, timestamp: str, nonce: str, encrypt: Optional[str] = None
     ):
-        if signature == self.generate_signature(timestamp, nonce, encrypt):
-            return True
-        return False
+        return self.signature_verifier.verify(signature, timestamp, nonce, encrypt)
 
     def decrypt_message(
         self, encrypt_message: EncryptedRequestMessage
-    ) -> GenericMessage:
-        decryptor = self._chipper.decryptor()
-        plain_text = (
-            decryptor.update(encrypt_message.Encrypt.encode("utf-8"))
-            + decryptor.finalize()
-        )
-        padding = plain_text[-1]
-        content = plain_text[16:-padding]
-        xml_length = socket.ntohl(struct.unpack(b"I", content[:4])[0])
-        xml_content = (content[4 : xml_length + 4]).decode("utf-8")
-        from_appid = (content[xml_length + 4 :]).decode("utf-8")
-        if from_appid != self._appid:
-            raise Exception("Invalid AppID")
-        return GenericMessage.model_validate(self.xml_to_message(xml_content))
+    ) -> IncomingMessage:
+        return self.xml_to_message(self.decrypt(encrypt_message.Encrypt))
+
+    def decrypt_many(
+        self, encrypt_messages: Iterable[EncryptedRequestMessage]
+    ) -> List[IncomingMessage]:
+        return [self.decrypt_message(message) for message in encrypt_messages]
+
+    def decrypt(self, encrypt: str) -> str:
+        return self._crypto.decrypt(encrypt)
 
     def pkcs7_padding(self, data: bytes) -> bytes:
+        from cryptography.hazmat.primitives import padding
+        from cryptography.hazmat.primitives.ciphers import algorithms
+
         if not isinstance(data, bytes):
             data = data.encode()
         padder = padding.PKCS7(algorithms.AES.block_size).padder()
@@ -88,22 +469,26 @@ class BaseWechatClient:
         return padded_data
 
     def encrypt_message(self, message: Message) -> EncryptedResponseMessage:
-        text = self.message_to_xml(message).encode("utf-8")
-        tmp_list = []
-        tmp_list.append(secrets.token_bytes(16))
-        length = struct.pack(b"I", socket.htonl(len(text)))
-        tmp_list.append(length)
-        tmp_list.append(text)
-        tmp_list.append(self._appid.encode("utf-8"))
-
-        encryptor = self._chipper.encryptor()
-
-        ciphertext = (
-            encryptor.update(self.pkcs7_padding(b"".join(tmp_list)))
-            + encryptor.finalize()
-        )
-        encrypt = base64.b64encode(ciphertext).decode("utf-8")
-        timestamp = str(time.time())
+        return self._sign(self.encrypt(self.message_to_xml(message)))
+
+    def encrypt_many(
+        self, messages: Iterable[Message]
+    ) -> List[EncryptedResponseMessage]:
+        timestamp = str(int(time.time()))
+        return [
+            self._sign(self.encrypt(self.message_to_xml(message)), timestamp)
+            for message in messages
+        ]
+
+    def encrypt(self, xml: str) -> str:
+        return self._crypto.encrypt(xml)
+
+    def _sign(
+        self, encrypt: str, timestamp: Optional[str] = None
+    ) -> EncryptedResponseMessage:
+        from .models.message import EncryptedResponseMessage
+
+        timestamp = timestamp or str(int(time.time()))
         nonce = secrets.token_urlsafe(16)
         signature = self.generate_signature(timestamp, nonce, encrypt)
         return EncryptedResponseMessage(
@@ -114,15 +499,18 @@ class BaseWechatClient:
         )
 
     def message_to_xml(self, message: Message) -> str:
-        logger.debug(f"Converting message to XML: {message}")
-        return xmltodict.unparse(
-            {"xml": message.model_dump(mode="json", exclude_none=True)},
-            full_document=False,
-        )
+        from .codec import model_to_xml
 
-    def xml_to_message(self, xml: str) -> GenericMessage:
-        logger.debug(f"Converting XML to message: {xml}")
-        return GenericMessage.model_validate(xmltodict.parse(xml).get("xml"))
+        logger.debug("Converting message to XML: %s", message)
+        return model_to_xml(message)
+
+    def xml_to_message(
+        self, xml: Union[str, bytes]
+    ) -> Union[IncomingMessage, EncryptedRequestMessage]:
+        from .codec import parse_message
+
+        logger.debug("Converting XML to message: %s", xml)
+        return parse_message(xml)
 
 
 class WechatClient(BaseWechatClient):
@@ -132,34 +520,121 @@ class WechatClient(BaseWechatClient):
         app_secret: str,
         app_token: str,
         encoding_aes_key: str,
-        cache: BaseCache = MemoryCache(),
+        cache: Optional[BaseCache] = None,
+        http_client: Optional[Client] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        metrics: Optional[Metrics] = None,
     ):
-        super().__init__(appid, app_secret, app_token, encoding_aes_key, cache)
-        self._request_client: Client = Client()
+        super().__init__(
+            appid, app_secret, app_token, encoding_aes_key, cache, retry_policy, metrics
+        )
+        # A client passed in is shared with others and is not closed by us.
+        self._owns_request_client = http_client is None
+        # All calls of the client share one connection pool, multiplexed
+        # over a single HTTP/2 connection when h2 is installed.
+        if http_client is None:
+            from httpx import Client
+
+            http_client = Client(
+                limits=default_limits(),
+                timeout=default_timeout(),
+                http2=http2_available(),
+            )
+        self._request_client: Client = http_client
+        self._access_token = CachedCredential(
+            self._cache,
+            appid,
+            self._token_lease_key,
+            self._request_access_token,
+            self.token_stats,
+            "access token",
+        )
 
     def request(self, method: str, url: str, **kwargs):
-        if "params" not in kwargs:
-            kwargs["params"] = {}
-        kwargs["params"]["access_token"] = self.get_access_token()
-        return self._request_client.request(method, url, **kwargs)
+        from httpx import TransportError
+
+        params = dict(kwargs.pop("params", None) or {})
+        attempt = 0
+        token_retried = False
+        while True:
+            token = self.get_access_token()
+            params["access_token"] = token
+            started = time.perf_counter() if self.metrics.enabled else 0.0
+            try:
+                response = self._request_client.request(
+                    method, url, params=params, **kwargs
+                )
+            except TransportError as e:
+                if self.metrics.enabled:
+                    self._record_request(url, started)
+                if not self.retry_policy.should_retry(method, attempt, error=e):
+                    raise
+                attempt += 1
+                self.request_stats.retries += 1
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+            if self.metrics.enabled:
+                self._record_request(url, started, response)
+            if self.retry_policy.should_retry(
+                method, attempt, status_code=response.status_code
+            ):
+                attempt += 1
+                self.request_stats.retries += 1
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+            if not token_retried and is_token_error(response):
+                # Replay once with a fresh token instead of failing until the
+                # stale one expires from the cache.
+                token_retried = True
+                self.request_stats.token_retries += 1
+                self.invalidate_access_token(token)
+                continue
+            return response
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs) -> Iterator[Response]:
+        # Like request() but the body is not read, for downloads. Only a JSON
+        # error body is read, to replay once on an invalid token.
+        from .api.base import is_json_response
+
+        params = dict(kwargs.pop("params", None) or {})
+        for attempt in range(2):
+            token = self.get_access_token()
+            params["access_token"] = token
+            with self._request_client.stream(
+                method, url, params=params, **kwargs
+            ) as response:
+                if attempt == 0 and is_json_response(response):
+                    response.read()
+                    if is_token_error(response):
+                        self.request_stats.token_retries += 1
+                        self.invalidate_access_token(token)
+                        continue
+                yield response
+                return
+
+    def invalidate_access_token(self, token: str):
+        self._access_token.invalidate(token)
 
     def get_access_token(self) -> str:
-        cached_token, expire_time = self._cache.get(self._appid)
-        if expire_time is not None and expire_time < int(time.time() + 60 * 5):
-            return self.refresh_access_token()
-        if cached_token is not None:
-            return cached_token
-        else:
-            return self.refresh_access_token()
+        return self._access_token.get()[0]
+
+    def refresh_access_token(self) -> str:
+        return self._access_token.refresh()[0]
 
-    def refresh_access_token(self):
+    def _request_access_token(self) -> Tuple[str, int]:
         url = "https://api.weixin.qq.com/cgi-bin/token"
         params = {
             "grant_type": "client_credential",
             "appid": self._appid,
             "secret": self._app_secret,
         }
-        response = self._request_client.request("GET", url, params=params)
+        started = time.perf_counter() if self.metrics.enabled else 0.0
+        try:
+            response = self._request_client.request("GET", url, params=params)
+        finally:
+            if self.metrics.enabled:
+                self.metrics.timing("token.fetch", time.perf_counter() - started)
         if response.status_code != 200:
             logger.error(f"Failed to get access token: {response.text}")
             raise Exception("Failed to get access token")
@@ -167,8 +642,11 @@ class WechatClient(BaseWechatClient):
         if "errcode" in data:
             logger.error(f"Failed to get access token: {data}")
             raise Exception("Failed to get access token")
-        self._cache.set(self._appid, data["access_token"], ex=int(data["expires_in"]))
-        return data["access_token"]
+        return data["access_token"], data["expires_in"]
+
+    def close(self):
+        if self._owns_request_client:
+            self._request_client.close()
 
 
 class AsyncWechatClient(BaseWechatClient):
@@ -178,35 +656,148 @@ class AsyncWechatClient(BaseWechatClient):
         app_secret: str,
         app_token: str,
         encoding_aes_key: str,
-        cache: BaseCache = MemoryCache(),
+        cache: Optional[BaseCache] = None,
+        http_client: Optional[AsyncClient] = None,
+        executor: Optional[Executor] = None,
+        offload_threshold: int = OFFLOAD_THRESHOLD,
+        retry_policy: Optional[RetryPolicy] = None,
+        metrics: Optional[Metrics] = None,
     ):
-        super().__init__(appid, app_secret, app_token, encoding_aes_key, cache)
-        self._request_client: AsyncClient = AsyncClient()
+        super().__init__(
+            appid, app_secret, app_token, encoding_aes_key, cache, retry_policy, metrics
+        )
+        # A client passed in is shared with others and is not closed by us.
+        self._owns_request_client = http_client is None
+        if http_client is None:
+            from httpx import AsyncClient
+
+            http_client = AsyncClient(
+                limits=default_limits(),
+                timeout=default_timeout(),
+                http2=http2_available(),
+            )
+        self._request_client: AsyncClient = http_client
+        self._access_token = CachedCredential(
+            self._cache,
+            appid,
+            self._token_lease_key,
+            self._request_access_token,
+            self.token_stats,
+            "access token",
+        )
+        self._refresher_task: Optional[asyncio.Task] = None
+        # None runs CPU bound work on the event loop's default thread pool. A
+        # ProcessPoolExecutor works too, the key material is picklable.
+        self._executor = executor
+        self._offload_threshold = offload_threshold
+        self.offload_stats = OffloadStats()
 
     async def request(self, method: str, url: str, **kwargs):
-        if "params" not in kwargs:
-            kwargs["params"] = {}
-        kwargs["params"]["access_token"] = await self.get_access_token()
-        return await self._request_client.request(method, url, **kwargs)
+        from httpx import TransportError
+
+        params = dict(kwargs.pop("params", None) or {})
+        attempt = 0
+        token_retried = False
+        while True:
+            token = await self.get_access_token()
+            params["access_token"] = token
+            started = time.perf_counter() if self.metrics.enabled else 0.0
+            try:
+                response = await self._request_client.request(
+                    method, url, params=params, **kwargs
+                )
+            except TransportError as e:
+                if self.metrics.enabled:
+                    self._record_request(url, started)
+                if not self.retry_policy.should_retry(method, attempt, error=e):
+                    raise
+                attempt += 1
+                self.request_stats.retries += 1
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                continue
+            if self.metrics.enabled:
+                self._record_request(url, started, response)
+            if self.retry_policy.should_retry(
+                method, attempt, status_code=response.status_code
+            ):
+                attempt += 1
+                self.request_stats.retries += 1
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                continue
+            if not token_retried and is_token_error(response):
+                # Replay once with a fresh token instead of failing until the
+                # stale one expires from the cache.
+                token_retried = True
+                self.request_stats.token_retries += 1
+                await self.invalidate_access_token(token)
+                continue
+            return response
+
+    @cached_property
+    def oauth(self) -> OAuthAPI:
+        # Web authorization with an in-memory token store. Construct OAuthAPI
+        # with an OAuthTokenStore of your own to bound memory or spill to disk.
+        from .api.oauth import OAuthAPI
+
+        return OAuthAPI(self)
+
+    def iter_follower_profiles(
+        self,
+        lang: str = "zh_CN",
+        concurrency: Optional[int] = None,
+        checkpoint_key: Optional[str] = None,
+    ) -> AsyncIterator[UserInfo]:
+        from .api.users import BATCHGET_CONCURRENCY
+
+        return self.users.iter_profiles(
+            lang, concurrency or BATCHGET_CONCURRENCY, checkpoint_key
+        )
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[Response]:
+        # Like request() but the body is not read, for downloads. Only a JSON
+        # error body is read, to replay once on an invalid token.
+        from .api.base import is_json_response
+
+        params = dict(kwargs.pop("params", None) or {})
+        for attempt in range(2):
+            token = await self.get_access_token()
+            params["access_token"] = token
+            async with self._request_client.stream(
+                method, url, params=params, **kwargs
+            ) as response:
+                if attempt == 0 and is_json_response(response):
+                    await response.aread()
+                    if is_token_error(response):
+                        self.request_stats.token_retries += 1
+                        await self.invalidate_access_token(token)
+                        continue
+                yield response
+                return
+
+    async def invalidate_access_token(self, token: str):
+        await self._access_token.ainvalidate(token)
 
     async def get_access_token(self) -> str:
-        cached_token, expire_time = await self._cache.aget(self._appid)
-        if expire_time is not None and expire_time < int(time.time() + 60 * 5):
-            return await self.refresh_access_token()
-        if cached_token is not None:
-            return cached_token
-        else:
-            return await self.refresh_access_token()
+        return (await self._access_token.aget())[0]
+
+    async def refresh_access_token(self) -> str:
+        return (await self._access_token.arefresh())[0]
 
-    async def refresh_access_token(self):
+    async def _request_access_token(self) -> Tuple[str, int]:
         url = "https://api.weixin.qq.com/cgi-bin/token"
         params = {
             "grant_type": "client_credential",
             "appid": self._appid,
             "secret": self._app_secret,
         }
-        logger.debug(f"Getting access token: {url} {params}")
-        response = await self._request_client.request("GET", url, params=params)
+        logger.debug("Getting access token for %s", self._appid)
+        started = time.perf_counter() if self.metrics.enabled else 0.0
+        try:
+            response = await self._request_client.request("GET", url, params=params)
+        finally:
+            if self.metrics.enabled:
+                self.metrics.timing("token.fetch", time.perf_counter() - started)
         if response.status_code != 200:
             logger.error(f"Failed to get access token: {response.text}")
             raise Exception("Failed to get access token")
@@ -214,7 +805,86 @@ class AsyncWechatClient(BaseWechatClient):
         if "errcode" in data:
             logger.error(f"Failed to get access token: {data}")
             raise Exception(f"Failed to get access token: {data}")
-        await self._cache.aset(
-            self._appid, data["access_token"], ex=int(data["expires_in"])
+        return data["access_token"], data["expires_in"]
+
+    def start_token_refresher(self, margin: int = TOKEN_REFRESH_MARGIN) -> asyncio.Task:
+        # Renew the token ahead of expiry so request() never waits on a fetch.
+        if self._refresher_task is None or self._refresher_task.done():
+            self._refresher_task = asyncio.ensure_future(self._refresh_loop(margin))
+        return self._refresher_task
+
+    async def stop_token_refresher(self):
+        if self._refresher_task is None:
+            return
+        self._refresher_task.cancel()
+        try:
+            await self._refresher_task
+        except asyncio.CancelledError:
+            pass
+        self._refresher_task = None
+
+    async def _refresh_loop(self, margin: int):
+        while True:
+            cached_token, expire_time = await self._cache.aget(self._appid)
+            if cached_token is not None:
+                if expire_time is None:
+                    delay = margin
+                else:
+                    delay = expire_time - margin - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+            try:
+                await self.refresh_access_token()
+            except Exception as e:
+                logger.warning(f"Background token refresh failed: {e}")
+            # Avoid spinning when WeChat hands out tokens shorter than margin.
+            await asyncio.sleep(TOKEN_REFRESH_RETRY_INTERVAL)
+
+    async def adecrypt_message(
+        self, encrypt_message: EncryptedRequestMessage
+    ) -> IncomingMessage:
+        return await self._offload(
+            len(encrypt_message.Encrypt),
+            self._crypto.decrypt_message,
+            encrypt_message.Encrypt,
         )
-        return data["access_token"]
+
+    async def aencrypt_message(self, message: Message) -> EncryptedResponseMessage:
+        xml = self.message_to_xml(message)
+        encrypt = await self._offload(len(xml), self._crypto.encrypt, xml)
+        return self._sign(encrypt)
+
+    async def axml_to_message(
+        self, xml: Union[str, bytes]
+    ) -> Union[IncomingMessage, EncryptedRequestMessage]:
+        from .codec import parse_message
+
+        return await self._offload(len(xml), parse_message, xml)
+
+    async def _offload(self, size: int, func: Callable[..., T], *args: Any) -> T:
+        from .crypto import timed
+
+        stats = self.offload_stats
+        if size < self._offload_threshold:
+            stats.inline += 1
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        stats.offloaded += 1
+        stats.pending += 1
+        stats.max_pending = max(stats.max_pending, stats.pending)
+        submitted = time.monotonic()
+        try:
+            started, result = await loop.run_in_executor(
+                self._executor, timed, func, *args
+            )
+        finally:
+            stats.pending -= 1
+        stats.queue_seconds += started - submitted
+        stats.run_seconds += time.monotonic() - started
+        return result
+
+    async def aclose(self):
+        await self.stop_token_refresher()
+        if self._owns_request_client:
+            await self._request_client.aclose()
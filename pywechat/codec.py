@@ -0,0 +1,158 @@
+import logging
+import types
+import typing
+from enum import Enum
+from typing import Dict, List, Tuple, Type, TypeVar, Union
+from xml.etree.ElementTree import Element, fromstring
+from pydantic import BaseModel
+from .models.message import (
+    INCOMING_EVENT_TYPES,
+    INCOMING_MESSAGE_TYPES,
+    EncryptedRequestMessage,
+    GenericMessage,
+    IncomingMessage,
+    MessageType,
+    RawMessage,
+)
+
+
+logger = logging.getLogger(__name__)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# WeChat messages are a flat <xml> document with at most one level of nested
+# detail elements. The C accelerated ElementTree parser turns them into the
+# same dict shape xmltodict produced, minus its per-node Python callbacks, and
+# pydantic validates that dict in one pass. Replies are written by serializers
+# compiled once per model class that emit CDATA directly.
+
+_TEXT, _NUMBER, _ENUM, _MODEL, _LIST = range(5)
+
+# Tags that always hold a list even when only one element is present.
+_LIST_TAGS = frozenset(["item"])
+
+
+def _unwrap(annotation) -> Tuple[type, bool]:
+    # Returns the concrete type behind Optional[...] / List[...] annotations
+    # and whether the field holds a list.
+    origin = typing.get_origin(annotation)
+    if origin is Union or origin is getattr(types, "UnionType", None):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _unwrap(args[0])
+    if origin in (list, List):
+        return typing.get_args(annotation)[0], True
+    return annotation, False
+
+
+def _kind(tp: type) -> int:
+    if isinstance(tp, type) and issubclass(tp, BaseModel):
+        return _MODEL
+    if isinstance(tp, type) and issubclass(tp, Enum):
+        return _ENUM
+    if tp in (int, float):
+        return _NUMBER
+    return _TEXT
+
+
+def _element_to_dict(element: Element) -> Union[dict, str, None]:
+    # Leaves become their text (None when empty), repeated tags become lists.
+    data = {}
+    for child in element:
+        tag = child.tag
+        value = child.text if len(child) == 0 else _element_to_dict(child)
+        if tag in data:
+            if not isinstance(data[tag], list):
+                data[tag] = [data[tag]]
+            data[tag].append(value)
+        elif tag in _LIST_TAGS:
+            data[tag] = [value]
+        else:
+            data[tag] = value
+    return data
+
+
+def parse_xml(xml: Union[str, bytes]) -> dict:
+    return _element_to_dict(fromstring(xml))
+
+
+def xml_to_model(
+    xml: Union[str, bytes], model: Type[ModelT] = GenericMessage
+) -> ModelT:
+    return model.model_validate(parse_xml(xml))
+
+
+def message_class(data: dict) -> Type[BaseModel]:
+    if "Encrypt" in data:
+        return EncryptedRequestMessage
+    msg_type = data.get("MsgType")
+    if msg_type == MessageType.EVENT.value:
+        return INCOMING_EVENT_TYPES.get(data.get("Event"), RawMessage)
+    return INCOMING_MESSAGE_TYPES.get(msg_type, RawMessage)
+
+
+def parse_message(
+    xml: Union[str, bytes]
+) -> Union[IncomingMessage, EncryptedRequestMessage]:
+    # Validates straight into the model for the pushed MsgType / Event.
+    data = parse_xml(xml)
+    return message_class(data).model_validate(data)
+
+
+def _cdata(value: str) -> str:
+    if "]]>" in value:
+        value = value.replace("]]>", "]]]]><![CDATA[>")
+    return value
+
+
+class _Serializer:
+    __slots__ = ("fields",)
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields = []
+        for name, field in model.model_fields.items():
+            tag = field.serialization_alias or field.alias or name
+            tp, many = _unwrap(field.annotation)
+            kind = _LIST if many else _kind(tp)
+            if kind in (_TEXT, _ENUM):
+                self.fields.append((name, kind, f"<{tag}><![CDATA[", f"]]></{tag}>"))
+            else:
+                self.fields.append((name, kind, f"<{tag}>", f"</{tag}>"))
+
+    def write(self, message: BaseModel, out: List[str]):
+        for name, kind, open_tag, close_tag in self.fields:
+            value = getattr(message, name, None)
+            if value is None:
+                continue
+            if kind == _TEXT:
+                out.append(open_tag + _cdata(str(value)) + close_tag)
+            elif kind == _ENUM:
+                value = getattr(value, "value", value)
+                out.append(open_tag + _cdata(str(value)) + close_tag)
+            elif kind == _NUMBER:
+                out.append(open_tag + str(value) + close_tag)
+            elif kind == _MODEL:
+                out.append(open_tag)
+                _serializer(type(value)).write(value, out)
+                out.append(close_tag)
+            else:
+                for item in value:
+                    out.append(open_tag)
+                    _serializer(type(item)).write(item, out)
+                    out.append(close_tag)
+
+
+_serializers: Dict[type, _Serializer] = {}
+
+
+def _serializer(model: Type[BaseModel]) -> _Serializer:
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = _Serializer(model)
+    return serializer
+
+
+def model_to_xml(message: BaseModel) -> str:
+    out = ["<xml>"]
+    _serializer(type(message)).write(message, out)
+    out.append("</xml>")
+    return "".join(out)
@@ -0,0 +1,85 @@
+import base64
+import secrets
+import struct
+import time
+from typing import Callable, Tuple, TypeVar
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from .codec import model_to_xml, parse_message
+from .models.message import IncomingMessage, Message
+
+
+AES_BLOCK_SIZE = 16
+# WeChat pads messages with PKCS#7 to a multiple of 32 bytes.
+WECHAT_PAD_BLOCK_SIZE = 32
+_LENGTH = struct.Struct(">I")
+_PADDING = [bytes([pad]) * pad for pad in range(WECHAT_PAD_BLOCK_SIZE + 1)]
+
+T = TypeVar("T")
+
+
+class MessageCrypto:
+    # AES key material of one official account. It pickles down to the key
+    # and appid, so it can be sent to a process pool along with the work.
+    def __init__(self, encoding_aes_key: str, appid: str):
+        self.encoding_aes_key = encoding_aes_key
+        self.appid = appid
+        self.key = base64.b64decode(encoding_aes_key + "=")
+        # The key and IV never change, so one Cipher serves every message.
+        self.cipher = Cipher(algorithms.AES(self.key), modes.CBC(self.key[:16]))
+        self._appid_bytes = appid.encode("utf-8")
+
+    def __reduce__(self):
+        return MessageCrypto, (self.encoding_aes_key, self.appid)
+
+    def encrypt(self, xml: str) -> str:
+        # random(16) + length(4) + xml + appid, PKCS#7 padded to 32 bytes as
+        # WeChat specifies, assembled and encrypted in place in one buffer.
+        text = xml.encode("utf-8")
+        appid = self._appid_bytes
+        length = 20 + len(text) + len(appid)
+        pad = WECHAT_PAD_BLOCK_SIZE - length % WECHAT_PAD_BLOCK_SIZE
+        size = length + pad
+        buffer = bytearray(size + AES_BLOCK_SIZE - 1)
+        buffer[:16] = secrets.token_bytes(16)
+        _LENGTH.pack_into(buffer, 16, len(text))
+        buffer[20 : 20 + len(text)] = text
+        buffer[20 + len(text) : length] = appid
+        buffer[length:size] = _PADDING[pad]
+        view = memoryview(buffer)
+        encryptor = self.cipher.encryptor()
+        encryptor.update_into(view[:size], buffer)
+        encryptor.finalize()
+        return base64.b64encode(view[:size]).decode("ascii")
+
+    def decrypt(self, encrypt: str) -> str:
+        # Decrypts into one preallocated buffer and reads the XML and appid
+        # through a memoryview instead of slicing out intermediate copies.
+        ciphertext = base64.b64decode(encrypt)
+        if not ciphertext or len(ciphertext) % AES_BLOCK_SIZE:
+            raise Exception("Invalid encrypted message")
+        buffer = bytearray(len(ciphertext) + AES_BLOCK_SIZE - 1)
+        decryptor = self.cipher.decryptor()
+        size = decryptor.update_into(ciphertext, buffer)
+        plain_text = memoryview(buffer)[:size]
+        pad = plain_text[-1]
+        if not 1 <= pad <= WECHAT_PAD_BLOCK_SIZE or size < 20 + pad:
+            raise Exception("Invalid encrypted message")
+        (xml_length,) = _LENGTH.unpack_from(plain_text, 16)
+        if 20 + xml_length > size - pad:
+            raise Exception("Invalid encrypted message")
+        if plain_text[20 + xml_length : size - pad] != self._appid_bytes:
+            raise Exception("Invalid AppID")
+        return str(plain_text[20 : 20 + xml_length], "utf-8")
+
+    def decrypt_message(self, encrypt: str) -> IncomingMessage:
+        return parse_message(self.decrypt(encrypt))
+
+    def encrypt_message(self, message: Message) -> str:
+        return self.encrypt(model_to_xml(message))
+
+
+def timed(func: Callable[..., T], *args) -> Tuple[float, T]:
+    # Runs in the executor, reports when the work actually started so the
+    # caller can tell queueing delay from run time.
+    started = time.monotonic()
+    return started, func(*args)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+from pydantic import BaseModel
+from .cache import BaseCache, MemoryCache
+
+
+logger = logging.getLogger(__name__)
+
+# WeChat retries a push three times, 5 seconds apart, when it gets no answer.
+DEDUP_WINDOW = 30
+# Retries give up waiting for the original delivery a little before WeChat's
+# own 5 second deadline.
+DEDUP_WAIT_TIMEOUT = 4.5
+DEDUP_POLL_INTERVAL = 0.05
+
+# Cached values are "r" + reply body, or "n" when the handler had no reply.
+_REPLY = "r"
+_NO_REPLY = "n"
+
+Handler = Callable[[BaseModel], Awaitable[Optional[str]]]
+
+
+def message_key(message: BaseModel) -> str:
+    # Messages carry a MsgId, events are identified by sender, time and type.
+    msg_id = getattr(message, "MsgId", None)
+    if msg_id is not None:
+        return f"dedup:{message.ToUserName}:{msg_id}"
+    event = getattr(message, "Event", None)
+    event = getattr(event, "value", event)
+    return (
+        f"dedup:{message.ToUserName}:{message.FromUserName}:"
+        f"{message.CreateTime}:{event}"
+    )
+
+
+@dataclass
+class DedupStats:
+    processed: int = 0
+    # Deliveries that were not passed to the handler again.
+    duplicates: int = 0
+    # Duplicates that waited for the original delivery to finish.
+    inflight_waits: int = 0
+    # Duplicates answered with a reply from the cache.
+    cached_replies: int = 0
+
+
+class MessageDeduplicator:
+    # Runs the handler once per message within `window` seconds. Duplicates
+    # get the reply of the first delivery: in process they wait for it
+    # directly, across processes sharing the cache they wait for it to appear
+    # in the cache, the refresh lease deciding who handles the message.
+    def __init__(
+        self,
+        cache: Optional[BaseCache] = None,
+        window: int = DEDUP_WINDOW,
+        wait_timeout: float = DEDUP_WAIT_TIMEOUT,
+    ):
+        self._cache = cache if cache is not None else MemoryCache(max_size=100000)
+        self._window = window
+        self._wait_timeout = wait_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = DedupStats()
+
+    async def process(self, message: BaseModel, handler: Handler) -> Optional[str]:
+        key = message_key(message)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats.duplicates += 1
+            self.stats.inflight_waits += 1
+            return await self._wait(future)
+        value, _ = await self._cache.aget(key)
+        if value is not None:
+            self.stats.duplicates += 1
+            self.stats.cached_replies += 1
+            return self._decode(value)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if not await self._cache.aacquire_lease(f"{key}:lease", self._window):
+                self.stats.duplicates += 1
+                self.stats.inflight_waits += 1
+                reply = await self._poll(key)
+            else:
+                self.stats.processed += 1
+                try:
+                    reply = await handler(message)
+                except BaseException:
+                    await self._cache.arelease_lease(f"{key}:lease")
+                    raise
+                await self._cache.aset(
+                    key,
+                    _NO_REPLY if reply is None else _REPLY + reply,
+                    ex=self._window,
+                )
+            future.set_result(reply)
+            return reply
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting, don't let asyncio warn about it.
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _wait(self, future: asyncio.Future) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self._wait_timeout)
+        except asyncio.TimeoutError:
+            return None
+        except Exception:
+            # The first delivery failed, WeChat's next retry will try again.
+            return None
+
+    async def _poll(self, key: str) -> Optional[str]:
+        deadline = time.monotonic() + self._wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(DEDUP_POLL_INTERVAL)
+            value, _ = await self._cache.aget(key)
+            if value is not None:
+                return self._decode(value)
+        return None
+
+    @staticmethod
+    def _decode(value: str) -> Optional[str]:
+        return value[1:] if value.startswith(_REPLY) else None
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from pydantic import BaseModel
+from .codec import message_class
+from .models.message import (
+    ArticleMessage,
+    ImageMessage,
+    MusicMessage,
+    TextMessage,
+    VideoMessage,
+    VoiceMessage,
+)
+from .sender import CUSTOM_SEND_URL
+
+if TYPE_CHECKING:
+    from .router import MessageRouter
+
+
+logger = logging.getLogger(__name__)
+
+# WeChat gives up on a passive reply after 5 seconds and retries the push.
+ACK_DEADLINE = 5.0
+# How long a push may block waiting for room in a full queue before the
+# request fails and WeChat's retry gets another chance.
+ENQUEUE_TIMEOUT = 2.0
+# Replies delivered later than this after the push arrived count as misses.
+REPLY_DEADLINE = 60.0
+
+
+@dataclass
+class ReplyQueueStats:
+    enqueued: int = 0
+    # Pushes turned away because the queue stayed full.
+    rejected: int = 0
+    delivered: int = 0
+    failed: int = 0
+    # Pushes that were not acknowledged within ACK_DEADLINE.
+    ack_misses: int = 0
+    # Replies delivered later than the workers' reply deadline.
+    deadline_misses: int = 0
+
+
+@dataclass
+class QueuedMessage:
+    id: int
+    message: BaseModel
+    enqueued_at: float
+
+
+def custom_message_body(reply: BaseModel) -> Dict[str, Any]:
+    # Turns a passive reply model into a message/custom/send body.
+    body: Dict[str, Any] = {"touser": reply.ToUserName}
+    if isinstance(reply, TextMessage):
+        body["msgtype"] = "text"
+        body["text"] = {"content": reply.Content}
+    elif isinstance(reply, ImageMessage):
+        body["msgtype"] = "image"
+        body["image"] = {"media_id": reply.Image.MediaId}
+    elif isinstance(reply, VoiceMessage):
+        body["msgtype"] = "voice"
+        body["voice"] = {"media_id": reply.Voice.MediaId}
+    elif isinstance(reply, VideoMessage):
+        body["msgtype"] = "video"
+        body["video"] = {
+            "media_id": reply.Video.MediaId,
+            "title": reply.Video.Title,
+            "description": reply.Video.Description,
+        }
+    elif isinstance(reply, MusicMessage):
+        body["msgtype"] = "music"
+        body["music"] = {
+            "title": reply.Music.Title,
+            "description": reply.Music.Description,
+            "musicurl": reply.Music.MusicUrl,
+            "hqmusicurl": reply.Music.HQMusicUrl,
+            "thumb_media_id": reply.Music.ThumbMediaId,
+        }
+    elif isinstance(reply, ArticleMessage):
+        body["msgtype"] = "news"
+        body["news"] = {
+            "articles": [
+                {
+                    "title": article.Title,
+                    "description": article.Description,
+                    "url": article.Url,
+                    "picurl": article.PicUrl,
+                }
+                for article in reply.Articles.item
+            ]
+        }
+    else:
+        raise Exception(f"Unsupported reply type: {type(reply).__name__}")
+    return body
+
+
+class BaseReplyQueue:
+    # Holds decoded pushes between the push handler and the reply workers.
+    # Items stay counted in depth() until done() is called for them.
+    def __init__(self):
+        self.stats = ReplyQueueStats()
+
+    async def put(self, message: BaseModel, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        raise NotImplementedError
+
+    async def get(self) -> QueuedMessage:
+        raise NotImplementedError
+
+    async def done(self, item: QueuedMessage):
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    def oldest_age(self) -> float:
+        raise NotImplementedError
+
+
+class MemoryReplyQueue(BaseReplyQueue):
+    def __init__(self, max_size: int = 1000):
+        super().__init__()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._pending: "OrderedDict[int, float]" = OrderedDict()
+        self._next_id = 0
+
+    async def put(self, message: BaseModel, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        self._next_id += 1
+        item = QueuedMessage(self._next_id, message, time.time())
+        self._pending[item.id] = item.enqueued_at
+        enqueued = False
+        try:
+            await asyncio.wait_for(self._queue.put(item), timeout)
+            enqueued = True
+        except asyncio.TimeoutError:
+            self.stats.rejected += 1
+            return False
+        finally:
+            # Also when the push handler is cancelled while waiting.
+            if not enqueued:
+                self._pending.pop(item.id, None)
+        self.stats.enqueued += 1
+        return True
+
+    async def get(self) -> QueuedMessage:
+        return await self._queue.get()
+
+    async def done(self, item: QueuedMessage):
+        self._pending.pop(item.id, None)
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def oldest_age(self) -> float:
+        for enqueued_at in self._pending.values():
+            return time.time() - enqueued_at
+        return 0.0
+
+
+class SQLiteReplyQueue(BaseReplyQueue):
+    # Durable queue in a local SQLite file: pushes survive a restart. Items a
+    # worker claimed but never finished are handed out again after
+    # `visibility_timeout` seconds.
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 100000,
+        poll_interval: float = 0.1,
+        visibility_timeout: float = 300.0,
+        timeout: float = 5.0,
+    ):
+        super().__init__()
+        self._max_size = max_size
+        self._poll_interval = poll_interval
+        self._visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS replies (id INTEGER PRIMARY KEY, "
+            "payload TEXT NOT NULL, enqueued_at REAL NOT NULL, claimed_at REAL)"
+        )
+        # Counted once, then tracked on insert and delete.
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM replies").fetchone()[0]
+
+    async def put(self, message: BaseModel, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        payload = json.dumps(message.model_dump(mode="json"), ensure_ascii=False)
+        deadline = time.monotonic() + timeout
+        while not await asyncio.to_thread(self._insert, payload):
+            if time.monotonic() >= deadline:
+                self.stats.rejected += 1
+                return False
+            await asyncio.sleep(self._poll_interval)
+        self.stats.enqueued += 1
+        return True
+
+    def _insert(self, payload: str) -> bool:
+        with self._lock:
+            if self._depth >= self._max_size:
+                return False
+            self._conn.execute(
+                "INSERT INTO replies (payload, enqueued_at) VALUES (?, ?)",
+                (payload, time.time()),
+            )
+            self._depth += 1
+        return True
+
+    async def get(self) -> QueuedMessage:
+        while True:
+            row = await asyncio.to_thread(self._claim)
+            if row is not None:
+                id, payload, enqueued_at = row
+                data = json.loads(payload)
+                message = message_class(data).model_validate(data)
+                return QueuedMessage(id, message, enqueued_at)
+            await asyncio.sleep(self._poll_interval)
+
+    def _claim(self) -> Optional[tuple]:
+        # Select then update in one transaction, UPDATE ... RETURNING needs
+        # SQLite 3.35 which older Pythons do not ship.
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT id, payload, enqueued_at FROM replies "
+                    "WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT 1",
+                    (now - self._visibility_timeout,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE replies SET claimed_at = ? WHERE id = ?", (now, row[0])
+                    )
+        return row
+
+    async def done(self, item: QueuedMessage):
+        await asyncio.to_thread(self._delete, item.id)
+
+    def _delete(self, id: int):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM replies WHERE id = ?", (id,))
+            self._depth -= cursor.rowcount
+
+    def depth(self) -> int:
+        return self._depth
+
+    def oldest_age(self) -> float:
+        with self._lock:
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM replies"
+            ).fetchone()[0]
+        return 0.0 if oldest is None else time.time() - oldest
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReplyWorkers:
+    # Drains the router's reply queue: runs the handler for each push and
+    # delivers its reply through the customer-service API.
+    def __init__(
+        self,
+        router: "MessageRouter",
+        concurrency: int = 4,
+        reply_deadline: float = REPLY_DEADLINE,
+    ):
+        if router.reply_queue is None:
+            raise Exception("MessageRouter has no reply queue")
+        self._router = router
+        self._queue = router.reply_queue
+        self._concurrency = concurrency
+        self._reply_deadline = reply_deadline
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._run()) for _ in range(self._concurrency)
+            ]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._queue.stats.failed += 1
+                logger.exception(f"Failed to reply to queued message {item.id}")
+            await self._queue.done(item)
+
+    async def _deliver(self, item: QueuedMessage):
+        reply = await self._router.dispatch(item.message)
+        if reply is None:
+            return
+        response = await self._router._client.request(
+            "POST", CUSTOM_SEND_URL, json=custom_message_body(reply)
+        )
+        data = response.json()
+        if data.get("errcode", 0) != 0:
+            raise Exception(f"Failed to send reply: {data}")
+        self._queue.stats.delivered += 1
+        if time.time() - item.enqueued_at > self._reply_deadline:
+            self._queue.stats.deadline_misses += 1
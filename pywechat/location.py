@@ -0,0 +1,234 @@
+import math
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from .models.message import LocationEvent
+
+
+# Mean Earth radius in metres.
+EARTH_RADIUS = 6371000.0
+# Fixes closer than this to the last reported position are only stored.
+MOVE_THRESHOLD = 100.0
+
+_NAN = float("nan")
+
+
+@dataclass
+class LocationFix:
+    openid: str
+    latitude: float
+    longitude: float
+    precision: float
+    updated_at: int
+
+
+@dataclass
+class LocationStats:
+    received: int = 0
+    # Fixes stored without being reported, the user had not moved enough.
+    coalesced: int = 0
+    moved: int = 0
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Haversine distance in metres.
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Reference:
+    # Last reported position per row, for one movement threshold.
+    __slots__ = ("threshold", "latitude", "longitude")
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.latitude = array("f")
+        self.longitude = array("f")
+
+    def moved(self, row: int, latitude: float, longitude: float) -> bool:
+        # Also true for the first fix of a row, whose reference is NaN.
+        ref_latitude = self.latitude[row]
+        if not math.isnan(ref_latitude) and (
+            distance(ref_latitude, self.longitude[row], latitude, longitude)
+            < self.threshold
+        ):
+            return False
+        self.latitude[row] = latitude
+        self.longitude[row] = longitude
+        return True
+
+
+class LocationSubscription(_Reference):
+    __slots__ = ("callback",)
+
+    def __init__(self, threshold: float, callback: Callable[[LocationFix], None]):
+        super().__init__(threshold)
+        self.callback = callback
+
+
+class LocationStore:
+    # Latest location of every user reporting one, as float32 columns in
+    # arrays indexed by an openid -> row dict. float32 coordinates are good
+    # to about 2 metres. A row takes 24 bytes of columns (plus 8 per
+    # subscription) next to its index entry, and rows of removed users are
+    # reused.
+    #
+    # WeChat reports a location every 5 seconds while a user has the
+    # account open. record() keeps every fix but only reports users that
+    # moved more than threshold metres since they were last reported, and
+    # subscribers are called for moves beyond their own thresholds. Meant
+    # for use from one thread, like the event loop handling pushes.
+    def __init__(self, threshold: float = MOVE_THRESHOLD):
+        self._rows: Dict[str, int] = {}
+        self._openids: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._latitude = array("f")
+        self._longitude = array("f")
+        self._precision = array("f")
+        self._updated_at = array("I")
+        self._reference = _Reference(threshold)
+        self._subscriptions: List[LocationSubscription] = []
+        self.stats = LocationStats()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, openid: str) -> bool:
+        return openid in self._rows
+
+    def subscribe(
+        self, callback: Callable[[LocationFix], None], threshold: Optional[float] = None
+    ) -> LocationSubscription:
+        # callback(fix) runs inline in record() whenever a user moved more than
+        # threshold metres (the store's by default), keep it cheap.
+        subscription = LocationSubscription(
+            self._reference.threshold if threshold is None else threshold, callback
+        )
+        # Users already known report once they move away from where they are.
+        subscription.latitude.extend(self._latitude)
+        subscription.longitude.extend(self._longitude)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LocationSubscription):
+        self._subscriptions.remove(subscription)
+
+    def record(self, event: LocationEvent) -> bool:
+        return self.update(
+            event.FromUserName,
+            event.Latitude,
+            event.Longitude,
+            event.Precision,
+            event.CreateTime,
+        )
+
+    def update(
+        self,
+        openid: str,
+        latitude: float,
+        longitude: float,
+        precision: float = 0.0,
+        updated_at: Optional[int] = None,
+    ) -> bool:
+        # Stores the fix, returns whether the user moved beyond the threshold.
+        self.stats.received += 1
+        row = self._rows.get(openid)
+        if row is None:
+            row = self._add(openid)
+        self._latitude[row] = latitude
+        self._longitude[row] = longitude
+        self._precision[row] = precision
+        self._updated_at[row] = int(updated_at or time.time())
+        for subscription in self._subscriptions:
+            if subscription.moved(row, latitude, longitude):
+                subscription.callback(self._fix(row))
+        if self._reference.moved(row, latitude, longitude):
+            self.stats.moved += 1
+            return True
+        self.stats.coalesced += 1
+        return False
+
+    def get(self, openid: str) -> Optional[LocationFix]:
+        row = self._rows.get(openid)
+        return self._fix(row) if row is not None else None
+
+    def remove(self, openid: str) -> bool:
+        row = self._rows.pop(openid, None)
+        if row is None:
+            return False
+        self._openids[row] = None
+        self._free.append(row)
+        return True
+
+    def expire(self, max_age: float) -> int:
+        # Drops users without a fix for max_age seconds, i.e. who stopped
+        # reporting. Returns how many were removed.
+        cutoff = time.time() - max_age
+        stale = [
+            openid
+            for openid, updated_at in zip(self._openids, self._updated_at)
+            if openid is not None and updated_at < cutoff
+        ]
+        for openid in stale:
+            self.remove(openid)
+        return len(stale)
+
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        # (openid, metres) of users within radius metres of the point,
+        # nearest first. One pass over the columns, a bounding box in
+        # degrees rules out most rows before any trigonometry.
+        lat_delta = math.degrees(radius / EARTH_RADIUS)
+        cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + lat_delta)))
+        lon_delta = (
+            360.0 if cos_lat <= 0 else math.degrees(radius / EARTH_RADIUS / cos_lat)
+        )
+        lat_min, lat_max = latitude - lat_delta, latitude + lat_delta
+        found = []
+        for openid, lat, lon in zip(self._openids, self._latitude, self._longitude):
+            if lat_min <= lat <= lat_max and openid is not None:
+                lon_offset = abs(lon - longitude)
+                if min(lon_offset, 360.0 - lon_offset) <= lon_delta:
+                    metres = distance(latitude, longitude, lat, lon)
+                    if metres <= radius:
+                        found.append((openid, metres))
+        found.sort(key=lambda item: item[1])
+        return found[:limit] if limit is not None else found
+
+    def _add(self, openid: str) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._openids[row] = openid
+            self._reference.latitude[row] = _NAN
+            for subscription in self._subscriptions:
+                subscription.latitude[row] = _NAN
+        else:
+            row = len(self._openids)
+            self._openids.append(openid)
+            for column in (self._latitude, self._longitude, self._precision):
+                column.append(0.0)
+            self._updated_at.append(0)
+            for reference in (self._reference, *self._subscriptions):
+                reference.latitude.append(_NAN)
+                reference.longitude.append(_NAN)
+        self._rows[openid] = row
+        return row
+
+    def _fix(self, row: int) -> LocationFix:
+        return LocationFix(
+            self._openids[row],
+            self._latitude[row],
+            self._longitude[row],
+            self._precision[row],
+            self._updated_at[row],
+        )
@@ -0,0 +1,143 @@
+import json
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from httpx import Response
+
+
+# Timings emitted by the client and the push pipeline, in seconds:
+#
+#   signature.check   query string signature of a push (router)
+#   message.parse     XML to model (router)
+#   message.decrypt   AES decryption of an encrypted push (router)
+#   router.handler    the user's handler (router)
+#   message.encrypt   encrypting and serializing the reply (router)
+#   token.fetch       access token fetch from WeChat (client)
+#   http.request      one API call, tagged with path, status and errcode (client)
+#
+# Code emitting them checks `metrics.enabled` first, so with the default
+# no-op metrics nothing is timed and no tags are built.
+
+
+class Metrics:
+    # No-op base. Subclasses set enabled = True and override timing().
+    enabled = False
+
+    def timing(self, name: str, seconds: float, **tags: Any):
+        pass
+
+
+NOOP_METRICS = Metrics()
+
+
+class CallbackMetrics(Metrics):
+    # Forwards every timing to a callback, e.g. to feed StatsD or a log.
+    enabled = True
+
+    def __init__(self, callback: Callable[..., None]):
+        self._callback = callback
+
+    def timing(self, name: str, seconds: float, **tags: Any):
+        self._callback(name, seconds, **tags)
+
+
+@dataclass
+class TimingSummary:
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+
+
+class InMemoryMetrics(Metrics):
+    # Aggregates timings per name and tag set, handy for tests and debugging.
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], TimingSummary] = {}
+
+    def timing(self, name: str, seconds: float, **tags: Any):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            summary = self.timings.get(key)
+            if summary is None:
+                summary = self.timings[key] = TimingSummary()
+            summary.count += 1
+            summary.total += seconds
+            summary.min = min(summary.min, seconds)
+            summary.max = max(summary.max, seconds)
+
+    def summary(self, name: str, **tags: Any) -> Optional[TimingSummary]:
+        return self.timings.get((name, tuple(sorted(tags.items()))))
+
+
+class PrometheusMetrics(Metrics):
+    # Records timings as prometheus_client histograms named
+    # pywechat_<name>_seconds with the tags as labels.
+    enabled = True
+
+    def __init__(self, registry=None, namespace: str = "pywechat"):
+        try:
+            import prometheus_client
+        except ImportError:
+            raise ImportError(
+                "PrometheusMetrics requires prometheus_client, "
+                "install it with `pip install prometheus-client`"
+            )
+        self._prometheus = prometheus_client
+        self._registry = registry or prometheus_client.REGISTRY
+        self._namespace = namespace
+        self._histograms: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float, **tags: Any):
+        labels = tuple(sorted(tags))
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = self._prometheus.Histogram(
+                        f"{name.replace('.', '_')}_seconds",
+                        f"pywechat {name} duration",
+                        labels,
+                        namespace=self._namespace,
+                        registry=self._registry,
+                    )
+        if labels:
+            histogram = histogram.labels(**{k: str(v) for k, v in tags.items()})
+        histogram.observe(seconds)
+
+
+class OpenTelemetryMetrics(Metrics):
+    # Records timings on histograms of an OpenTelemetry meter, e.g.
+    # OpenTelemetryMetrics(opentelemetry.metrics.get_meter("pywechat")).
+    enabled = True
+
+    def __init__(self, meter):
+        self._meter = meter
+        self._histograms: Dict[str, Any] = {}
+
+    def timing(self, name: str, seconds: float, **tags: Any):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = self._meter.create_histogram(
+                f"pywechat.{name}", unit="s"
+            )
+        histogram.record(seconds, attributes=tags)
+
+
+def response_errcode(response: "Response") -> int:
+    # Same cheap sniffing as is_token_error: only small JSON error bodies are
+    # parsed.
+    head = response.content[:32]
+    if not head.startswith(b"{") or b"errcode" not in head:
+        return 0
+    try:
+        return json.loads(response.content).get("errcode", 0)
+    except ValueError:
+        return 0
@@ -0,0 +1,114 @@
+from typing import Any, Dict, List
+from pydantic import BaseModel, ConfigDict
+
+
+class APIResponse(BaseModel):
+    # Fields WeChat adds later are kept rather than rejected.
+    model_config = ConfigDict(extra="allow")
+
+    errcode: int = 0
+    errmsg: str | None = None
+
+
+class UserInfo(APIResponse):
+    # https://developers.weixin.qq.com/doc/offiaccount/User_Management/Get_users_basic_information_UnionID.html
+    subscribe: int
+    openid: str
+    language: str | None = None
+    subscribe_time: int | None = None
+    unionid: str | None = None
+    remark: str | None = None
+    groupid: int | None = None
+    tagid_list: List[int] | None = None
+    subscribe_scene: str | None = None
+    qr_scene: int | None = None
+    qr_scene_str: str | None = None
+
+
+class UserInfoList(APIResponse):
+    user_info_list: List[UserInfo]
+
+
+class OpenIdList(BaseModel):
+    openid: List[str] = []
+
+
+class FollowerList(APIResponse):
+    # https://developers.weixin.qq.com/doc/offiaccount/User_Management/Getting_a_User_List.html
+    total: int
+    count: int
+    data: OpenIdList | None = None
+    next_openid: str | None = None
+
+    @property
+    def openids(self) -> List[str]:
+        return self.data.openid if self.data is not None else []
+
+
+class MenuInfo(APIResponse):
+    menu: Dict[str, Any] | None = None
+    conditionalmenu: List[Dict[str, Any]] | None = None
+
+
+class MediaUpload(APIResponse):
+    type: str
+    media_id: str
+    created_at: int
+
+
+class QRCodeTicket(APIResponse):
+    ticket: str
+    expire_seconds: int | None = None
+    url: str
+
+
+class TemplateSendResult(APIResponse):
+    msgid: int
+
+
+class Template(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    template_id: str
+    title: str
+    content: str | None = None
+    example: str | None = None
+
+
+class TemplateList(APIResponse):
+    template_list: List[Template]
+
+
+class Ticket(APIResponse):
+    ticket: str
+    expires_in: int
+
+
+class JSSDKSignature(BaseModel):
+    # Arguments of wx.config() besides jsApiList, named as the JS-SDK wants.
+    appId: str
+    timestamp: int
+    nonceStr: str
+    signature: str
+
+
+class OAuthAccessToken(APIResponse):
+    # https://developers.weixin.qq.com/doc/offiaccount/OA_Web_Apps/Wechat_webpage_authorization.html
+    access_token: str
+    expires_in: int
+    refresh_token: str
+    openid: str
+    scope: str | None = None
+    unionid: str | None = None
+
+
+class OAuthUserInfo(APIResponse):
+    openid: str
+    nickname: str | None = None
+    sex: int | None = None
+    province: str | None = None
+    city: str | None = None
+    country: str | None = None
+    headimgurl: str | None = None
+    privilege: List[str] = []
+    unionid: str | None = None
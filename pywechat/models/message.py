@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import List, Union
-from pydantic import BaseModel
+from typing import Dict, List, Type, Union
+from pydantic import BaseModel, ConfigDict
 
 
 class EncryptedRequestMessage(BaseModel):
@@ -30,6 +30,8 @@ class BaseMessage(BaseModel):
     FromUserName: str
     CreateTime: int
     MsgType: MessageType
+    # Only present on messages pushed by WeChat, not on replies.
+    MsgId: int | None = None
 
 
 class TextMessage(BaseMessage):
@@ -112,7 +114,7 @@ class SubscribeEvent(BaseEvent):
 
 class UnsubscribeEvent(BaseEvent):
     # 取消关注事件 unsubscribe
-    pass
+    EventKey: str | None = None
 
 
 class ScanEvent(BaseEvent):
@@ -165,6 +167,18 @@ class GenericMessage(GenericEvent):
     Nonce: str | None = None
 
 
+class RawMessage(BaseModel):
+    # Pushed message or event without a dedicated model, every element is
+    # kept as received.
+    model_config = ConfigDict(extra="allow")
+
+    ToUserName: str
+    FromUserName: str | None = None
+    CreateTime: int | None = None
+    MsgType: str | None = None
+    Event: str | None = None
+
+
 Event = Union[
     SubscribeEvent,
     UnsubscribeEvent,
@@ -184,3 +198,31 @@ Message = Union[
     ArticleMessage,
     GenericMessage,
 ]
+
+IncomingMessage = Union[
+    TextMessage,
+    SubscribeEvent,
+    UnsubscribeEvent,
+    ScanEvent,
+    LocationEvent,
+    ClickEvent,
+    ViewEvent,
+    RawMessage,
+]
+
+# Models for pushed messages keyed by MsgType, and for events by Event. Only
+# types whose pushed form matches the model are listed here, the others (for
+# example image pushes carry PicUrl rather than an Image element) are parsed
+# as RawMessage.
+INCOMING_MESSAGE_TYPES: Dict[str, Type[BaseMessage]] = {
+    MessageType.TEXT.value: TextMessage,
+}
+
+INCOMING_EVENT_TYPES: Dict[str, Type[BaseEvent]] = {
+    EventType.SUBSCRIBE.value: SubscribeEvent,
+    EventType.UNSUBSCRIBE.value: UnsubscribeEvent,
+    EventType.SCAN.value: ScanEvent,
+    EventType.LOCATION.value: LocationEvent,
+    EventType.CLICK.value: ClickEvent,
+    EventType.VIEW.value: ViewEvent,
+}
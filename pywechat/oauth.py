@@ -0,0 +1,285 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+# Tokens kept in memory, the least recently used beyond this are spilled to
+# SQLite when a spill file is configured and dropped otherwise.
+MAX_TOKENS = 100000
+# Openids read from the spill file per query by expiring().
+EXPIRING_PAGE_SIZE = 500
+_COLUMNS = (
+    "openid, access_token, refresh_token, expires_at, refresh_expires_at, "
+    "scope, unionid"
+)
+
+
+class OAuthToken:
+    # One user's web authorization. Slots keep a record at about a third of
+    # the size of an equivalent dict, which matters with millions of users.
+    __slots__ = (
+        "openid",
+        "access_token",
+        "refresh_token",
+        "expires_at",
+        "refresh_expires_at",
+        "scope",
+        "unionid",
+    )
+
+    def __init__(
+        self,
+        openid: str,
+        access_token: str,
+        refresh_token: str,
+        expires_at: float,
+        refresh_expires_at: float,
+        scope: Optional[str] = None,
+        unionid: Optional[str] = None,
+    ):
+        self.openid = openid
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.refresh_expires_at = refresh_expires_at
+        self.scope = scope
+        self.unionid = unionid
+
+    def __repr__(self) -> str:
+        # Tokens are credentials, keep them out of logs.
+        return f"OAuthToken(openid={self.openid!r}, expires_at={self.expires_at})"
+
+    def expires_within(self, seconds: float) -> bool:
+        return self.expires_at <= time.time() + seconds
+
+    def refreshable(self) -> bool:
+        return self.refresh_expires_at > time.time()
+
+    def _row(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+@dataclass
+class OAuthStoreStats:
+    hits: int = 0
+    misses: int = 0
+    # Tokens written to the spill file when evicted from memory.
+    spilled: int = 0
+    # Tokens read back from the spill file.
+    loaded: int = 0
+    # Tokens dropped because memory was full and there is no spill file.
+    evictions: int = 0
+
+
+class OAuthTokenStore:
+    # Per-openid web tokens: a bounded LRU of OAuthToken records in memory,
+    # backed by an optional SQLite file that evicted records spill to and
+    # are loaded back from on their next use. The async methods answer from
+    # memory directly and run the SQLite work on a worker thread.
+    def __init__(
+        self,
+        max_size: Optional[int] = MAX_TOKENS,
+        spill_path: Optional[str] = None,
+        timeout: float = 5.0,
+    ):
+        self._max_size = max_size
+        # Guards the in-memory records, the connection has its own lock so
+        # memory hits never wait for a query.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._tokens: OrderedDict[str, OAuthToken] = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        if spill_path is not None:
+            self._conn = sqlite3.connect(
+                spill_path,
+                timeout=timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_tokens "
+                "(openid TEXT PRIMARY KEY, access_token TEXT NOT NULL, "
+                "refresh_token TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "refresh_expires_at REAL NOT NULL, scope TEXT, unionid TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS oauth_tokens_expires_at "
+                "ON oauth_tokens (expires_at)"
+            )
+        self.stats = OAuthStoreStats()
+
+    def __len__(self) -> int:
+        # Tokens held in memory.
+        return len(self._tokens)
+
+    def get(self, openid: str) -> Optional[OAuthToken]:
+        token = self._get_cached(openid)
+        if token is None:
+            token = self._load(openid)
+        return token
+
+    def put(self, token: OAuthToken):
+        with self._lock:
+            evicted = self._add(token)
+        self._evict(evicted)
+
+    def delete(self, openid: str) -> bool:
+        with self._lock:
+            deleted = self._tokens.pop(openid, None) is not None
+        if self._conn is not None:
+            with self._db_lock:
+                cursor = self._conn.execute(
+                    "DELETE FROM oauth_tokens WHERE openid = ?", (openid,)
+                )
+            deleted = deleted or cursor.rowcount == 1
+        return deleted
+
+    async def aget(self, openid: str) -> Optional[OAuthToken]:
+        token = self._get_cached(openid)
+        if token is not None or self._conn is None:
+            if token is None:
+                self.stats.misses += 1
+            return token
+        return await asyncio.to_thread(self._load, openid)
+
+    async def aput(self, token: OAuthToken):
+        with self._lock:
+            evicted = self._add(token)
+        if evicted and self._conn is not None:
+            await asyncio.to_thread(self._evict, evicted)
+        else:
+            self._evict(evicted)
+
+    async def adelete(self, openid: str) -> bool:
+        if self._conn is None:
+            with self._lock:
+                return self._tokens.pop(openid, None) is not None
+        return await asyncio.to_thread(self.delete, openid)
+
+    def expiring(self, within: float) -> Iterator[str]:
+        # Openids whose access token expires within `within` seconds and
+        # can still be refreshed, from memory and then the spill file, which
+        # is read a page at a time.
+        now = time.time()
+        openids, after = self._expiring_in_memory(now + within, now), ""
+        yield from openids
+        while after is not None:
+            page, after = self._expiring_page(now + within, now, after)
+            yield from page
+
+    async def aexpiring(self, within: float) -> AsyncIterator[str]:
+        now = time.time()
+        openids, after = self._expiring_in_memory(now + within, now), ""
+        for openid in openids:
+            yield openid
+        while after is not None:
+            page, after = await asyncio.to_thread(
+                self._expiring_page, now + within, now, after
+            )
+            for openid in page:
+                yield openid
+
+    def flush(self):
+        # Writes the tokens held in memory to the spill file, e.g. before
+        # shutting down, so they survive a restart.
+        with self._lock:
+            tokens = list(self._tokens.values())
+        self._spill(tokens)
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    def _get_cached(self, openid: str) -> Optional[OAuthToken]:
+        with self._lock:
+            token = self._tokens.get(openid)
+            if token is not None:
+                self._tokens.move_to_end(openid)
+                self.stats.hits += 1
+        return token
+
+    def _load(self, openid: str) -> Optional[OAuthToken]:
+        row = None
+        if self._conn is not None:
+            with self._db_lock:
+                row = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM oauth_tokens WHERE openid = ?", (openid,)
+                ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self.stats.loaded += 1
+        token = OAuthToken(*row)
+        with self._lock:
+            evicted = self._add(token)
+        self._evict(evicted)
+        return token
+
+    def _add(self, token: OAuthToken) -> List[OAuthToken]:
+        # Returns the records pushed out of memory, for _evict() outside the
+        # memory lock.
+        self._tokens[token.openid] = token
+        self._tokens.move_to_end(token.openid)
+        evicted = []
+        if self._max_size is not None:
+            while len(self._tokens) > self._max_size:
+                evicted.append(self._tokens.popitem(last=False)[1])
+        return evicted
+
+    def _evict(self, evicted: List[OAuthToken]):
+        if not evicted:
+            return
+        if self._conn is None:
+            self.stats.evictions += len(evicted)
+        else:
+            self._spill(evicted)
+            self.stats.spilled += len(evicted)
+
+    def _expiring_in_memory(self, deadline: float, now: float) -> List[str]:
+        # Bounded by max_size, the spill file is the part that grows.
+        with self._lock:
+            return [
+                token.openid
+                for token in self._tokens.values()
+                if token.expires_at <= deadline and token.refresh_expires_at > now
+            ]
+
+    def _expiring_page(
+        self, deadline: float, now: float, after: str
+    ) -> Tuple[List[str], Optional[str]]:
+        # One page of spilled openids after `after`, and where the next page
+        # starts (None when done). Spilled rows of tokens in memory may be
+        # stale, memory wins.
+        if self._conn is None:
+            return [], None
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT openid FROM oauth_tokens WHERE openid > ? "
+                "AND expires_at <= ? AND refresh_expires_at > ? "
+                "ORDER BY openid LIMIT ?",
+                (after, deadline, now, EXPIRING_PAGE_SIZE),
+            ).fetchall()
+        with self._lock:
+            page = [openid for (openid,) in rows if openid not in self._tokens]
+        next_after = rows[-1][0] if len(rows) == EXPIRING_PAGE_SIZE else None
+        return page, next_after
+
+    def _spill(self, tokens: Iterable[OAuthToken]):
+        if self._conn is None:
+            return
+        with self._db_lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO oauth_tokens ({_COLUMNS}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (token._row() for token in tokens),
+                )
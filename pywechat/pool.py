@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar, Union
+from httpx import AsyncClient, Client, Limits, Timeout
+from .cache import BaseCache, MemoryCache
+from .client import (
+    AsyncWechatClient,
+    WechatClient,
+    default_limits,
+    default_timeout,
+    http2_available,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AccountConfig:
+    appid: str
+    app_secret: str
+    app_token: str
+    encoding_aes_key: str
+    # Original ID (gh_...) that WeChat sends as ToUserName in pushes.
+    username: Optional[str] = None
+
+
+# Looks up an account by appid, or by username for username_loader.
+AccountLoader = Callable[[str], Optional[AccountConfig]]
+ClientT = TypeVar("ClientT", WechatClient, AsyncWechatClient)
+
+
+class BaseWechatClientPool(Generic[ClientT]):
+    # Creates one client per official account on first use. All clients share
+    # the token cache and a single HTTP connection pool, and clients unused
+    # for max_idle seconds (or beyond max_clients) are dropped again.
+    # Loaders are called without holding the pool's lock, so a slow lookup
+    # does not stall requests for other accounts.
+    def __init__(
+        self,
+        cache: Optional[BaseCache] = None,
+        loader: Optional[AccountLoader] = None,
+        limits: Optional[Limits] = None,
+        timeout: Optional[Timeout] = None,
+        http2: Optional[bool] = None,
+        max_clients: Optional[int] = None,
+        max_idle: Optional[float] = None,
+        username_loader: Optional[AccountLoader] = None,
+    ):
+        self._cache = cache if cache is not None else MemoryCache()
+        self._loader = loader
+        self._username_loader = username_loader
+        self._max_clients = max_clients
+        self._max_idle = max_idle
+        self._accounts: Dict[str, AccountConfig] = {}
+        self._usernames: Dict[str, str] = {}
+        self._clients: OrderedDict[str, Tuple[ClientT, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        if http2 is None:
+            http2 = http2_available()
+        self._http_client = self._create_http_client(
+            limits or default_limits(), timeout or default_timeout(), http2
+        )
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def __contains__(self, appid: str) -> bool:
+        return appid in self._clients
+
+    def register(self, account: AccountConfig):
+        with self._lock:
+            self._accounts[account.appid] = account
+            if account.username is not None:
+                self._usernames[account.username] = account.appid
+            # Pick up changed credentials on next use.
+            self._drop(account.appid)
+
+    def unregister(self, appid: str):
+        with self._lock:
+            account = self._accounts.pop(appid, None)
+            if account is not None and account.username is not None:
+                self._usernames.pop(account.username, None)
+            self._drop(appid)
+
+    def get(self, appid: str) -> ClientT:
+        with self._lock:
+            client = self._touch(appid)
+        if client is not None:
+            return client
+        account = self._load(appid)
+        with self._lock:
+            # Another thread may have created the client meanwhile.
+            client = self._touch(appid)
+            if client is None:
+                now = time.monotonic()
+                client = self._create_client(self._accounts.get(appid, account))
+                self._clients[appid] = (client, now)
+                self._evict(now)
+            return client
+
+    def get_by_username(self, username: str) -> ClientT:
+        # Route a push to its account by the ToUserName of the message.
+        with self._lock:
+            appid = self._usernames.get(username)
+        if appid is None and self._username_loader is not None:
+            account = self._username_loader(username)
+            if account is not None:
+                appid = self._remember(account)
+        if appid is None:
+            raise KeyError(f"Unknown official account: {username}")
+        return self.get(appid)
+
+    def evict_idle(self, max_idle: Optional[float] = None) -> int:
+        max_idle = max_idle if max_idle is not None else self._max_idle
+        if max_idle is None:
+            return 0
+        deadline = time.monotonic() - max_idle
+        with self._lock:
+            idle = [
+                appid for appid, (_, used) in self._clients.items() if used < deadline
+            ]
+            for appid in idle:
+                self._drop(appid)
+        return len(idle)
+
+    def _touch(self, appid: str) -> Optional[ClientT]:
+        entry = self._clients.get(appid)
+        if entry is None:
+            return None
+        self._clients[appid] = (entry[0], time.monotonic())
+        self._clients.move_to_end(appid)
+        return entry[0]
+
+    def _load(self, appid: str) -> AccountConfig:
+        with self._lock:
+            account = self._accounts.get(appid)
+        if account is None and self._loader is not None:
+            account = self._loader(appid)
+            if account is not None:
+                self._remember(account)
+        if account is None:
+            raise KeyError(f"Unknown appid: {appid}")
+        return account
+
+    def _remember(self, account: AccountConfig) -> str:
+        # Loaded accounts never replace registered ones.
+        with self._lock:
+            account = self._accounts.setdefault(account.appid, account)
+            if account.username is not None:
+                self._usernames.setdefault(account.username, account.appid)
+        return account.appid
+
+    def _evict(self, now: float):
+        if self._max_idle is not None:
+            for appid, (_, used) in list(self._clients.items()):
+                if used >= now - self._max_idle:
+                    break
+                self._drop(appid)
+        if self._max_clients is not None:
+            while len(self._clients) > self._max_clients:
+                self._drop(next(iter(self._clients)))
+
+    def _drop(self, appid: str):
+        entry = self._clients.pop(appid, None)
+        if entry is not None:
+            logger.debug("Evicting client for %s", appid)
+            self._release_client(entry[0])
+
+    def _create_http_client(
+        self, limits: Limits, timeout: Timeout, http2: bool
+    ) -> Union[Client, AsyncClient]:
+        raise NotImplementedError
+
+    def _create_client(self, account: AccountConfig) -> ClientT:
+        raise NotImplementedError
+
+    def _release_client(self, client: ClientT):
+        pass
+
+
+class WechatClientPool(BaseWechatClientPool[WechatClient]):
+    def _create_http_client(self, limits: Limits, timeout: Timeout, http2: bool):
+        return Client(limits=limits, timeout=timeout, http2=http2)
+
+    def _create_client(self, account: AccountConfig) -> WechatClient:
+        return WechatClient(
+            account.appid,
+            account.app_secret,
+            account.app_token,
+            account.encoding_aes_key,
+            self._cache,
+            http_client=self._http_client,
+        )
+
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+        self._http_client.close()
+
+
+class AsyncWechatClientPool(BaseWechatClientPool[AsyncWechatClient]):
+    def _create_http_client(self, limits: Limits, timeout: Timeout, http2: bool):
+        return AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    def _create_client(self, account: AccountConfig) -> AsyncWechatClient:
+        return AsyncWechatClient(
+            account.appid,
+            account.app_secret,
+            account.app_token,
+            account.encoding_aes_key,
+            self._cache,
+            http_client=self._http_client,
+        )
+
+    def _release_client(self, client: AsyncWechatClient):
+        # Tokens live in the shared cache, only the renewal task needs stopping.
+        if client._refresher_task is not None:
+            client._refresher_task.cancel()
+
+    async def aclose(self):
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        await self._http_client.aclose()
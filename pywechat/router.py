@@ -0,0 +1,318 @@
+import asyncio
+import fnmatch
+import logging
+import re
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qsl
+from pydantic import BaseModel
+from .client import AsyncWechatClient
+from .dedup import MessageDeduplicator
+from .deferred import ACK_DEADLINE, BaseReplyQueue
+from .location import LocationStore
+from .models.message import (
+    EncryptedRequestMessage,
+    EventType,
+    LocationEvent,
+    Message,
+    MessageType,
+    TextMessage,
+)
+from .sink import PushArchive
+
+
+logger = logging.getLogger(__name__)
+
+# Handlers may return a reply model, a string sent back as a text message, or
+# None for no reply.
+Reply = Union[Message, str, None]
+Handler = Callable[[BaseModel], Union[Reply, Awaitable[Reply]]]
+
+_ANY = None
+
+
+def _value(value) -> Optional[str]:
+    return getattr(value, "value", value)
+
+
+class MessageRouter:
+    # Handlers are registered per MsgType, per Event and per EventKey (exact or
+    # glob pattern) and compiled into dict lookups on first dispatch. A push is
+    # then routed by at most three dict lookups, most specific first, instead
+    # of a chain of comparisons.
+    def __init__(
+        self,
+        client: AsyncWechatClient,
+        deduplicator: Optional[MessageDeduplicator] = None,
+        reply_queue: Optional[BaseReplyQueue] = None,
+        archive: Optional[PushArchive] = None,
+        locations: Optional[LocationStore] = None,
+    ):
+        # With a reply queue pushes are acknowledged right away and handlers
+        # run later in ReplyWorkers, replying through the customer-service API.
+        # With an archive every push, minus retries, is also buffered there.
+        # With a location store LOCATION events are stored there and only
+        # reach handlers when the user moved beyond its threshold.
+        self._client = client
+        self._deduplicator = deduplicator
+        self.reply_queue = reply_queue
+        self.archive = archive
+        self.locations = locations
+        self._routes: List[Tuple[str, Optional[str], Optional[str], Handler]] = []
+        self._default: Optional[Handler] = None
+        self._table: Optional[Dict[tuple, Handler]] = None
+        self._patterns: Dict[str, List[Tuple[Pattern, Handler]]] = {}
+
+    def message(self, msg_type: Union[MessageType, str]):
+        def decorator(handler: Handler) -> Handler:
+            self.add(handler, _value(msg_type))
+            return handler
+
+        return decorator
+
+    def event(self, event: Union[EventType, str], key: Optional[str] = None):
+        def decorator(handler: Handler) -> Handler:
+            self.add(handler, MessageType.EVENT.value, _value(event), key)
+            return handler
+
+        return decorator
+
+    def default(self, handler: Handler) -> Handler:
+        self._default = handler
+        self._table = None
+        return handler
+
+    def add(
+        self,
+        handler: Handler,
+        msg_type: str,
+        event: Optional[str] = None,
+        key: Optional[str] = None,
+    ):
+        self._routes.append((msg_type, event, key, handler))
+        self._table = None
+
+    def compile(self):
+        table: Dict[tuple, Handler] = {}
+        patterns: Dict[str, List[Tuple[Pattern, Handler]]] = {}
+        for msg_type, event, key, handler in self._routes:
+            if key is not None and any(char in key for char in "*?["):
+                pattern = re.compile(fnmatch.translate(key))
+                patterns.setdefault(event, []).append((pattern, handler))
+            else:
+                table[(msg_type, event, key)] = handler
+        self._table = table
+        self._patterns = patterns
+
+    def resolve(self, message: BaseModel) -> Optional[Handler]:
+        if self._table is None:
+            self.compile()
+        msg_type = _value(getattr(message, "MsgType", None))
+        if msg_type != MessageType.EVENT.value:
+            return self._table.get((msg_type, _ANY, _ANY), self._default)
+        event = _value(getattr(message, "Event", None))
+        key = getattr(message, "EventKey", None)
+        if key is not None:
+            handler = self._table.get((msg_type, event, key))
+            if handler is not None:
+                return handler
+            for pattern, handler in self._patterns.get(event, ()):
+                if pattern.match(key):
+                    return handler
+        handler = self._table.get((msg_type, event, _ANY))
+        if handler is None:
+            handler = self._table.get((msg_type, _ANY, _ANY), self._default)
+        return handler
+
+    async def dispatch(self, message: BaseModel) -> Optional[BaseModel]:
+        handler = self.resolve(message)
+        if handler is None:
+            return None
+        metrics = self._client.metrics
+        started = time.perf_counter() if metrics.enabled else 0.0
+        reply = handler(message)
+        if asyncio.iscoroutine(reply):
+            reply = await reply
+        if metrics.enabled:
+            _record(metrics, "router.handler", started)
+        if isinstance(reply, str):
+            reply = TextMessage(
+                ToUserName=message.FromUserName,
+                FromUserName=message.ToUserName,
+                CreateTime=int(time.time()),
+                MsgType=MessageType.TEXT,
+                Content=reply,
+            )
+        return reply
+
+    def verify(
+        self, signature: str, timestamp: str, nonce: str, echostr: str
+    ) -> Optional[str]:
+        # URL verification WeChat performs when the push endpoint is set up.
+        verifier = self._client.signature_verifier
+        if verifier.check_request(signature, timestamp, nonce, track_nonce=False):
+            return echostr
+        return None
+
+    async def handle(
+        self,
+        body: bytes,
+        signature: str,
+        timestamp: str,
+        nonce: str,
+        msg_signature: Optional[str] = None,
+    ) -> Optional[str]:
+        # Returns the response body, or None when the request is not genuine.
+        started = time.monotonic()
+        metrics = self._client.metrics
+        # Forged or replayed requests are turned away before any parsing.
+        # WeChat retries reuse the query string: with a deduplicator a seen
+        # nonce is let through as a retry and the deduplicator decides, without
+        # one the nonce is forgotten again when handling fails, so the retry
+        # of a failed push is accepted.
+        mark = time.perf_counter() if metrics.enabled else 0.0
+        verifier = self._client.signature_verifier
+        retry = self._deduplicator is not None and verifier.seen(nonce)
+        if not verifier.check_request(
+            signature, timestamp, nonce, track_nonce=not retry
+        ):
+            return None
+        if retry:
+            verifier.stats.retries += 1
+        try:
+            return await self._handle(
+                body, timestamp, nonce, msg_signature, started, mark
+            )
+        except BaseException:
+            if not retry:
+                verifier.forget(nonce)
+            raise
+
+    async def _handle(
+        self,
+        body: bytes,
+        timestamp: str,
+        nonce: str,
+        msg_signature: Optional[str],
+        started: float,
+        mark: float,
+    ) -> Optional[str]:
+        metrics = self._client.metrics
+        if metrics.enabled:
+            mark = _record(metrics, "signature.check", mark)
+        message = await self._client.axml_to_message(body)
+        if metrics.enabled:
+            mark = _record(metrics, "message.parse", mark)
+        encrypted = isinstance(message, EncryptedRequestMessage)
+        if encrypted:
+            if msg_signature is None or not self._client.check_signature(
+                msg_signature, timestamp, nonce, message.Encrypt
+            ):
+                return None
+            message = await self._client.adecrypt_message(message)
+            if metrics.enabled:
+                _record(metrics, "message.decrypt", mark)
+
+        async def respond(message: BaseModel) -> Optional[str]:
+            if self.archive is not None:
+                await self.archive.put(message)
+            if (
+                self.locations is not None
+                and isinstance(message, LocationEvent)
+                and not self.locations.record(message)
+            ):
+                return None
+            if self.reply_queue is not None:
+                if not await self.reply_queue.put(message):
+                    # Fail the request so WeChat retries the push later.
+                    raise Exception("Reply queue is full")
+                if time.monotonic() - started > ACK_DEADLINE:
+                    self.reply_queue.stats.ack_misses += 1
+                return None
+            reply = await self.dispatch(message)
+            mark = time.perf_counter() if metrics.enabled else 0.0
+            if reply is None:
+                return None
+            if encrypted:
+                reply = await self._client.aencrypt_message(reply)
+            content = self._client.message_to_xml(reply)
+            if metrics.enabled:
+                _record(metrics, "message.encrypt", mark)
+            return content
+
+        if self._deduplicator is not None:
+            content = await self._deduplicator.process(message, respond)
+        else:
+            content = await respond(message)
+        return "success" if content is None else content
+
+    async def __call__(self, scope, receive, send):
+        # Minimal ASGI app: GET answers URL verification, POST handles pushes.
+        if scope["type"] != "http":
+            return
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        status, content_type, content = 400, b"text/plain", "Invalid Signature"
+        try:
+            if scope["method"] == "GET":
+                echostr = self.verify(
+                    query.get("signature", ""),
+                    query.get("timestamp", ""),
+                    query.get("nonce", ""),
+                    query.get("echostr", ""),
+                )
+                if echostr is not None:
+                    status, content = 200, echostr
+            elif scope["method"] == "POST":
+                body = await _read_body(receive)
+                reply = await self.handle(
+                    body,
+                    query.get("signature", ""),
+                    query.get("timestamp", ""),
+                    query.get("nonce", ""),
+                    query.get("msg_signature"),
+                )
+                if reply is not None:
+                    status, content = 200, reply
+                    if reply != "success":
+                        content_type = b"application/xml"
+            else:
+                status, content = 405, "Method Not Allowed"
+        except Exception:
+            logger.exception("Failed to handle push")
+            status, content = 500, "Internal Server Error"
+        body = content.encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", content_type),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _record(metrics, name: str, started: float) -> float:
+    now = time.perf_counter()
+    metrics.timing(name, now - started)
+    return now
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
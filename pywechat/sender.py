@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Optional,
+    TypeVar,
+    Union,
+)
+from httpx import ConnectError, ConnectTimeout, PoolTimeout, TransportError
+from .client import AsyncWechatClient
+
+
+logger = logging.getLogger(__name__)
+
+CUSTOM_SEND_URL = "https://api.weixin.qq.com/cgi-bin/message/custom/send"
+TEMPLATE_SEND_URL = "https://api.weixin.qq.com/cgi-bin/message/template/send"
+
+# 系统繁忙 / 接口调用超过限制: worth retrying after a pause. Token errors are
+# already recovered by AsyncWechatClient.request.
+RETRY_ERRCODES = frozenset([-1, 45009])
+# Failures before the request was sent. Anything later may have delivered the
+# message already, so it is reported instead of sent twice.
+RETRY_ERRORS = (ConnectError, ConnectTimeout, PoolTimeout)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so they are served in arrival order.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    # Token buckets per appid and per (appid, API). Share one instance between
+    # senders that talk to the same accounts.
+    def __init__(
+        self,
+        appid_rate: Optional[float] = None,
+        api_rates: Optional[Dict[str, float]] = None,
+    ):
+        self._appid_rate = appid_rate
+        self._api_rates = api_rates or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, key: str, rate: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate)
+        return bucket
+
+    async def acquire(self, appid: str, url: str):
+        if self._appid_rate is not None:
+            await self._bucket(appid, self._appid_rate).acquire()
+        rate = self._api_rates.get(url)
+        if rate is not None:
+            await self._bucket(f"{appid}:{url}", rate).acquire()
+
+
+@dataclass
+class SendResult(Generic[T]):
+    recipient: T
+    ok: bool
+    errcode: Optional[int] = None
+    errmsg: Optional[str] = None
+    attempts: int = 0
+    data: Optional[dict] = None
+    # The request was sent but no answer was read, e.g. a read timeout, so
+    # the message may or may not have been delivered.
+    unknown: bool = False
+
+
+@dataclass
+class SenderStats:
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    # Failed sends whose outcome is unknown, see SendResult.unknown.
+    unknown: int = 0
+    errcodes: Dict[int, int] = field(default_factory=dict)
+
+
+class BulkSender:
+    # Sends one API call per recipient with at most `concurrency` calls in
+    # flight. Recipients are pulled lazily and results are yielded as they
+    # complete, so memory stays flat for any number of recipients.
+    def __init__(
+        self,
+        client: AsyncWechatClient,
+        concurrency: int = 20,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self._client = client
+        self._concurrency = concurrency
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self.stats = SenderStats()
+
+    async def send(
+        self,
+        url: str,
+        recipients: Union[Iterable[T], AsyncIterable[T]],
+        build: Callable[[T], Dict[str, Any]],
+    ) -> AsyncIterator[SendResult[T]]:
+        iterator = _aiter(recipients)
+        lock = asyncio.Lock()
+        results: asyncio.Queue = asyncio.Queue(maxsize=self._concurrency * 2)
+
+        async def worker():
+            error = None
+            try:
+                while True:
+                    async with lock:
+                        try:
+                            recipient = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    await results.put(await self._send_one(url, recipient, build))
+            except Exception as e:
+                error = e
+            await results.put(_WorkerDone(error))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self._concurrency)]
+        try:
+            remaining = len(workers)
+            while remaining:
+                result = await results.get()
+                if isinstance(result, _WorkerDone):
+                    if result.error is not None:
+                        raise result.error
+                    remaining -= 1
+                    continue
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def send_custom_messages(
+        self,
+        recipients: Union[Iterable[T], AsyncIterable[T]],
+        build: Callable[[T], Dict[str, Any]],
+    ) -> AsyncIterator[SendResult[T]]:
+        # build returns the message/custom/send body, e.g.
+        # {"touser": openid, "msgtype": "text", "text": {"content": "..."}}
+        return self.send(CUSTOM_SEND_URL, recipients, build)
+
+    def send_template_messages(
+        self,
+        recipients: Union[Iterable[T], AsyncIterable[T]],
+        build: Callable[[T], Dict[str, Any]],
+    ) -> AsyncIterator[SendResult[T]]:
+        # build returns the message/template/send body, e.g.
+        # {"touser": openid, "template_id": "...", "data": {...}}
+        return self.send(TEMPLATE_SEND_URL, recipients, build)
+
+    async def _send_one(
+        self, url: str, recipient: T, build: Callable[[T], Dict[str, Any]]
+    ) -> SendResult[T]:
+        body = build(recipient)
+        attempts = 0
+        while True:
+            attempts += 1
+            await self._rate_limiter.acquire(self._client._appid, url)
+            retry = False
+            try:
+                response = await self._client.request("POST", url, json=body)
+                data = response.json()
+                errcode = data.get("errcode", 0)
+                errmsg = data.get("errmsg")
+            except RETRY_ERRORS as e:
+                data, errcode, errmsg = None, None, str(e)
+                retry = True
+            except (TransportError, ValueError) as e:
+                logger.warning(f"Unknown outcome sending to {recipient}: {e!r}")
+                self.stats.failed += 1
+                self.stats.unknown += 1
+                return SendResult(
+                    recipient, False, None, str(e), attempts, None, unknown=True
+                )
+            if errcode == 0:
+                self.stats.sent += 1
+                return SendResult(recipient, True, 0, errmsg, attempts, data)
+            if errcode is not None:
+                self.stats.errcodes[errcode] = self.stats.errcodes.get(errcode, 0) + 1
+                retry = errcode in RETRY_ERRCODES
+            if retry and attempts <= self._max_retries:
+                self.stats.retries += 1
+                await asyncio.sleep(self._delay(attempts))
+                continue
+            logger.warning(f"Failed to send to {recipient}: {errcode} {errmsg}")
+            self.stats.failed += 1
+            return SendResult(recipient, False, errcode, errmsg, attempts, data)
+
+    def _delay(self, attempts: int) -> float:
+        delay = min(self._max_backoff, self._backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+
+class _WorkerDone:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Optional[Exception]):
+        self.error = error
+
+
+async def _aiter(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,51 @@
+# Load test a running push endpoint with signed pushes of every type:
+#
+#     APPID=... APPTOKEN=... ENCODING_AES_KEY=... \
+#         python -m pywechat.simulator http://127.0.0.1:8000/push \
+#         --rate 500 --duration 10 --encrypted 0.5
+import argparse
+import asyncio
+import json
+import os
+from typing import List, Optional
+from .load import http_sender, run_load
+from .pushes import PushFactory, sample_messages
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m pywechat.simulator")
+    parser.add_argument("url", help="push endpoint, e.g. http://127.0.0.1:8000/push")
+    parser.add_argument("--rate", type=float, default=100, help="pushes per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--encrypted", type=float, default=0.0, help="share of AES pushes, 0 to 1"
+    )
+    parser.add_argument(
+        "--kinds",
+        default=",".join(sample_messages()),
+        help="comma separated message kinds to send",
+    )
+    parser.add_argument("--appid", default=os.environ.get("APPID"))
+    parser.add_argument("--app-token", default=os.environ.get("APPTOKEN"))
+    parser.add_argument("--aes-key", default=os.environ.get("ENCODING_AES_KEY"))
+    args = parser.parse_args(argv)
+    if not (args.appid and args.app_token and args.aes_key):
+        parser.error("set APPID, APPTOKEN and ENCODING_AES_KEY or pass them")
+    factory = PushFactory(
+        args.app_token, args.aes_key, args.appid, args.kinds.split(",")
+    )
+    report = asyncio.run(
+        run_load(
+            http_sender(args.url),
+            factory.pushes(args.encrypted),
+            args.rate,
+            args.duration,
+            args.concurrency,
+        )
+    )
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+import asyncio
+import json
+import random
+import secrets
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl
+
+
+# Errcodes the mock answers with, as WeChat does.
+SYSTEM_BUSY = -1
+INVALID_CREDENTIAL = 40001
+INVALID_OPENID = 40003
+INVALID_MEDIA_ID = 40007
+INVALID_APPID = 40013
+INVALID_ACCESS_TOKEN = 40014
+INVALID_CODE = 40029
+INVALID_REFRESH_TOKEN = 40030
+ACCESS_TOKEN_EXPIRED = 42001
+API_FREQ_OUT_OF_LIMIT = 45009
+
+OAUTH_TOKEN_TTL = 7200
+# OAuth refresh tokens stay valid for 30 days.
+REFRESH_TOKEN_TTL = 30 * 24 * 3600
+
+# (status, headers, body) of a response.
+Response = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+Handler = Callable[[Dict[str, str], Dict[str, str], bytes], Response]
+
+
+@dataclass
+class MockAPIStats:
+    # Requests per path, e.g. calls["/cgi-bin/user/get"].
+    calls: Counter = field(default_factory=Counter)
+    # Errors injected through errcodes or error_rate.
+    injected_errors: int = 0
+    rate_limited: int = 0
+
+
+class MockWechatAPI:
+    # In-process stand-in for the api.weixin.qq.com endpoints pywechat uses,
+    # as an ASGI app. Route a client to it through its transport:
+    #
+    #     api = MockWechatAPI(latency=0.02, rate_limit=200)
+    #     http_client = httpx.AsyncClient(transport=httpx.ASGITransport(api))
+    #     client = AsyncWechatClient(api.appid, api.app_secret, ...,
+    #                                http_client=http_client)
+    #
+    # WechatClient takes httpx.Client(transport=api.transport()). Every
+    # response is delayed by latency (plus up to jitter) seconds. errcodes
+    # maps paths to an errcode they always fail with, error_rate fails that
+    # share of all calls with -1, and each path allows rate_limit calls per
+    # second before answering 45009.
+    def __init__(
+        self,
+        appid: str = "wx0000000000000000",
+        app_secret: str = "secret",
+        followers: int = 1000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        errcodes: Optional[Mapping[str, int]] = None,
+        error_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        token_ttl: int = 7200,
+        seed: Optional[int] = None,
+    ):
+        self.appid = appid
+        self.app_secret = app_secret
+        self.latency = latency
+        self.jitter = jitter
+        self.errcodes: Dict[str, int] = dict(errcodes or {})
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.stats = MockAPIStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._openids = [f"o{i:027d}" for i in range(followers)]
+        self._positions = {openid: i for i, openid in enumerate(self._openids)}
+        # token -> expiry, or (openid, expiry) for OAuth, in the order issued.
+        # Expired tokens are pruned from the front whenever new ones are
+        # handed out, so long load runs do not grow them without bound.
+        self._tokens: OrderedDict[str, float] = OrderedDict()
+        self._oauth_tokens: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self._refresh_tokens: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self._media: Dict[str, Tuple[bytes, bytes]] = {}
+        self._menu: Optional[dict] = None
+        self._templates: Dict[str, dict] = {
+            "tpl-1": {"template_id": "tpl-1", "title": "Order", "content": "{{a}}"}
+        }
+        self._msgid = 0
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._routes: Dict[Tuple[str, str], Handler] = {
+            ("GET", "/cgi-bin/token"): self._token,
+            ("GET", "/cgi-bin/ticket/getticket"): self._ticket,
+            ("GET", "/cgi-bin/user/get"): self._followers,
+            ("GET", "/cgi-bin/user/info"): self._user_info,
+            ("POST", "/cgi-bin/user/info/batchget"): self._batchget,
+            ("POST", "/cgi-bin/user/info/updateremark"): self._ok,
+            ("POST", "/cgi-bin/menu/create"): self._menu_create,
+            ("GET", "/cgi-bin/menu/get"): self._menu_get,
+            ("GET", "/cgi-bin/menu/delete"): self._menu_delete,
+            ("POST", "/cgi-bin/media/upload"): self._media_upload,
+            ("GET", "/cgi-bin/media/get"): self._media_get,
+            ("POST", "/cgi-bin/qrcode/create"): self._qrcode,
+            ("POST", "/cgi-bin/message/custom/send"): self._ok,
+            ("POST", "/cgi-bin/message/custom/typing"): self._ok,
+            ("POST", "/cgi-bin/message/template/send"): self._template_send,
+            ("GET", "/cgi-bin/template/get_all_private_template"): self._templates_list,
+            ("POST", "/cgi-bin/template/del_private_template"): self._template_delete,
+            ("GET", "/sns/oauth2/access_token"): self._oauth_token,
+            ("GET", "/sns/oauth2/refresh_token"): self._oauth_refresh,
+            ("GET", "/sns/userinfo"): self._oauth_userinfo,
+        }
+
+    @property
+    def openids(self) -> List[str]:
+        return self._openids
+
+    def expire_tokens(self):
+        # Expires every access token handed out, to exercise token replay.
+        with self._lock:
+            self._tokens = OrderedDict.fromkeys(self._tokens, 0.0)
+
+    def handle(
+        self, method: str, path: str, query: Dict[str, str], headers: Dict, body: bytes
+    ) -> Response:
+        # One request without the latency, shared by both transports.
+        self.stats.calls[path] += 1
+        handler = self._routes.get((method, path))
+        if handler is None:
+            return 404, [(b"content-type", b"text/plain")], b"Not Found"
+        if not self._allow(path):
+            self.stats.rate_limited += 1
+            return _error(API_FREQ_OUT_OF_LIMIT, "api freq out of limit")
+        errcode = self.errcodes.get(path)
+        if (
+            errcode is None
+            and self.error_rate
+            and self._random.random() < (self.error_rate)
+        ):
+            errcode = SYSTEM_BUSY
+        if errcode is not None:
+            self.stats.injected_errors += 1
+            return _error(errcode, "injected by MockWechatAPI")
+        if path.startswith("/cgi-bin/") and path != "/cgi-bin/token":
+            expiry = self._tokens.get(query.get("access_token", ""))
+            if expiry is None:
+                return _error(INVALID_ACCESS_TOKEN, "invalid access_token")
+            if expiry <= time.time():
+                return _error(ACCESS_TOKEN_EXPIRED, "access_token expired")
+        return handler(query, headers, body)
+
+    def transport(self):
+        # Transport for a sync httpx.Client, latency is slept on its thread.
+        import httpx
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            delay = self._delay()
+            if delay:
+                time.sleep(delay)
+            status, headers, content = self.handle(
+                request.method,
+                request.url.path,
+                dict(request.url.params),
+                dict(request.headers),
+                request.read(),
+            )
+            return httpx.Response(status, headers=headers, content=content)
+
+        return httpx.MockTransport(handler)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        status, headers, content = self.handle(
+            scope["method"],
+            scope["path"],
+            dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))),
+            {
+                name.decode("latin-1"): value.decode("latin-1")
+                for name, value in scope["headers"]
+            },
+            b"".join(chunks),
+        )
+        headers = headers + [(b"content-length", str(len(content)).encode())]
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": content})
+
+    def _delay(self) -> float:
+        if self.jitter:
+            return self.latency + self._random.uniform(0, self.jitter)
+        return self.latency
+
+    def _allow(self, path: str) -> bool:
+        # Token bucket per path, refilled at rate_limit per second.
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(path, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            allowed = tokens >= 1
+            self._buckets[path] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def _profile(self, openid: str) -> dict:
+        return {
+            "subscribe": 1,
+            "openid": openid,
+            "language": "zh_CN",
+            "subscribe_time": 1700000000 + self._positions.get(openid, 0),
+        }
+
+    def _token(self, query, headers, body) -> Response:
+        if query.get("appid") != self.appid:
+            return _error(INVALID_APPID, "invalid appid")
+        if query.get("secret") != self.app_secret:
+            return _error(INVALID_CREDENTIAL, "invalid appsecret")
+        token = secrets.token_hex(16)
+        now = time.time()
+        with self._lock:
+            _prune(self._tokens, lambda expiry: expiry, now)
+            self._tokens[token] = now + self.token_ttl
+        return _json({"access_token": token, "expires_in": self.token_ttl})
+
+    def _ticket(self, query, headers, body) -> Response:
+        return _json(
+            {
+                "errcode": 0,
+                "errmsg": "ok",
+                "ticket": secrets.token_hex(43),
+                "expires_in": 7200,
+            }
+        )
+
+    def _followers(self, query, headers, body) -> Response:
+        start = query.get("next_openid")
+        index = self._positions[start] + 1 if start in self._positions else 0
+        page = self._openids[index : index + 10000]
+        return _json(
+            {
+                "total": len(self._openids),
+                "count": len(page),
+                "data": {"openid": page},
+                "next_openid": page[-1] if page else "",
+            }
+        )
+
+    def _user_info(self, query, headers, body) -> Response:
+        openid = query.get("openid")
+        if openid not in self._positions:
+            return _error(INVALID_OPENID, "invalid openid")
+        return _json(self._profile(openid))
+
+    def _batchget(self, query, headers, body) -> Response:
+        users = json.loads(body)["user_list"]
+        if len(users) > 100:
+            return _error(45008, "data too long")
+        profiles = [
+            self._profile(user["openid"])
+            for user in users
+            if user["openid"] in self._positions
+        ]
+        return _json({"user_info_list": profiles})
+
+    def _menu_create(self, query, headers, body) -> Response:
+        self._menu = json.loads(body)
+        return _json({"errcode": 0, "errmsg": "ok"})
+
+    def _menu_get(self, query, headers, body) -> Response:
+        if self._menu is None:
+            return _error(46003, "menu no exist")
+        return _json({"menu": self._menu})
+
+    def _menu_delete(self, query, headers, body) -> Response:
+        self._menu = None
+        return _json({"errcode": 0, "errmsg": "ok"})
+
+    def _media_upload(self, query, headers, body) -> Response:
+        # Only the single "media" part pywechat sends is understood.
+        boundary = headers.get("content-type", "").partition("boundary=")[2]
+        head, _, rest = body.partition(b"\r\n\r\n")
+        content = rest.rpartition(f"\r\n--{boundary}--".encode())[0]
+        content_type = b"application/octet-stream"
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-type:"):
+                content_type = line.split(b":", 1)[1].strip()
+        media_id = secrets.token_urlsafe(48)
+        self._media[media_id] = (content_type, content)
+        return _json(
+            {
+                "type": query.get("type", "image"),
+                "media_id": media_id,
+                "created_at": int(time.time()),
+            }
+        )
+
+    def _media_get(self, query, headers, body) -> Response:
+        media = self._media.get(query.get("media_id", ""))
+        if media is None:
+            return _error(INVALID_MEDIA_ID, "invalid media_id")
+        return 200, [(b"content-type", media[0])], media[1]
+
+    def _qrcode(self, query, headers, body) -> Response:
+        data = json.loads(body)
+        ticket = secrets.token_urlsafe(32)
+        result = {"ticket": ticket, "url": f"http://weixin.qq.com/q/{ticket[:22]}"}
+        if "expire_seconds" in data:
+            result["expire_seconds"] = data["expire_seconds"]
+        return _json(result)
+
+    def _template_send(self, query, headers, body) -> Response:
+        data = json.loads(body)
+        if data.get("template_id") not in self._templates:
+            return _error(40037, "invalid template_id")
+        with self._lock:
+            self._msgid += 1
+            msgid = self._msgid
+        return _json({"errcode": 0, "errmsg": "ok", "msgid": msgid})
+
+    def _templates_list(self, query, headers, body) -> Response:
+        return _json({"template_list": list(self._templates.values())})
+
+    def _template_delete(self, query, headers, body) -> Response:
+        self._templates.pop(json.loads(body).get("template_id"), None)
+        return _json({"errcode": 0, "errmsg": "ok"})
+
+    def _oauth_token(self, query, headers, body) -> Response:
+        # Any code authorizes a follower picked from it, "o..." codes are
+        # taken as the openid itself.
+        code = query.get("code", "")
+        if query.get("secret") != self.app_secret or not code:
+            return _error(INVALID_CODE, "invalid code")
+        if code in self._positions:
+            openid = code
+        else:
+            openid = self._openids[zlib.crc32(code.encode()) % len(self._openids)]
+        refresh_token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            _prune(self._refresh_tokens, lambda entry: entry[1], now)
+            self._refresh_tokens[refresh_token] = (openid, now + REFRESH_TOKEN_TTL)
+        return self._oauth_access_token(openid, refresh_token)
+
+    def _oauth_refresh(self, query, headers, body) -> Response:
+        refresh_token = query.get("refresh_token", "")
+        entry = self._refresh_tokens.get(refresh_token)
+        if entry is None or entry[1] <= time.time():
+            return _error(INVALID_REFRESH_TOKEN, "invalid refresh_token")
+        return self._oauth_access_token(entry[0], refresh_token)
+
+    def _oauth_access_token(self, openid: str, refresh_token: str) -> Response:
+        access_token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            _prune(self._oauth_tokens, lambda entry: entry[1], now)
+            self._oauth_tokens[access_token] = (openid, now + OAUTH_TOKEN_TTL)
+        return _json(
+            {
+                "access_token": access_token,
+                "expires_in": OAUTH_TOKEN_TTL,
+                "refresh_token": refresh_token,
+                "openid": openid,
+                "scope": "snsapi_userinfo",
+            }
+        )
+
+    def _oauth_userinfo(self, query, headers, body) -> Response:
+        openid, expiry = self._oauth_tokens.get(
+            query.get("access_token", ""), (None, 0.0)
+        )
+        if openid is None or openid != query.get("openid") or expiry <= time.time():
+            return _error(INVALID_CREDENTIAL, "invalid credential")
+        return _json({"openid": openid, "nickname": f"user {openid[-6:]}", "sex": 0})
+
+    def _ok(self, query, headers, body) -> Response:
+        return _json({"errcode": 0, "errmsg": "ok"})
+
+
+def _prune(tokens: OrderedDict, expiry_of: Callable, now: float):
+    # Tokens of one kind share a TTL, so the oldest expire first.
+    while tokens and expiry_of(next(iter(tokens.values()))) <= now:
+        tokens.popitem(last=False)
+
+
+def _json(data: dict) -> Response:
+    content = json.dumps(data, ensure_ascii=False).encode()
+    return 200, [(b"content-type", b"application/json; encoding=utf-8")], content
+
+
+def _error(errcode: int, errmsg: str) -> Response:
+    return _json({"errcode": errcode, "errmsg": errmsg})
@@ -0,0 +1,110 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Iterator, List, Optional
+from .pushes import Push
+
+
+# Sends one push and returns the HTTP status of the answer.
+Sender = Callable[[Push], Awaitable[int]]
+
+
+@dataclass
+class LoadReport:
+    sent: int
+    # Pushes answered with 200.
+    ok: int
+    failed: int
+    seconds: float
+    # Completed pushes per second.
+    throughput: float
+    # Latencies in seconds, measured from when each push was due.
+    p50: float
+    p99: float
+    max: float
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def http_sender(url: str, http_client=None) -> Sender:
+    # POSTs to a running push endpoint, e.g. http://127.0.0.1:8000/push.
+    import httpx
+
+    client = http_client or httpx.AsyncClient(timeout=30)
+
+    async def send(push: Push) -> int:
+        separator = "&" if "?" in url else "?"
+        response = await client.post(f"{url}{separator}{push.query}", content=push.body)
+        return response.status_code
+
+    return send
+
+
+def asgi_sender(app, path: str = "/") -> Sender:
+    # Calls an ASGI app in-process, e.g. a MessageRouter or a FastAPI app.
+    import httpx
+
+    return http_sender(
+        f"http://simulator{path}",
+        httpx.AsyncClient(transport=httpx.ASGITransport(app), timeout=30),
+    )
+
+
+async def run_load(
+    send: Sender,
+    pushes: Iterator[Push],
+    rate: float,
+    duration: float,
+    concurrency: int = 100,
+) -> LoadReport:
+    # Open loop: push i is due at start + i / rate however earlier pushes
+    # are doing, the way WeChat keeps pushing at a slow server. Latency is
+    # taken from the due time, so time spent waiting for one of the
+    # `concurrency` connections counts and a saturated endpoint shows up
+    # as growing latency instead of a lower offered rate.
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failed = 0
+
+    async def one(push: Push, due: float):
+        nonlocal failed
+        async with semaphore:
+            try:
+                status: Optional[int] = await send(push)
+            except Exception:
+                status = None
+        latencies.append(loop.time() - due)
+        if status != 200:
+            failed += 1
+
+    start = loop.time()
+    tasks = set()
+    for i in range(max(1, int(rate * duration))):
+        due = start + i / rate
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(one(next(pushes), due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    seconds = loop.time() - start
+    latencies.sort()
+    return LoadReport(
+        sent=len(latencies),
+        ok=len(latencies) - failed,
+        failed=failed,
+        seconds=seconds,
+        throughput=len(latencies) / seconds if seconds else 0.0,
+        p50=_percentile(latencies, 0.5),
+        p99=_percentile(latencies, 0.99),
+        max=latencies[-1] if latencies else 0.0,
+    )
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,170 @@
+import itertools
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Sequence
+from urllib.parse import urlencode
+from pydantic import BaseModel
+from ..codec import model_to_xml
+from ..crypto import MessageCrypto
+from ..models.message import (
+    ArticleDetail,
+    ArticleList,
+    ArticleMessage,
+    ClickEvent,
+    EncryptedRequestMessage,
+    EventType,
+    ImageDetail,
+    ImageMessage,
+    LocationEvent,
+    MessageType,
+    MusicDetail,
+    MusicMessage,
+    ScanEvent,
+    SubscribeEvent,
+    TextMessage,
+    UnsubscribeEvent,
+    VideoDetail,
+    VideoMessage,
+    ViewEvent,
+    VoiceDetail,
+    VoiceMessage,
+)
+from ..signature import SignatureVerifier
+
+
+_HEADER = dict(ToUserName="gh_0000", FromUserName="o" * 28, CreateTime=1700000000)
+
+
+def _event(cls, event: EventType, **fields) -> BaseModel:
+    return cls(**_HEADER, MsgType=MessageType.EVENT, Event=event, **fields)
+
+
+def sample_messages() -> Dict[str, BaseModel]:
+    # One instance of every model in pywechat.models.message.
+    return {
+        "text": TextMessage(
+            **_HEADER, MsgType=MessageType.TEXT, Content="你好, world" * 8, MsgId=1
+        ),
+        "image": ImageMessage(
+            **_HEADER, MsgType=MessageType.IMAGE, Image=ImageDetail(MediaId="m" * 64)
+        ),
+        "voice": VoiceMessage(
+            **_HEADER, MsgType=MessageType.VOICE, Voice=VoiceDetail(MediaId="m" * 64)
+        ),
+        "video": VideoMessage(
+            **_HEADER,
+            MsgType=MessageType.VIDEO,
+            Video=VideoDetail(MediaId="m" * 64, Title="title", Description="desc"),
+        ),
+        "music": MusicMessage(
+            **_HEADER,
+            MsgType=MessageType.MUSIC,
+            Music=MusicDetail(
+                Title="title",
+                Description="desc",
+                MusicUrl="https://example.com/a.mp3",
+                HQMusicUrl="https://example.com/a.flac",
+                ThumbMediaId="m" * 64,
+            ),
+        ),
+        "news": ArticleMessage(
+            **_HEADER,
+            MsgType=MessageType.ARTICLE,
+            ArticleCount=3,
+            Articles=ArticleList(
+                item=[
+                    ArticleDetail(
+                        Title=f"title {i}",
+                        Description="desc",
+                        PicUrl="https://example.com/a.png",
+                        Url="https://example.com/",
+                    )
+                    for i in range(3)
+                ]
+            ),
+        ),
+        "subscribe": _event(SubscribeEvent, EventType.SUBSCRIBE),
+        "unsubscribe": _event(UnsubscribeEvent, EventType.UNSUBSCRIBE),
+        "scan": _event(ScanEvent, EventType.SCAN, EventKey="123", Ticket="t" * 32),
+        "location": _event(
+            LocationEvent,
+            EventType.LOCATION,
+            Latitude=23.137466,
+            Longitude=113.352425,
+            Precision=119.385040,
+        ),
+        "click": _event(ClickEvent, EventType.CLICK, EventKey="menu_help"),
+        "view": _event(ViewEvent, EventType.VIEW, EventKey="https://example.com/"),
+    }
+
+
+@dataclass
+class Push:
+    # Query string and body of one push, as WeChat POSTs it.
+    kind: str
+    encrypted: bool
+    query: str
+    body: bytes
+
+
+class PushFactory:
+    # Produces correctly signed pushes an account's push endpoint accepts:
+    # fresh timestamps, unique nonces and a distinct sender or MsgId per
+    # push, so replay protection and deduplication let each one through.
+    def __init__(
+        self,
+        app_token: str,
+        encoding_aes_key: str,
+        appid: str,
+        kinds: Optional[Sequence[str]] = None,
+    ):
+        self._verifier = SignatureVerifier(app_token)
+        self._crypto = MessageCrypto(encoding_aes_key, appid)
+        messages = sample_messages()
+        self._messages = [(kind, messages[kind]) for kind in kinds or messages]
+        self._nonce_prefix = secrets.token_hex(4)
+        self._counter = itertools.count(1)
+
+    def push(
+        self,
+        message: BaseModel,
+        encrypted: bool = False,
+        kind: str = "",
+        sender: Optional[str] = None,
+    ) -> Push:
+        # sender pins the FromUserName, e.g. for a stream of one user's events.
+        counter = next(self._counter)
+        update = {
+            "FromUserName": sender or f"o{counter:027d}",
+            "CreateTime": int(time.time()),
+        }
+        if "MsgId" in type(message).model_fields:
+            update["MsgId"] = counter
+        message = message.model_copy(update=update)
+        timestamp = str(int(time.time()))
+        nonce = f"{self._nonce_prefix}{counter}"
+        query = {
+            "signature": self._verifier.sign(timestamp, nonce),
+            "timestamp": timestamp,
+            "nonce": nonce,
+            "openid": message.FromUserName,
+        }
+        xml = model_to_xml(message)
+        if encrypted:
+            encrypt = self._crypto.encrypt(xml)
+            xml = model_to_xml(
+                EncryptedRequestMessage(ToUserName=message.ToUserName, Encrypt=encrypt)
+            )
+            query["encrypt_type"] = "aes"
+            query["msg_signature"] = self._verifier.sign(timestamp, nonce, encrypt)
+        return Push(kind, encrypted, urlencode(query), xml.encode())
+
+    def pushes(self, encrypted_ratio: float = 0.0) -> Iterator[Push]:
+        # Endless round robin over the message kinds, encrypting the given
+        # share of pushes, spread evenly.
+        encrypted_so_far = 0
+        for count, (kind, message) in enumerate(itertools.cycle(self._messages), 1):
+            encrypted = encrypted_so_far < count * encrypted_ratio
+            encrypted_so_far += encrypted
+            yield self.push(message, encrypted, kind)
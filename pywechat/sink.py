@@ -0,0 +1,249 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from .deferred import ACK_DEADLINE
+
+
+logger = logging.getLogger(__name__)
+
+# What PushArchive.put() does when the buffer is full: drop the push, or wait
+# for the writer to make room (up to block_timeout, then drop).
+DROP = "drop"
+BLOCK = "block"
+# put() runs on the reply path, so a blocked push must give up well before
+# WeChat stops waiting for the reply.
+BLOCK_TIMEOUT = 1.0
+
+_STOP = object()
+
+
+class BaseEventSink:
+    # Destination of archived pushes. write() and close() run on a worker
+    # thread, one call at a time.
+    def write(self, records: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JSONLSink(BaseEventSink):
+    # Appends one JSON object per line to a file.
+    def __init__(self, path: str):
+        self._path = path
+        self._file = None
+
+    def write(self, records: List[Dict[str, Any]]):
+        if self._file is None:
+            self._file = self._open()
+        self._file.write(
+            "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        )
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        return open(self._path, "a", encoding="utf-8")
+
+
+class GzipNDJSONSink(JSONLSink):
+    # JSONL in a gzip file. Every batch is flushed to a sync point, so what
+    # was written survives a crash and the file stays readable by gzip.
+    def __init__(self, path: str, compresslevel: int = 6):
+        super().__init__(path)
+        self._compresslevel = compresslevel
+
+    def _open(self):
+        return gzip.open(
+            self._path, "at", encoding="utf-8", compresslevel=self._compresslevel
+        )
+
+
+class ParquetSink(BaseEventSink):
+    # Writes every batch as its own Parquet file in a directory, which
+    # readers treat as one dataset. Nested fields (Image, Articles, ...) are
+    # stored as JSON strings so all files share flat columns.
+    def __init__(self, directory: str, prefix: str = "pushes"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "ParquetSink requires pyarrow, install it with `pip install pyarrow`"
+            )
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._directory = directory
+        self._prefix = prefix
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, records: List[Dict[str, Any]]):
+        columns = sorted({key for record in records for key in record})
+        table = self._pyarrow.table(
+            {
+                column: [_flat(record.get(column)) for record in records]
+                for column in columns
+            }
+        )
+        self._sequence += 1
+        name = f"{self._prefix}-{int(time.time() * 1000)}-{self._sequence:06d}.parquet"
+        self._parquet.write_table(table, os.path.join(self._directory, name))
+
+
+def _flat(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+@dataclass
+class ArchiveStats:
+    enqueued: int = 0
+    # Pushes not archived because the buffer was full.
+    dropped: int = 0
+    # Time put() waited for room under the block policy.
+    blocked_seconds: float = 0.0
+    written: int = 0
+    batches: int = 0
+    # Pushes lost because the sink raised.
+    failed: int = 0
+    write_seconds: float = 0.0
+
+
+class PushArchive:
+    # Buffers decoded pushes in a bounded in-memory queue and hands them to a
+    # sink in batches of batch_size, or whatever arrived within
+    # flush_interval seconds. Serializing and writing happen on an executor
+    # thread, put() only enqueues, so archiving adds no I/O to the reply
+    # path. Pass it to MessageRouter(archive=...), which archives every push
+    # after deduplication.
+    def __init__(
+        self,
+        sink: BaseEventSink,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        policy: str = DROP,
+        block_timeout: Optional[float] = BLOCK_TIMEOUT,
+        executor: Optional[Executor] = None,
+    ):
+        if policy not in (DROP, BLOCK):
+            raise Exception(f"Unknown buffer policy: {policy}")
+        if policy == BLOCK and (block_timeout is None or block_timeout >= ACK_DEADLINE):
+            raise Exception(
+                f"block_timeout must be below the {ACK_DEADLINE}s reply deadline"
+            )
+        self._sink = sink
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._policy = policy
+        self._block_timeout = block_timeout
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = ArchiveStats()
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        # Also started by the first put(), the queue belongs to that loop.
+        if self._task is None:
+            self._queue = asyncio.Queue(self._max_size)
+            self._batch_ready = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def put(self, message: BaseModel) -> bool:
+        # False when the push was dropped.
+        self.start()
+        item = (time.time(), message)
+        if self._policy == DROP:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.stats.dropped += 1
+                return False
+        elif not self._queue.full():
+            self._queue.put_nowait(item)
+        else:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._queue.put(item), self._block_timeout)
+            except asyncio.TimeoutError:
+                self.stats.dropped += 1
+                return False
+            finally:
+                self.stats.blocked_seconds += time.monotonic() - started
+        self.stats.enqueued += 1
+        if self._queue.qsize() >= self._batch_size - 1:
+            self._batch_ready.set()
+        return True
+
+    async def stop(self):
+        # Writes what is buffered and closes the sink.
+        task, self._task = self._task, None
+        if task is None:
+            return
+        await self._queue.put(_STOP)
+        self._batch_ready.set()
+        await task
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._sink.close
+        )
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            first = await queue.get()
+            if first is not _STOP and queue.qsize() < self._batch_size - 1:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), self._flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            batch = [first]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            stop = _STOP in batch
+            batch = [item for item in batch if item is not _STOP]
+            if batch:
+                await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: List[Tuple[float, BaseModel]]):
+        started = time.monotonic()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write_batch, batch
+            )
+            self.stats.written += len(batch)
+            self.stats.batches += 1
+        except Exception:
+            self.stats.failed += len(batch)
+            logger.exception(f"Failed to archive {len(batch)} pushes")
+        self.stats.write_seconds += time.monotonic() - started
+
+    def _write_batch(self, batch: List[Tuple[float, BaseModel]]):
+        self._sink.write(
+            [
+                {"received_at": received_at, **message.model_dump(mode="json")}
+                for received_at, message in batch
+            ]
+        )
@@ -1,8 +1,13 @@
+import base64
 import os
+import httpx
 import pytest
 from dotenv import find_dotenv, load_dotenv
 from pywechat.client import WechatClient, AsyncWechatClient, MemoryCache
 
+# Valid encoding AES key for tests that never talk to WeChat.
+OFFLINE_KEY = base64.b64encode(bytes(range(32))).decode()[:-1]
+
 
 @pytest.fixture(scope="session")
 def wechat_client():
@@ -28,3 +33,34 @@ def async_wechat_client():
         os.getenv("ENCODING_AES_KEY"),
         MemoryCache(),
     )
+
+
+@pytest.fixture
+def offline_key():
+    return OFFLINE_KEY
+
+
+@pytest.fixture
+def offline_client():
+    # Builds WechatClients with the offline key and their own MemoryCache.
+    # Requests go to `transport` (e.g. httpx.MockTransport or a simulator)
+    # when given.
+    def build(appid="appid", app_secret="secret", transport=None, **kwargs):
+        if transport is not None:
+            kwargs["http_client"] = httpx.Client(transport=transport)
+        kwargs.setdefault("cache", MemoryCache())
+        return WechatClient(appid, app_secret, "token", OFFLINE_KEY, **kwargs)
+
+    return build
+
+
+@pytest.fixture
+def offline_async_client():
+    # AsyncWechatClient counterpart of offline_client.
+    def build(appid="appid", app_secret="secret", transport=None, **kwargs):
+        if transport is not None:
+            kwargs["http_client"] = httpx.AsyncClient(transport=transport)
+        kwargs.setdefault("cache", MemoryCache())
+        return AsyncWechatClient(appid, app_secret, "token", OFFLINE_KEY, **kwargs)
+
+    return build
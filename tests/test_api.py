@@ -0,0 +1,126 @@
+import asyncio
+import json
+import httpx
+import pytest
+from pywechat.api.base import WechatAPIError
+from pywechat.cache import MemoryCache
+
+
+def _handler(calls: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/cgi-bin/token":
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+        calls.append(path)
+        if path == "/cgi-bin/user/info/batchget":
+            users = json.loads(request.content)["user_list"]
+            assert len(users) <= 100
+            return httpx.Response(
+                200,
+                json={
+                    "user_info_list": [
+                        {"subscribe": 1, "openid": user["openid"]} for user in users
+                    ]
+                },
+            )
+        if path == "/cgi-bin/qrcode/create":
+            body = json.loads(request.content)
+            assert body["action_name"] == "QR_STR_SCENE"
+            return httpx.Response(
+                200, json={"ticket": "tk", "expire_seconds": 60, "url": "u"}
+            )
+        return httpx.Response(200, json={"errcode": 40003, "errmsg": "invalid openid"})
+
+    return handler
+
+
+def test_sync_api_groups(offline_client):
+    calls = []
+    client = offline_client(transport=httpx.MockTransport(_handler(calls)))
+    openids = [f"o{i}" for i in range(250)]
+    users = client.users.batchget(openids)
+    assert [user.openid for user in users] == openids
+    assert calls.count("/cgi-bin/user/info/batchget") == 3
+    assert client.qrcode.create("scene", expire_seconds=60).ticket == "tk"
+    with pytest.raises(WechatAPIError) as e:
+        client.custom.send_text("bad", "hi")
+    assert e.value.errcode == 40003
+
+
+@pytest.mark.asyncio
+async def test_async_api_groups(offline_async_client):
+    calls = []
+    client = offline_async_client(transport=httpx.MockTransport(_handler(calls)))
+    openids = [f"o{i}" for i in range(1001)]
+    users = await client.users.batchget(openids, concurrency=3)
+    assert [user.openid for user in users] == openids
+    assert calls.count("/cgi-bin/user/info/batchget") == 11
+    ticket = await client.qrcode.create("scene", expire_seconds=60)
+    assert client.qrcode.image_url(ticket.ticket).endswith("ticket=tk")
+    with pytest.raises(WechatAPIError):
+        await client.templates.send("bad", "tpl", {"first": "hi"})
+
+
+def _follower_api(total: int, delay: float, stats: dict):
+    openids = [f"o{i:07d}" for i in range(total)]
+    stats.update(inflight=0, max_inflight=0, pages=0)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/cgi-bin/token":
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+        if path == "/cgi-bin/user/get":
+            stats["pages"] += 1
+            start = request.url.params.get("next_openid")
+            index = openids.index(start) + 1 if start else 0
+            page = openids[index : index + 10000]
+            return httpx.Response(
+                200,
+                json={
+                    "total": total,
+                    "count": len(page),
+                    "data": {"openid": page} if page else None,
+                    "next_openid": page[-1] if page else "",
+                },
+            )
+        stats["inflight"] += 1
+        stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+        await asyncio.sleep(delay)
+        stats["inflight"] -= 1
+        users = json.loads(request.content)["user_list"]
+        return httpx.Response(
+            200,
+            json={
+                "user_info_list": [
+                    {"subscribe": 1, "openid": user["openid"]} for user in users
+                ]
+            },
+        )
+
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_iter_follower_profiles_resumes_from_checkpoint(offline_async_client):
+    stats = {}
+    cache = MemoryCache()
+    client = offline_async_client(
+        transport=httpx.MockTransport(_follower_api(25001, 0.001, stats)), cache=cache
+    )
+    seen = []
+    async for user in client.iter_follower_profiles(
+        concurrency=8, checkpoint_key="followers"
+    ):
+        seen.append(user.openid)
+        if len(seen) == 10001:
+            break
+    assert stats["max_inflight"] == 8
+    assert (await cache.aget("followers"))[0] == "o0009999"
+
+    rest = [
+        user.openid
+        async for user in client.iter_follower_profiles(checkpoint_key="followers")
+    ]
+    assert len(rest) == 15001
+    assert len(set(seen) | set(rest)) == 25001
+    assert (await cache.aget("followers"))[0] is None
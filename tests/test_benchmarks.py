@@ -0,0 +1,8 @@
+from benchmarks.suite import BENCHMARKS, run
+
+
+def test_benchmarks_run_offline():
+    report = run("", seconds=0.001, rounds=1)
+    assert set(report["results"]) == set(BENCHMARKS)
+    for result in report["results"].values():
+        assert "skipped" in result or result["ops_per_sec"] > 0
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from pywechat.cache import BaseCache, MemoryCache, RedisCache, SQLiteCache
+from pywechat.simulator.api import MockWechatAPI
+
+
+def test_memory_cache_lease_is_exclusive():
+    cache = MemoryCache()
+    assert cache.acquire_lease("lease", 10)
+    assert not cache.acquire_lease("lease", 10)
+    assert cache.release_lease("lease")
+    assert cache.acquire_lease("lease", -1)
+    assert cache.acquire_lease("lease", 10)
+    assert cache.lease_stats.acquired == 3
+    assert cache.lease_stats.contended == 1
+
+
+def test_sqlite_cache_shares_values(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    first.set("key", "value", ex=60)
+    value, expiry = second.get("key")
+    assert value == "value"
+    assert expiry is not None
+    first.set("expired", "value", ex=-1)
+    assert second.get("expired") == (None, None)
+
+
+def test_sqlite_cache_lease_is_exclusive(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    assert first.acquire_lease("lease", 10)
+    assert not second.acquire_lease("lease", 10)
+    assert not second.release_lease("lease")
+    assert first.release_lease("lease")
+    assert second.acquire_lease("lease", 10)
+    assert second.lease_stats.contended == 1
+    assert second.lease_stats.acquired == 1
+
+
+def test_sqlite_cache_lease_is_exclusive_within_instance(tmp_path):
+    # Two clients sharing one cache instance must not both hold the lease.
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    assert cache.acquire_lease("lease", 10)
+    assert not cache.acquire_lease("lease", 10)
+
+
+def test_sqlite_cache_expired_lease_can_be_taken(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    assert first.acquire_lease("lease", -1)
+    assert first.acquire_lease("other", -1)
+    assert second.acquire_lease("lease", 10)
+    # Expired leases are purged, not left behind in the table.
+    rows = second._conn.execute("SELECT key FROM leases").fetchall()
+    assert rows == [("lease",)]
+
+
+def test_redis_cache_lease_is_exclusive():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    first = RedisCache(
+        client=fakeredis.FakeRedis(server=server),
+        async_client=fakeredis.FakeAsyncRedis(server=server),
+    )
+    second = RedisCache(
+        client=fakeredis.FakeRedis(server=server),
+        async_client=fakeredis.FakeAsyncRedis(server=server),
+    )
+    first.set("key", "value", ex=60)
+    value, expiry = second.get("key")
+    assert value == "value"
+    assert expiry is not None
+    assert first.acquire_lease("lease", 10)
+    assert not second.acquire_lease("lease", 10)
+    assert not second.release_lease("lease")
+    assert first.release_lease("lease")
+
+    async def async_lease():
+        assert await second.aacquire_lease("lease", 10)
+        assert not await first.aacquire_lease("lease", 10)
+        assert await second.arelease_lease("lease")
+        assert (await second.aget("key"))[0] == "value"
+
+    asyncio.run(async_lease())
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") == (None, None)
+    assert cache.get("a")[0] == "1"
+    assert cache.get("c")[0] == "3"
+    assert cache.stats.evictions == 1
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+def test_memory_cache_evicts_expired_entries_first():
+    cache = MemoryCache(max_size=2)
+    cache.set("expired", "1", ex=-1)
+    cache.set("a", "2")
+    cache.set("b", "3")
+    assert len(cache) == 2
+    assert cache.get("a")[0] == "2"
+    assert cache.stats.evictions == 0
+    assert cache.stats.expirations == 1
+
+
+def test_memory_cache_sweep_removes_expired_entries():
+    cache = MemoryCache()
+    cache.set_many({"a": "1", "b": "2"}, ex=-1)
+    cache.set("c", "3", ex=60)
+    cache.set("a", "4")
+    assert cache.sweep() == 1
+    assert len(cache) == 2
+    assert cache.get_many(["a", "b", "c"]) == {
+        "a": ("4", None),
+        "b": (None, None),
+        "c": cache.get("c"),
+    }
+
+
+def test_memory_cache_sweeper_thread():
+    import time
+
+    cache = MemoryCache()
+    cache.set("a", "1", ex=-1)
+    cache.start_sweeper(interval=0.01)
+    time.sleep(0.1)
+    cache.stop_sweeper()
+    assert len(cache) == 0
+
+
+def test_sqlite_cache_bulk_operations(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set_many({"a": "1", "b": "2"}, ex=60)
+    entries = cache.get_many(["a", "b", "missing"])
+    assert entries["a"][0] == "1"
+    assert entries["b"][0] == "2"
+    assert entries["missing"] == (None, None)
+    assert cache.delete("a")
+    assert cache.get("a") == (None, None)
+    cache.set("expired", "value", ex=-1)
+    assert cache.purge_expired() == 1
+    assert cache.stats.hits == 2
+    assert cache.stats.misses == 2
+
+
+def test_sqlite_cache_async_methods_run_off_loop(tmp_path):
+    threads = []
+
+    class RecordingCache(SQLiteCache):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def get_many(self, keys):
+            threads.append(threading.get_ident())
+            return super().get_many(keys)
+
+        def set_many(self, mapping, ex=None):
+            threads.append(threading.get_ident())
+            return super().set_many(mapping, ex)
+
+        def delete(self, key):
+            threads.append(threading.get_ident())
+            return super().delete(key)
+
+    cache = RecordingCache(str(tmp_path / "cache.db"))
+
+    async def main():
+        await cache.aset_many({"a": "1", "b": "2"}, ex=60)
+        assert (await cache.aget("a"))[0] == "1"
+        assert (await cache.aget_many(["b"]))["b"][0] == "2"
+        assert await cache.adelete("b")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 4
+    assert loop_thread not in threads
+
+
+def test_custom_cache_without_super_init():
+    class DictCache(BaseCache):
+        def __init__(self):
+            self._data = {}
+
+        def get(self, key):
+            return self._record_get((self._data.get(key), None))
+
+        def set(self, key, value, ex=None):
+            self._data[key] = value
+            return True
+
+    cache = DictCache()
+    assert cache.acquire_lease("lease", 10)
+    assert cache.get("missing") == (None, None)
+    assert cache.lease_stats.acquired == 1
+    assert cache.stats.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_token_invalidation_with_cache_without_delete(offline_async_client):
+    class ExpiringDictCache(BaseCache):
+        def __init__(self):
+            self._data = {}
+
+        def get(self, key):
+            value, expiry = self._data.get(key, (None, None))
+            if expiry is not None and expiry < time.time():
+                return None, None
+            return value, None if expiry is None else int(expiry)
+
+        def set(self, key, value, ex=None):
+            self._data[key] = (value, None if ex is None else time.time() + ex)
+            return True
+
+    api = MockWechatAPI()
+    client = offline_async_client(
+        api.appid, api.app_secret, httpx.ASGITransport(api), cache=ExpiringDictCache()
+    )
+    await client.menus.create({"button": []})
+    api.expire_tokens()
+    await client.menus.create({"button": []})
+    assert client.request_stats.token_retries == 1
+    assert api.stats.calls["/cgi-bin/token"] == 2
+    await client.aclose()
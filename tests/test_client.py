@@ -1,8 +1,8 @@
 import pytest
 from pywechat.client import WechatClient, AsyncWechatClient
 from pywechat.models.message import (
-    GenericMessage,
     TextMessage,
+    UnsubscribeEvent,
     EncryptedResponseMessage,
     EventType,
     MessageType,
@@ -71,7 +71,7 @@ def test_xml_to_message(wechat_client: WechatClient):
     xml_message = "<xml><ToUserName><![CDATA[gh_399908c3505e]]></ToUserName>\n<FromUserName><![CDATA[oIqny6t2aR0L7dhDHr6qkm27kvxA]]></FromUserName>\n<CreateTime>1727187078</CreateTime>\n<MsgType><![CDATA[event]]></MsgType>\n<Event><![CDATA[unsubscribe]]></Event>\n<EventKey><![CDATA[]]></EventKey>\n</xml>"  # noqa
     message = wechat_client.xml_to_message(xml_message)
     assert message is not None
-    assert isinstance(message, GenericMessage)
+    assert isinstance(message, UnsubscribeEvent)
     assert message.ToUserName == "gh_399908c3505e"
     assert message.FromUserName == "oIqny6t2aR0L7dhDHr6qkm27kvxA"
     assert message.CreateTime == 1727187078
@@ -93,5 +93,239 @@ def test_message_to_xml(wechat_client: WechatClient):
     assert isinstance(xml_message, str)
     assert (
         xml_message
-        == "<xml><ToUserName>oIqny6t2aR0L7dhDHr6qkm27kvxA</ToUserName><FromUserName>gh_399908c3505e</FromUserName><CreateTime>1727188435</CreateTime><MsgType>text</MsgType><Content>Received text message: hello</Content></xml>"  # noqa
+        == "<xml><ToUserName><![CDATA[oIqny6t2aR0L7dhDHr6qkm27kvxA]]></ToUserName><FromUserName><![CDATA[gh_399908c3505e]]></FromUserName><CreateTime>1727188435</CreateTime><MsgType><![CDATA[text]]></MsgType><Content><![CDATA[Received text message: hello]]></Content></xml>"  # noqa
     )
+
+
+def _token_transport(calls: list, delay: float = 0):
+    import asyncio
+    import httpx
+
+    async def handler(request: httpx.Request):
+        calls.append(request)
+        await asyncio.sleep(delay)
+        return httpx.Response(
+            200, json={"access_token": f"token-{len(calls)}", "expires_in": 7200}
+        )
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_async_refresh_is_single_flight(offline_async_client):
+    import asyncio
+
+    calls = []
+    client = offline_async_client(transport=_token_transport(calls, 0.01))
+    tokens = await asyncio.gather(*(client.get_access_token() for _ in range(50)))
+    assert len(calls) == 1
+    assert set(tokens) == {"token-1"}
+    assert client.token_stats.refreshes == 1
+    assert client.token_stats.coalesced_waiters == 49
+
+
+@pytest.mark.asyncio
+async def test_async_expiring_token_renews_in_background(offline_async_client):
+    import asyncio
+    from pywechat.cache import MemoryCache
+
+    calls = []
+    cache = MemoryCache()
+    cache.set("appid", "stale", ex=60)
+    client = offline_async_client(transport=_token_transport(calls, 0.01), cache=cache)
+    assert await client.get_access_token() == "stale"
+    await asyncio.sleep(0.05)
+    assert len(calls) == 1
+    assert await client.get_access_token() == "token-1"
+
+
+def test_sync_refresh_coalesces_threads(offline_client):
+    import httpx
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        time.sleep(0.05)
+        return httpx.Response(
+            200, json={"access_token": f"token-{len(calls)}", "expires_in": 7200}
+        )
+
+    client = offline_client(transport=httpx.MockTransport(handler))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: client.refresh_access_token(), range(8)))
+    assert len(calls) == 1
+    assert set(tokens) == {"token-1"}
+    assert client.token_stats.coalesced_waiters == 7
+
+
+@pytest.mark.asyncio
+async def test_async_refresh_is_shared_between_processes(
+    tmp_path, offline_async_client
+):
+    import asyncio
+    from pywechat.cache import SQLiteCache
+
+    calls = []
+    path = str(tmp_path / "cache.db")
+    clients = []
+    for _ in range(3):
+        client = offline_async_client(
+            transport=_token_transport(calls, 0.1), cache=SQLiteCache(path)
+        )
+        clients.append(client)
+    tokens = await asyncio.gather(*(client.get_access_token() for client in clients))
+    assert len(calls) == 1
+    assert set(tokens) == {"token-1"}
+    assert sum(client.token_stats.lease_waits for client in clients) == 2
+
+
+def test_encrypt_decrypt_round_trip(offline_client):
+    from pywechat.models.message import EncryptedRequestMessage
+
+    client = offline_client()
+    message = TextMessage(
+        ToUserName="to",
+        FromUserName="from",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content="你好" * 100,
+    )
+    encrypted = client.encrypt_message(message)
+    assert client.check_signature(
+        encrypted.MsgSignature, encrypted.TimeStamp, encrypted.Nonce, encrypted.Encrypt
+    )
+    decrypted = client.decrypt_message(
+        EncryptedRequestMessage(ToUserName="to", Encrypt=encrypted.Encrypt)
+    )
+    assert decrypted == message
+    with pytest.raises(Exception, match="Invalid AppID"):
+        offline_client("other").decrypt(encrypted.Encrypt)
+
+
+def test_decrypt_accepts_reference_encryption(offline_client):
+    import base64
+    import secrets
+    import struct
+    from cryptography.hazmat.primitives import padding
+
+    client = offline_client()
+    xml = "<xml><ToUserName>to</ToUserName></xml>".encode()
+    plain = secrets.token_bytes(16) + struct.pack(">I", len(xml)) + xml + b"appid"
+    padder = padding.PKCS7(256).padder()
+    encryptor = client._chipper.encryptor()
+    ciphertext = (
+        encryptor.update(padder.update(plain) + padder.finalize())
+        + encryptor.finalize()
+    )
+    assert client.decrypt(base64.b64encode(ciphertext).decode()) == xml.decode()
+
+
+def test_encrypt_many_and_decrypt_many(offline_client):
+    from pywechat.models.message import EncryptedRequestMessage
+
+    client = offline_client()
+    messages = [
+        TextMessage(
+            ToUserName="to",
+            FromUserName="from",
+            CreateTime=i,
+            MsgType=MessageType.TEXT,
+            Content=f"message {i}",
+        )
+        for i in range(5)
+    ]
+    encrypted = client.encrypt_many(messages)
+    assert len({message.TimeStamp for message in encrypted}) == 1
+    decrypted = client.decrypt_many(
+        EncryptedRequestMessage(ToUserName="to", Encrypt=message.Encrypt)
+        for message in encrypted
+    )
+    assert decrypted == messages
+
+
+@pytest.mark.asyncio
+async def test_async_crypto_offload(offline_async_client):
+    from concurrent.futures import ProcessPoolExecutor
+
+    message = TextMessage(
+        ToUserName="to",
+        FromUserName="from",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content="x" * 1000,
+    )
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        client = offline_async_client(executor=executor, offload_threshold=512)
+        encrypted = await client.aencrypt_message(message)
+        envelope = await client.axml_to_message(
+            f"<xml><ToUserName>to</ToUserName><Encrypt>{encrypted.Encrypt}</Encrypt></xml>"  # noqa
+        )
+        assert await client.adecrypt_message(envelope) == message
+    assert client.offload_stats.offloaded == 3
+    assert client.offload_stats.pending == 0
+    small = offline_async_client()
+    assert small.decrypt(small.encrypt("<xml/>")) == "<xml/>"
+    await small.aencrypt_message(message)
+    assert small.offload_stats.inline == 1
+
+
+@pytest.mark.asyncio
+async def test_async_request_recovers_from_invalid_token(offline_async_client):
+    import asyncio
+    import httpx
+    from pywechat.cache import MemoryCache
+
+    fetched = []
+
+    async def handler(request: httpx.Request):
+        if request.url.path == "/cgi-bin/token":
+            fetched.append(request)
+            return httpx.Response(
+                200, json={"access_token": "fresh", "expires_in": 7200}
+            )
+        await asyncio.sleep(0.01)
+        if request.url.params["access_token"] != "fresh":
+            return httpx.Response(200, json={"errcode": 40001, "errmsg": "invalid"})
+        return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+    cache = MemoryCache()
+    cache.set("appid", "revoked", ex=7200)
+    client = offline_async_client(transport=httpx.MockTransport(handler), cache=cache)
+    responses = await asyncio.gather(
+        *(client.request("GET", "https://api.weixin.qq.com/x") for _ in range(20))
+    )
+    assert all(response.json()["errcode"] == 0 for response in responses)
+    assert len(fetched) == 1
+    assert client.request_stats.token_retries == 20
+
+
+def test_request_retries_network_errors_and_5xx(offline_client):
+    import httpx
+    from pywechat.cache import MemoryCache
+    from pywechat.client import RetryPolicy
+
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"errcode": 0})
+
+    cache = MemoryCache()
+    cache.set("appid", "token", ex=7200)
+    client = offline_client(
+        transport=httpx.MockTransport(handler),
+        cache=cache,
+        retry_policy=RetryPolicy(backoff=0.001),
+    )
+    assert client.request("GET", "https://api.weixin.qq.com/x").status_code == 200
+    assert client.request_stats.retries == 2
+    calls.clear()
+    calls.append(None)
+    assert client.request("POST", "https://api.weixin.qq.com/x").status_code == 503
@@ -0,0 +1,113 @@
+import pytest
+import xmltodict
+from pydantic import ValidationError
+from pywechat.codec import model_to_xml, parse_xml, xml_to_model
+from pywechat.models.message import (
+    ArticleDetail,
+    ArticleList,
+    ArticleMessage,
+    GenericMessage,
+    ImageDetail,
+    ImageMessage,
+    MessageType,
+    TextMessage,
+)
+
+
+EVENT_XML = "<xml><ToUserName><![CDATA[gh_399908c3505e]]></ToUserName>\n<FromUserName><![CDATA[oIqny6t2aR0L7dhDHr6qkm27kvxA]]></FromUserName>\n<CreateTime>1727187078</CreateTime>\n<MsgType><![CDATA[event]]></MsgType>\n<Event><![CDATA[CLICK]]></Event>\n<EventKey><![CDATA[menu_1]]></EventKey>\n</xml>"  # noqa
+
+
+def _xmltodict_to_message(xml: str) -> GenericMessage:
+    return GenericMessage.model_validate(xmltodict.parse(xml).get("xml"))
+
+
+def test_xml_to_model_matches_xmltodict():
+    message = xml_to_model(EVENT_XML)
+    assert message == _xmltodict_to_message(EVENT_XML)
+    assert message.CreateTime == 1727187078
+    assert message.MsgType == MessageType.EVENT
+
+
+def test_xml_to_model_nested_articles():
+    message = ArticleMessage(
+        ToUserName="to",
+        FromUserName="from",
+        CreateTime=1,
+        MsgType=MessageType.ARTICLE,
+        ArticleCount=2,
+        Articles=ArticleList(
+            item=[
+                ArticleDetail(Title="a", Description="b", PicUrl="c", Url="d"),
+                ArticleDetail(Title="e", Description="f", PicUrl="g", Url="h"),
+            ]
+        ),
+    )
+    xml = model_to_xml(message)
+    assert xml.count("<item>") == 2
+    assert xml_to_model(xml, ArticleMessage) == message
+
+
+def test_model_to_xml_round_trip_and_cdata_escaping():
+    message = TextMessage(
+        ToUserName="to",
+        FromUserName="from",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content="<b>a]]>b</b> & c",
+    )
+    xml = model_to_xml(message)
+    assert parse_xml(xml)["Content"] == message.Content
+    assert xml_to_model(xml, TextMessage) == message
+    image = ImageMessage(
+        ToUserName="to",
+        FromUserName="from",
+        CreateTime=1,
+        MsgType=MessageType.IMAGE,
+        Image=ImageDetail(MediaId="media"),
+    )
+    assert "<Image><MediaId><![CDATA[media]]></MediaId></Image>" in model_to_xml(image)
+
+
+def test_xml_to_model_reports_invalid_messages():
+    with pytest.raises(ValidationError):
+        xml_to_model("<xml><FromUserName>a</FromUserName></xml>", TextMessage)
+    with pytest.raises(ValidationError):
+        xml_to_model(EVENT_XML.replace("1727187078", "not a number"))
+
+
+def test_parse_message_dispatches_on_msg_type_and_event():
+    from pywechat.codec import parse_message
+    from pywechat.models.message import (
+        ClickEvent,
+        EncryptedRequestMessage,
+        LocationEvent,
+        RawMessage,
+    )
+
+    assert isinstance(parse_message(EVENT_XML), ClickEvent)
+    location = parse_message(
+        "<xml><ToUserName>to</ToUserName><FromUserName>from</FromUserName>"
+        "<CreateTime>1</CreateTime><MsgType>event</MsgType>"
+        "<Event>LOCATION</Event><Latitude>23.137466</Latitude>"
+        "<Longitude>113.352425</Longitude><Precision>119.385040</Precision></xml>"
+    )
+    assert isinstance(location, LocationEvent)
+    assert location.Latitude == pytest.approx(23.137466)
+    text = parse_message(
+        "<xml><ToUserName>to</ToUserName><FromUserName>from</FromUserName>"
+        "<CreateTime>1</CreateTime><MsgType>text</MsgType>"
+        "<Content>hi</Content><MsgId>1234567890123456</MsgId></xml>"
+    )
+    assert isinstance(text, TextMessage)
+    assert text.MsgId == 1234567890123456
+    image = parse_message(
+        "<xml><ToUserName>to</ToUserName><FromUserName>from</FromUserName>"
+        "<CreateTime>1</CreateTime><MsgType>image</MsgType>"
+        "<PicUrl>http://example.com/a.jpg</PicUrl><MediaId>media</MediaId></xml>"
+    )
+    assert isinstance(image, RawMessage)
+    assert image.MediaId == "media"
+    envelope = parse_message(
+        "<xml><ToUserName>to</ToUserName><Encrypt>abc</Encrypt></xml>"
+    )
+    assert isinstance(envelope, EncryptedRequestMessage)
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from pywechat.cache import SQLiteCache
+from pywechat.dedup import MessageDeduplicator, message_key
+from pywechat.models.message import ClickEvent, MessageType, TextMessage
+
+
+def _text(msg_id: int) -> TextMessage:
+    return TextMessage(
+        ToUserName="gh",
+        FromUserName="user",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content="hi",
+        MsgId=msg_id,
+    )
+
+
+def test_message_key():
+    assert message_key(_text(1)) == "dedup:gh:1"
+    event = ClickEvent(
+        ToUserName="gh",
+        FromUserName="user",
+        CreateTime=1,
+        MsgType=MessageType.EVENT,
+        Event="CLICK",
+        EventKey="menu",
+    )
+    assert message_key(event) == "dedup:gh:user:1:CLICK"
+
+
+@pytest.mark.asyncio
+async def test_duplicates_share_the_first_reply():
+    calls = []
+
+    async def handler(message):
+        calls.append(message)
+        await asyncio.sleep(0.05)
+        return f"reply {message.MsgId}"
+
+    deduplicator = MessageDeduplicator()
+    replies = await asyncio.gather(
+        *(deduplicator.process(_text(1), handler) for _ in range(3))
+    )
+    assert replies == ["reply 1"] * 3
+    assert await deduplicator.process(_text(1), handler) == "reply 1"
+    assert await deduplicator.process(_text(2), handler) == "reply 2"
+    assert len(calls) == 2
+    assert deduplicator.stats.duplicates == 3
+    assert deduplicator.stats.inflight_waits == 2
+    assert deduplicator.stats.cached_replies == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicates_across_processes(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    calls = []
+
+    async def handler(message):
+        calls.append(message)
+        await asyncio.sleep(0.1)
+        return None
+
+    first = MessageDeduplicator(SQLiteCache(path))
+    second = MessageDeduplicator(SQLiteCache(path))
+    replies = await asyncio.gather(
+        first.process(_text(1), handler), second.process(_text(1), handler)
+    )
+    assert replies == [None, None]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_can_be_retried():
+    async def failing(message):
+        raise RuntimeError("boom")
+
+    async def handler(message):
+        return "ok"
+
+    deduplicator = MessageDeduplicator()
+    with pytest.raises(RuntimeError):
+        await deduplicator.process(_text(1), failing)
+    assert await deduplicator.process(_text(1), handler) == "ok"
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from pywechat.deferred import (
+    MemoryReplyQueue,
+    ReplyWorkers,
+    SQLiteReplyQueue,
+    custom_message_body,
+)
+from pywechat.models.message import MessageType, TextMessage
+from pywechat.router import MessageRouter
+
+
+def _text(content: str, msg_id: int = 1) -> TextMessage:
+    return TextMessage(
+        ToUserName="gh",
+        FromUserName="user",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content=content,
+        MsgId=msg_id,
+    )
+
+
+def _transport(sent: list) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/cgi-bin/token":
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+    return httpx.MockTransport(handler)
+
+
+def test_custom_message_body():
+    assert custom_message_body(_text("hi")) == {
+        "touser": "gh",
+        "msgtype": "text",
+        "text": {"content": "hi"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_push_is_acknowledged_before_the_handler_runs(offline_async_client):
+    sent = []
+    client = offline_async_client(transport=_transport(sent))
+    router = MessageRouter(client, reply_queue=MemoryReplyQueue())
+    release = asyncio.Event()
+
+    @router.message(MessageType.TEXT)
+    async def slow(message):
+        await release.wait()
+        return f"echo {message.Content}"
+
+    workers = ReplyWorkers(router, concurrency=2)
+    workers.start()
+    xml = client.message_to_xml(_text("hi"))
+    timestamp = str(int(time.time()))
+    signature = client.generate_signature(timestamp, "n")
+    assert await router.handle(xml.encode(), signature, timestamp, "n") == "success"
+    assert router.reply_queue.depth() == 1
+    assert router.reply_queue.oldest_age() >= 0
+
+    release.set()
+    for _ in range(100):
+        if router.reply_queue.depth() == 0:
+            break
+        await asyncio.sleep(0.01)
+    await workers.stop()
+    assert sent == [
+        {"touser": "user", "msgtype": "text", "text": {"content": "echo hi"}}
+    ]
+    assert router.reply_queue.stats.enqueued == 1
+    assert router.reply_queue.stats.delivered == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects():
+    queue = MemoryReplyQueue(max_size=1)
+    assert await queue.put(_text("a"))
+    assert not await queue.put(_text("b"), timeout=0.01)
+    assert queue.stats.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_push_turned_away_by_full_queue_is_retried(offline_async_client):
+    class ShortWaitQueue(MemoryReplyQueue):
+        async def put(self, message, timeout=0.01):
+            return await super().put(message, timeout)
+
+    client = offline_async_client()
+    router = MessageRouter(client, reply_queue=ShortWaitQueue(max_size=1))
+    assert await router.reply_queue.put(_text("a", 1))
+    xml = client.message_to_xml(_text("b", 2)).encode()
+    timestamp = str(int(time.time()))
+    push = (xml, client.generate_signature(timestamp, "n"), timestamp, "n")
+    with pytest.raises(Exception, match="Reply queue is full"):
+        await router.handle(*push)
+    # Room again by the time WeChat retries.
+    await router.reply_queue.done(await router.reply_queue.get())
+    assert await router.handle(*push) == "success"
+    assert router.reply_queue.depth() == 1
+    assert router.reply_queue.stats.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_queue_put_cancelled_leaves_no_pending_entry():
+    queue = MemoryReplyQueue(max_size=1)
+    assert await queue.put(_text("a"))
+    task = asyncio.ensure_future(queue.put(_text("b"), timeout=5))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert queue.depth() == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_queue_survives_restart(tmp_path):
+    path = str(tmp_path / "replies.db")
+    queue = SQLiteReplyQueue(path, max_size=2, poll_interval=0.01)
+    assert await queue.put(_text("a", 1))
+    assert await queue.put(_text("b", 2))
+    assert not await queue.put(_text("c", 3), timeout=0.02)
+    queue.close()
+
+    queue = SQLiteReplyQueue(path, poll_interval=0.01, visibility_timeout=0)
+    item = await queue.get()
+    assert item.message == _text("a", 1)
+    # Claimed but not done: handed out again once the claim times out.
+    await asyncio.sleep(0.01)
+    assert (await queue.get()).message == _text("a", 1)
+    await queue.done(item)
+    assert queue.depth() == 1
+    assert (await queue.get()).message == _text("b", 2)
+    queue.close()
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+# Modules that importing pywechat.client must not pull in, they are loaded on
+# first use instead.
+DEFERRED = ("httpx", "cryptography", "pydantic", "xml.etree.ElementTree")
+
+
+def _importtime(code: str) -> dict:
+    # Cumulative import time in microseconds of every module imported by code.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_client_import_defers_heavy_dependencies():
+    times = _importtime("import pywechat.client")
+    assert "pywechat.client" in times
+    loaded = [
+        name
+        for name in times
+        for module in DEFERRED
+        if name == module or name.startswith(module + ".")
+    ]
+    assert not loaded
+    # Generous bound against regressions, it takes about 60ms locally.
+    assert times["pywechat.client"] < 500_000
+
+
+def test_dependencies_load_on_first_use():
+    code = "\n".join(
+        [
+            "import sys",
+            "from pywechat.client import WechatClient",
+            "key = 'a' * 43",
+            "client = WechatClient('appid', 's', 't', key)",
+            "assert 'cryptography' not in sys.modules",
+            "client.decrypt(client.encrypt('<xml></xml>'))",
+            "assert 'cryptography' in sys.modules",
+            "client.close()",
+        ]
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_clients_do_not_share_a_default_cache(offline_key):
+    from pywechat.client import WechatClient
+
+    first = WechatClient("appid", "s", "t", offline_key)
+    second = WechatClient("appid", "s", "t", offline_key)
+    assert first._cache is not second._cache
+    first.close()
+    second.close()
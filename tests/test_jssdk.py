@@ -0,0 +1,76 @@
+import asyncio
+import httpx
+import pytest
+from pywechat.cache import MemoryCache
+
+# Example from the JS-SDK documentation.
+TICKET = (
+    "sM4AOVdWfPE4DxkXGEs8VMCPGGVi4C3VM0P37wVUCFvkVAy_90u5h9nbSlYy3-Sl-HhTdfl2fzFy1"
+    "AOcHKP7qg"
+)
+SIGNATURE = "0f9de62fce790f9a083d5c99e95740ceb90c27ed"
+
+
+def _handler(calls: list, expires_in: int = 7200):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == "/cgi-bin/token":
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+        assert request.url.params["type"] == "jsapi"
+        ticket = TICKET if calls.count(request.url.path) == 1 else "renewed"
+        return httpx.Response(
+            200,
+            json={
+                "errcode": 0,
+                "errmsg": "ok",
+                "ticket": ticket,
+                "expires_in": expires_in,
+            },
+        )
+
+    return handler
+
+
+def test_sign_without_network_after_first_ticket(offline_client):
+    calls = []
+    cache = MemoryCache()
+    client = offline_client(transport=httpx.MockTransport(_handler(calls)), cache=cache)
+    config = client.generate_jssdk_signature(
+        "http://mp.weixin.qq.com?params=value#section",
+        noncestr="Wm3WZYTPz0wzccnW",
+        timestamp=1414587457,
+    )
+    assert config.signature == SIGNATURE
+    assert config.appId == "appid"
+    for _ in range(1000):
+        client.jssdk.sign("https://example.com/page")
+    assert calls == ["/cgi-bin/token", "/cgi-bin/ticket/getticket"]
+
+    # Another client on the same cache, e.g. another process, reuses it.
+    other = offline_client(transport=httpx.MockTransport(_handler(calls)), cache=cache)
+    assert other.jssdk.get_ticket() == TICKET
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_single_fetch_and_refresh_ahead(offline_async_client):
+    calls = []
+    client = offline_async_client(
+        transport=httpx.MockTransport(_handler(calls, expires_in=7200))
+    )
+    configs = await asyncio.gather(
+        *(client.generate_jssdk_signature("https://example.com/") for _ in range(100))
+    )
+    assert len({config.nonceStr for config in configs}) == 100
+    assert calls.count("/cgi-bin/ticket/getticket") == 1
+    assert client.jssdk.stats.refreshes == 1
+
+    # Close to expiry the current ticket is still used while it is renewed.
+    await client._cache.aset("appid:ticket:jsapi", TICKET, ex=10)
+    state = client.jssdk._states["jsapi"]
+    state.current = None
+    assert await client.jssdk.get_ticket() == TICKET
+    await state.credential._task
+    assert await client.jssdk.get_ticket() == "renewed"
+    assert calls.count("/cgi-bin/ticket/getticket") == 2
+    await client.aclose()
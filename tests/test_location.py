@@ -0,0 +1,66 @@
+import pytest
+from pywechat.location import LocationStore, distance
+from pywechat.models.message import EventType
+from pywechat.router import MessageRouter
+from pywechat.simulator.pushes import PushFactory, sample_messages
+
+# About 11 metres of latitude.
+STEP = 0.0001
+
+
+def test_coalesces_and_notifies_beyond_thresholds():
+    store = LocationStore(threshold=100)
+    moves = []
+    store.subscribe(moves.append, threshold=30)
+    assert store.update("a", 23.0, 113.0, 10.0, 1700000000)
+    for i in range(1, 10):
+        # Small steps are stored but not reported until the total is > 100m.
+        assert store.update("a", 23.0 + i * STEP, 113.0) == (i == 9)
+    fix = store.get("a")
+    assert fix.latitude == pytest.approx(23.0009, abs=1e-5)
+    assert store.stats.coalesced == 8 and store.stats.moved == 2
+    assert [round(m.latitude, 4) for m in moves] == [23.0, 23.0003, 23.0006, 23.0009]
+
+    assert store.remove("a") and "a" not in store
+    assert store.update("b", 23.0, 113.0)
+    assert len(store) == 1 and len(store._openids) == 1
+
+
+def test_nearby_query():
+    store = LocationStore()
+    for i in range(200):
+        store.update(f"u{i}", 39.9 + i * 0.001, 116.4)
+    store.update("far", -33.9, 151.2)
+    store.update("dateline", 10.0, 179.9999)
+    found = store.nearby(39.9, 116.4, 1000)
+    # 0.001 degrees of latitude are 111m, u9 is just outside.
+    assert [openid for openid, _ in found] == [f"u{i}" for i in range(9)]
+    assert found[1][1] == pytest.approx(distance(39.9, 116.4, 39.901, 116.4), abs=3)
+    assert store.nearby(39.9, 116.4, 1000, limit=3)[-1][0] == "u2"
+    assert [openid for openid, _ in store.nearby(10.0, -179.9999, 100)] == ["dateline"]
+
+
+@pytest.mark.asyncio
+async def test_router_dispatches_only_moves(offline_async_client, offline_key):
+    client = offline_async_client()
+    store = LocationStore(threshold=100)
+    router = MessageRouter(client, locations=store)
+    handled = []
+
+    @router.event(EventType.LOCATION)
+    def on_location(message):
+        handled.append(message.Latitude)
+
+    factory = PushFactory("token", offline_key, "appid")
+    location = sample_messages()["location"]
+    for i in range(5):
+        message = location.model_copy(update={"Latitude": 23.0 + i * STEP})
+        # All pushes come from one user.
+        push = factory.push(message, sender="o" * 28)
+        query = dict(part.split("=", 1) for part in push.query.split("&"))
+        await router.handle(
+            push.body, query["signature"], query["timestamp"], query["nonce"]
+        )
+    assert handled == [23.0]
+    assert store.stats.received == 5 and len(store) == 1
+    await client.aclose()
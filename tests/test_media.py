@@ -0,0 +1,187 @@
+import io
+import hashlib
+import threading
+import time
+import tracemalloc
+import httpx
+import pytest
+
+SIZE = 16 * 1024 * 1024
+CHUNK = b"x" * 65536
+
+
+class _Chunks(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __iter__(self):
+        for _ in range(SIZE // len(CHUNK)):
+            yield CHUNK
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
+
+
+class _MediaAPI:
+    # Consumes uploads chunk by chunk and streams downloads, like a server.
+    def __init__(self, stale_tokens: int = 0):
+        self.uploads = []
+        self.stale_tokens = stale_tokens
+
+    def _token(self, request):
+        return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+
+    def _upload_result(self, sha256, size):
+        if self.stale_tokens:
+            self.stale_tokens -= 1
+            return httpx.Response(200, json={"errcode": 40001, "errmsg": "invalid"})
+        self.uploads.append((sha256.hexdigest(), size))
+        return httpx.Response(
+            200,
+            json={"type": "image", "media_id": "m1", "created_at": int(time.time())},
+        )
+
+    def _download(self):
+        if self.stale_tokens:
+            self.stale_tokens -= 1
+            return httpx.Response(200, json={"errcode": 40001, "errmsg": "invalid"})
+        return httpx.Response(
+            200, headers={"content-type": "image/jpeg"}, stream=_Chunks()
+        )
+
+
+class _SyncTransport(_MediaAPI, httpx.BaseTransport):
+    def handle_request(self, request):
+        if request.url.path == "/cgi-bin/token":
+            return self._token(request)
+        if request.url.path == "/cgi-bin/media/upload":
+            sha256, size = hashlib.sha256(), 0
+            for chunk in request.stream:
+                sha256.update(chunk)
+                size += len(chunk)
+            return self._upload_result(sha256, size)
+        return self._download()
+
+
+class _AsyncTransport(_MediaAPI, httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        if request.url.path == "/cgi-bin/token":
+            return self._token(request)
+        if request.url.path == "/cgi-bin/media/upload":
+            sha256, size = hashlib.sha256(), 0
+            async for chunk in request.stream:
+                sha256.update(chunk)
+                size += len(chunk)
+            return self._upload_result(sha256, size)
+        return self._download()
+
+
+def test_streaming_upload_and_media_id_cache(tmp_path, offline_client):
+    path = tmp_path / "big.jpg"
+    with open(path, "wb") as f:
+        for _ in range(SIZE // len(CHUNK)):
+            f.write(CHUNK)
+    transport = _SyncTransport()
+    client = offline_client(transport=transport)
+    # Keep first-use imports out of the measured peak.
+    client.media.upload("image", b"warm up", "a.jpg", use_cache=False)
+    transport.uploads.clear()
+    tracemalloc.start()
+    result = client.media.upload("image", path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert result.media_id == "m1"
+    assert peak < SIZE // 8
+    assert len(transport.uploads) == 1
+    assert transport.uploads[0][1] > SIZE
+
+    # Same content again: answered from the cache without uploading.
+    with open(path, "rb") as f:
+        assert client.media.upload("image", f).media_id == "m1"
+    assert len(transport.uploads) == 1
+
+
+def test_streaming_download_replays_stale_token(tmp_path, offline_client):
+    transport = _SyncTransport(stale_tokens=1)
+    client = offline_client(transport=transport)
+    client.get_access_token()
+    client.media
+    tracemalloc.start()
+    written = client.media.download_to("m1", tmp_path / "out.jpg")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert written == SIZE == (tmp_path / "out.jpg").stat().st_size
+    assert peak < SIZE // 8
+    assert client.request_stats.token_retries == 1
+
+
+def test_upload_replay_after_stale_token(tmp_path, offline_client):
+    # Rereadable sources are sent again in full, one-shot iterators raise
+    # rather than uploading an empty file.
+    transport = _SyncTransport(stale_tokens=1)
+    client = offline_client(transport=transport)
+    with open(tmp_path / "a.jpg", "wb") as f:
+        f.write(CHUNK)
+    with open(tmp_path / "a.jpg", "rb") as f:
+        assert client.media.upload("image", f, use_cache=False).media_id == "m1"
+    assert len(transport.uploads) == 1
+    assert transport.uploads[0][1] > len(CHUNK)
+
+    transport.stale_tokens = 1
+    with pytest.raises(Exception, match="twice"):
+        client.media.upload("image", iter([CHUNK]), filename="a.jpg")
+    assert len(transport.uploads) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_upload_from_iterator_refuses_replay(offline_async_client):
+    transport = _AsyncTransport(stale_tokens=1)
+    client = offline_async_client(transport=transport)
+
+    async def chunks():
+        yield CHUNK
+
+    with pytest.raises(Exception, match="twice"):
+        await client.media.upload("voice", chunks(), filename="a.amr")
+    assert transport.uploads == []
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_upload_from_iterator_and_download(tmp_path, offline_async_client):
+    transport = _AsyncTransport()
+    client = offline_async_client(transport=transport)
+
+    async def chunks():
+        for _ in range(64):
+            yield CHUNK
+
+    result = await client.media.upload("voice", chunks(), filename="a.amr")
+    assert result.media_id == "m1"
+    assert transport.uploads[0][1] > 64 * len(CHUNK)
+
+    with open(tmp_path / "out.jpg", "wb") as f:
+        assert await client.media.download_to("m1", f) == SIZE
+
+
+@pytest.mark.asyncio
+async def test_async_file_io_runs_off_the_loop(tmp_path, offline_async_client):
+    loop_thread = threading.get_ident()
+    io_threads = set()
+
+    class _TrackedFile(io.BytesIO):
+        def read(self, *args):
+            io_threads.add(threading.get_ident())
+            return super().read(*args)
+
+        def write(self, data):
+            io_threads.add(threading.get_ident())
+            return super().write(data)
+
+    transport = _AsyncTransport()
+    client = offline_async_client(transport=transport)
+    source = _TrackedFile(CHUNK * 8)
+    await client.media.upload("image", source, filename="a.jpg", use_cache=False)
+    assert transport.uploads[0][1] > len(CHUNK) * 8
+    assert await client.media.download_to("m1", _TrackedFile()) == SIZE
+    assert await client.media.download_to("m1", tmp_path / "out.jpg") == SIZE
+    assert (tmp_path / "out.jpg").stat().st_size == SIZE
+    assert io_threads and loop_thread not in io_threads
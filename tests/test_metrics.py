@@ -0,0 +1,77 @@
+import time
+import httpx
+import pytest
+from pywechat.metrics import NOOP_METRICS, InMemoryMetrics, PrometheusMetrics
+from pywechat.models.message import MessageType, TextMessage
+from pywechat.router import MessageRouter
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/cgi-bin/token":
+        return httpx.Response(200, json={"access_token": "t", "expires_in": 7200})
+    return httpx.Response(200, json={"errcode": 45009, "errmsg": "limit"})
+
+
+def test_metrics_disabled_by_default(offline_async_client):
+    assert offline_async_client().metrics is NOOP_METRICS
+
+
+@pytest.mark.asyncio
+async def test_client_and_push_pipeline_timings(offline_async_client):
+    metrics = InMemoryMetrics()
+    client = offline_async_client(
+        transport=httpx.MockTransport(_handler), metrics=metrics
+    )
+    await client.request("POST", "https://api.weixin.qq.com/cgi-bin/message/send")
+    assert metrics.summary("token.fetch").count == 1
+    summary = metrics.summary(
+        "http.request", path="/cgi-bin/message/send", status=200, errcode=45009
+    )
+    assert summary.count == 1
+
+    router = MessageRouter(client)
+    router.message(MessageType.TEXT)(lambda message: "pong")
+    message = TextMessage(
+        ToUserName="gh",
+        FromUserName="user",
+        CreateTime=1,
+        MsgType=MessageType.TEXT,
+        Content="ping",
+    )
+    encrypted = client.encrypt_message(message)
+    body = (
+        "<xml><ToUserName><![CDATA[gh]]></ToUserName>"
+        f"<Encrypt><![CDATA[{encrypted.Encrypt}]]></Encrypt></xml>"
+    )
+    timestamp = str(int(time.time()))
+    await router.handle(
+        body.encode(),
+        client.generate_signature(timestamp, "n"),
+        timestamp,
+        "n",
+        client.generate_signature(timestamp, "n", encrypted.Encrypt),
+    )
+    for name in (
+        "signature.check",
+        "message.parse",
+        "message.decrypt",
+        "router.handler",
+        "message.encrypt",
+    ):
+        assert metrics.summary(name).count == 1, name
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    metrics = PrometheusMetrics(registry)
+    metrics.timing("token.fetch", 0.5)
+    metrics.timing("http.request", 0.1, path="/cgi-bin/token", status=200)
+    assert registry.get_sample_value("pywechat_token_fetch_seconds_count") == 1
+    assert (
+        registry.get_sample_value(
+            "pywechat_http_request_seconds_sum",
+            {"path": "/cgi-bin/token", "status": "200"},
+        )
+        == 0.1
+    )
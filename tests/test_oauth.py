@@ -0,0 +1,113 @@
+import asyncio
+import time
+import httpx
+import pytest
+from pywechat.oauth import OAuthToken, OAuthTokenStore
+
+
+def _token(openid: str, expires_in: float = 7200) -> OAuthToken:
+    now = time.time()
+    return OAuthToken(openid, "at", "rt", now + expires_in, now + 86400)
+
+
+def test_store_spills_least_recently_used(tmp_path):
+    store = OAuthTokenStore(max_size=2, spill_path=str(tmp_path / "oauth.db"))
+    assert not hasattr(_token("a"), "__dict__")
+    store.put(_token("a", expires_in=10))
+    store.put(_token("b"))
+    store.get("a")
+    store.put(_token("c"))
+    assert len(store) == 2 and store.stats.spilled == 1
+    # "b" was least recently used and comes back from the spill file.
+    assert store.get("b").openid == "b"
+    assert store.stats.loaded == 1
+    assert list(store.expiring(60)) == ["a"]
+    assert store.delete("a") and store.get("a") is None
+    store.close()
+
+    reopened = OAuthTokenStore(spill_path=str(tmp_path / "oauth.db"))
+    assert {reopened.get(openid).openid for openid in "bc"} == {"b", "c"}
+
+
+@pytest.mark.asyncio
+async def test_store_async_methods_stream_spilled_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr("pywechat.oauth.EXPIRING_PAGE_SIZE", 3)
+    store = OAuthTokenStore(max_size=2, spill_path=str(tmp_path / "oauth.db"))
+    for i in range(10):
+        await store.aput(_token(f"u{i}", expires_in=10 if i % 2 else 7200))
+    assert len(store) == 2 and store.stats.spilled == 8
+    assert (await store.aget("u1")).openid == "u1"
+    assert store.stats.loaded == 1
+    openids = [openid async for openid in store.aexpiring(60)]
+    assert sorted(openids) == ["u1", "u3", "u5", "u7", "u9"]
+    assert await store.adelete("u3") and await store.aget("u3") is None
+    store.close()
+
+
+class _SNS:
+    def __init__(self):
+        self.refreshes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        if request.url.path == "/sns/oauth2/access_token":
+            assert params["secret"] == "secret"
+            return httpx.Response(200, json=self._token(params["code"]))
+        if request.url.path == "/sns/oauth2/refresh_token":
+            if params["refresh_token"] == "revoked":
+                return httpx.Response(200, json={"errcode": 40030, "errmsg": "bad"})
+            self.refreshes += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return httpx.Response(200, json=self._token(params["refresh_token"]))
+        if request.url.path == "/sns/userinfo":
+            assert params["access_token"] == "at-" + params["openid"]
+            return httpx.Response(200, json={"openid": params["openid"], "sex": 1})
+        raise AssertionError(request.url)
+
+    @staticmethod
+    def _token(openid: str) -> dict:
+        return {
+            "access_token": f"at-{openid}",
+            "expires_in": 7200,
+            "refresh_token": openid,
+            "openid": openid,
+            "scope": "snsapi_userinfo",
+        }
+
+
+@pytest.mark.asyncio
+async def test_lazy_single_flight_and_bulk_refresh(offline_async_client):
+    sns = _SNS()
+    client = offline_async_client(transport=httpx.MockTransport(sns))
+    oauth = client.oauth
+    assert "scope=snsapi_userinfo" in oauth.authorize_url(
+        "https://example.com/cb", scope="snsapi_userinfo"
+    )
+    token = await oauth.exchange_code("u0")
+    assert token.openid == "u0" and oauth.store.get("u0") is token
+    assert (await oauth.userinfo("u0")).sex == 1
+    assert sns.refreshes == 0
+
+    # Expired: concurrent users of the token share one refresh.
+    token.expires_at = time.time() - 1
+    tokens = await asyncio.gather(*(oauth.get_token("u0") for _ in range(20)))
+    assert sns.refreshes == 1
+    assert all(t.expires_at > time.time() for t in tokens)
+
+    for i in range(1, 50):
+        oauth.store.put(
+            OAuthToken(f"u{i}", "at", f"u{i}", time.time() + 60, time.time() + 86400)
+        )
+    oauth.store.put(
+        OAuthToken("gone", "at", "revoked", time.time(), time.time() + 86400)
+    )
+    assert await oauth.refresh_expiring(within=600, concurrency=5) == 49
+    assert sns.max_in_flight == 5
+    assert oauth.stats.revoked == 1 and oauth.store.get("gone") is None
+    assert await oauth.get_token("gone") is None
+    await client.aclose()
@@ -0,0 +1,75 @@
+import threading
+import time
+import pytest
+from pywechat.pool import AccountConfig, AsyncWechatClientPool, WechatClientPool
+
+
+def _account(appid: str) -> AccountConfig:
+    return AccountConfig(appid, "secret", "token", "a" * 43, username=f"gh_{appid}")
+
+
+def test_pool_creates_clients_lazily_with_shared_transport():
+    pool = WechatClientPool(http2=False)
+    pool.register(_account("wx1"))
+    pool.register(_account("wx2"))
+    assert len(pool) == 0
+    first, second = pool.get("wx1"), pool.get("wx2")
+    assert pool.get("wx1") is first
+    assert first._request_client is second._request_client
+    assert first._cache is second._cache
+    pool.close()
+
+
+def test_pool_routes_by_username_and_loader():
+    pool = AsyncWechatClientPool(loader=lambda appid: _account(appid), http2=False)
+    client = pool.get("wx3")
+    assert client._appid == "wx3"
+    assert pool.get_by_username("gh_wx3") is client
+    with pytest.raises(KeyError):
+        pool.get_by_username("gh_unknown")
+
+
+def test_pool_routes_unseen_username_through_username_loader():
+    pool = WechatClientPool(
+        username_loader=lambda username: _account(username[3:]), http2=False
+    )
+    client = pool.get_by_username("gh_wx4")
+    assert client._appid == "wx4"
+    assert pool.get("wx4") is client
+    pool.close()
+
+
+def test_pool_calls_loader_outside_its_lock():
+    acquired = []
+
+    def loader(appid):
+        # The lock is not reentrant, this only succeeds if get() let go of it.
+        acquired.append(pool._lock.acquire(timeout=1))
+        pool._lock.release()
+        return _account(appid)
+
+    pool = WechatClientPool(loader=loader, http2=False)
+    threads = [threading.Thread(target=pool.get, args=("wx5",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert acquired and all(acquired)
+    assert len(pool) == 1
+    pool.close()
+
+
+def test_pool_evicts_idle_and_least_recently_used_clients():
+    pool = WechatClientPool(http2=False, max_clients=2)
+    for appid in ("wx1", "wx2", "wx3"):
+        pool.register(_account(appid))
+    pool.get("wx1")
+    pool.get("wx2")
+    pool.get("wx1")
+    pool.get("wx3")
+    assert "wx2" not in pool
+    assert "wx1" in pool and "wx3" in pool
+    time.sleep(0.02)
+    pool.get("wx3")
+    assert pool.evict_idle(0.01) == 1
+    assert "wx1" not in pool
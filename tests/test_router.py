@@ -0,0 +1,194 @@
+import time
+import pytest
+from pywechat.client import AsyncWechatClient
+from pywechat.codec import parse_message, parse_xml
+from pywechat.dedup import MessageDeduplicator
+from pywechat.models.message import EventType, MessageType, TextMessage
+from pywechat.router import MessageRouter
+
+
+def _text_xml(content: str, msg_id: int = 1) -> str:
+    return (
+        "<xml><ToUserName><![CDATA[gh]]></ToUserName>"
+        "<FromUserName><![CDATA[user]]></FromUserName>"
+        "<CreateTime>1</CreateTime><MsgType><![CDATA[text]]></MsgType>"
+        f"<Content><![CDATA[{content}]]></Content><MsgId>{msg_id}</MsgId></xml>"
+    )
+
+
+def _event_xml(event: str, key: str = "") -> str:
+    return (
+        "<xml><ToUserName><![CDATA[gh]]></ToUserName>"
+        "<FromUserName><![CDATA[user]]></FromUserName>"
+        "<CreateTime>1</CreateTime><MsgType><![CDATA[event]]></MsgType>"
+        f"<Event><![CDATA[{event}]]></Event>"
+        f"<EventKey><![CDATA[{key}]]></EventKey></xml>"
+    )
+
+
+def _router(client: AsyncWechatClient) -> MessageRouter:
+    router = MessageRouter(client)
+
+    @router.message(MessageType.TEXT)
+    async def echo(message):
+        return f"echo {message.Content}"
+
+    @router.event(EventType.CLICK, key="help")
+    def help(message):
+        return "help"
+
+    @router.event(EventType.CLICK, key="menu_*")
+    def menu(message):
+        return f"menu {message.EventKey}"
+
+    @router.event(EventType.CLICK)
+    def click(message):
+        return "click"
+
+    @router.default
+    def fallback(message):
+        return None
+
+    return router
+
+
+@pytest.mark.asyncio
+async def test_dispatch_picks_most_specific_handler(offline_async_client):
+    router = _router(offline_async_client())
+
+    async def reply(xml):
+        message = await router.dispatch(parse_message(xml))
+        return None if message is None else message.Content
+
+    assert await reply(_text_xml("hi")) == "echo hi"
+    assert await reply(_event_xml("CLICK", "help")) == "help"
+    assert await reply(_event_xml("CLICK", "menu_about")) == "menu menu_about"
+    assert await reply(_event_xml("CLICK", "other")) == "click"
+    assert await reply(_event_xml("subscribe")) is None
+
+
+async def _call(app, method: str, query: str, body: bytes = b""):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "query_string": query.encode()}
+    await app(scope, receive, send)
+    return sent[0]["status"], sent[1]["body"].decode()
+
+
+@pytest.mark.asyncio
+async def test_asgi_endpoint(offline_async_client):
+    client = offline_async_client()
+    router = _router(client)
+    router._deduplicator = MessageDeduplicator()
+    timestamp = str(int(time.time()))
+
+    def query(nonce: str) -> str:
+        signature = client.generate_signature(timestamp, nonce)
+        return f"signature={signature}&timestamp={timestamp}&nonce={nonce}"
+
+    assert await _call(router, "GET", query("a") + "&echostr=abc") == (200, "abc")
+    bad_query = f"signature={'0' * 40}&timestamp={timestamp}&nonce=a"
+    assert (await _call(router, "GET", bad_query))[0] == 400
+
+    status, body = await _call(router, "POST", query("b"), _text_xml("hi").encode())
+    assert status == 200
+    assert parse_message(body).Content == "echo hi"
+    # A WeChat retry reuses the query string and gets the first reply back.
+    retry = await _call(router, "POST", query("b"), _text_xml("hi").encode())
+    assert retry == (status, body)
+    assert client.signature_verifier.stats.retries == 1
+    status, body = await _call(
+        router, "POST", query("c"), _event_xml("subscribe").encode()
+    )
+    assert (status, body) == (200, "success")
+
+
+@pytest.mark.asyncio
+async def test_retried_push_gets_cached_reply(offline_async_client):
+    client = offline_async_client()
+    router = _router(client)
+    calls = []
+
+    @router.message(MessageType.TEXT)
+    async def count(message):
+        calls.append(message.MsgId)
+        return f"reply {len(calls)}"
+
+    timestamp = str(int(time.time()))
+    push = (
+        _text_xml("hi").encode(),
+        client.generate_signature(timestamp, "n"),
+        timestamp,
+        "n",
+    )
+    # Without a deduplicator a reused nonce is always rejected.
+    assert await router.handle(*push) is not None
+    assert await router.handle(*push) is None
+
+    router._deduplicator = MessageDeduplicator()
+    push = (push[0], client.generate_signature(timestamp, "m"), timestamp, "m")
+    first = await router.handle(*push)
+    assert await router.handle(*push) == first
+    assert calls == [1, 1]
+    assert router._deduplicator.stats.duplicates == 1
+    assert router._deduplicator.stats.cached_replies == 1
+
+
+@pytest.mark.parametrize("deduplicate", [False, True])
+@pytest.mark.asyncio
+async def test_retry_after_failed_delivery_is_accepted(
+    offline_async_client, deduplicate
+):
+    client = offline_async_client()
+    router = _router(client)
+    if deduplicate:
+        router._deduplicator = MessageDeduplicator()
+    calls = []
+
+    @router.message(MessageType.TEXT)
+    async def flaky(message):
+        calls.append(message.MsgId)
+        if len(calls) == 1:
+            raise Exception("handler failed")
+        return "ok"
+
+    timestamp = str(int(time.time()))
+    push = (
+        _text_xml("hi").encode(),
+        client.generate_signature(timestamp, "n"),
+        timestamp,
+        "n",
+    )
+    with pytest.raises(Exception, match="handler failed"):
+        await router.handle(*push)
+    assert parse_message(await router.handle(*push)).Content == "ok"
+    assert calls == [1, 1]
+    assert client.signature_verifier.stats.replayed == 0
+
+
+@pytest.mark.asyncio
+async def test_encrypted_push_gets_encrypted_reply(offline_async_client):
+    client = offline_async_client()
+    router = _router(client)
+    encrypted = await client.aencrypt_message(parse_message(_text_xml("secret")))
+    body = (
+        "<xml><ToUserName><![CDATA[gh]]></ToUserName>"
+        f"<Encrypt><![CDATA[{encrypted.Encrypt}]]></Encrypt></xml>"
+    )
+    reply = await router.handle(
+        body.encode(),
+        client.generate_signature(encrypted.TimeStamp, encrypted.Nonce),
+        encrypted.TimeStamp,
+        encrypted.Nonce,
+        encrypted.MsgSignature,
+    )
+    message = parse_message(client.decrypt(parse_xml(reply)["Encrypt"]))
+    assert isinstance(message, TextMessage)
+    assert message.Content == "echo secret"
+    assert await router.handle(body.encode(), "x", "1", "n") is None
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from pywechat.cache import MemoryCache
+from pywechat.client import RetryPolicy
+from pywechat.sender import BulkSender, RateLimiter, TokenBucket
+
+
+def _token_cache() -> MemoryCache:
+    cache = MemoryCache()
+    cache.set("appid", "token-0", ex=7200)
+    return cache
+
+
+def _text(openid: str) -> dict:
+    return {"touser": openid, "msgtype": "text", "text": {"content": "hi"}}
+
+
+@pytest.mark.asyncio
+async def test_bulk_sender_streams_results_with_bounded_concurrency(
+    offline_async_client,
+):
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.005)
+        in_flight -= 1
+        return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+    sender = BulkSender(
+        offline_async_client(
+            transport=httpx.MockTransport(handler), cache=_token_cache()
+        ),
+        concurrency=25,
+    )
+
+    async def recipients():
+        for i in range(1000):
+            yield f"openid-{i}"
+
+    start = time.monotonic()
+    results = [
+        result async for result in sender.send_custom_messages(recipients(), _text)
+    ]
+    elapsed = time.monotonic() - start
+    assert len(results) == 1000
+    assert all(result.ok for result in results)
+    assert peak <= 25
+    assert sender.stats.sent == 1000
+    # 1000 calls of 5ms at 25 in flight would take 5s if run one by one.
+    assert elapsed < 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_sender_retries_transient_and_token_errors(offline_async_client):
+    attempts = {}
+
+    async def handler(request: httpx.Request):
+        if request.url.path == "/cgi-bin/token":
+            return httpx.Response(
+                200, json={"access_token": "token-1", "expires_in": 7200}
+            )
+        openid = json.loads(request.content)["touser"]
+        attempts[openid] = attempts.get(openid, 0) + 1
+        if openid == "busy" and attempts[openid] < 3:
+            return httpx.Response(200, json={"errcode": -1, "errmsg": "busy"})
+        if openid == "expired" and request.url.params["access_token"] == "token-0":
+            return httpx.Response(200, json={"errcode": 42001, "errmsg": "expired"})
+        if openid == "blocked":
+            return httpx.Response(200, json={"errcode": 43004, "errmsg": "no"})
+        return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+    client = offline_async_client(
+        transport=httpx.MockTransport(handler), cache=_token_cache()
+    )
+    sender = BulkSender(client, concurrency=3, backoff=0.001)
+    results = {
+        result.recipient: result
+        async for result in sender.send_custom_messages(
+            ["busy", "expired", "blocked"], _text
+        )
+    }
+    assert results["busy"].ok and results["busy"].attempts == 3
+    assert results["expired"].ok
+    assert not results["blocked"].ok and results["blocked"].errcode == 43004
+    assert sender.stats.retries == 2
+    assert client.request_stats.token_retries == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_sender_only_resends_when_nothing_was_sent(offline_async_client):
+    attempts = {}
+
+    async def handler(request: httpx.Request):
+        openid = json.loads(request.content)["touser"]
+        attempts[openid] = attempts.get(openid, 0) + 1
+        if openid == "unreachable" and attempts[openid] < 3:
+            raise httpx.ConnectError("refused", request=request)
+        if openid == "slow":
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(200, json={"errcode": 0, "errmsg": "ok"})
+
+    client = offline_async_client(
+        transport=httpx.MockTransport(handler), cache=_token_cache()
+    )
+    client.retry_policy = RetryPolicy(max_retries=0)
+    sender = BulkSender(client, concurrency=2, backoff=0.001)
+    results = {
+        result.recipient: result
+        async for result in sender.send_custom_messages(["unreachable", "slow"], _text)
+    }
+    assert results["unreachable"].ok and results["unreachable"].attempts == 3
+    # The message may have been delivered, sending it again could duplicate it.
+    assert not results["slow"].ok and results["slow"].unknown
+    assert attempts["slow"] == 1
+    assert sender.stats.retries == 2
+    assert sender.stats.unknown == 1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    limiter = RateLimiter(api_rates={"url": 100})
+    bucket = TokenBucket(100, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        await bucket.acquire()
+        await limiter.acquire("appid", "url")
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,46 @@
+import hashlib
+import time
+from pywechat.signature import SignatureVerifier
+
+
+def _reference(token: str, *parts: str) -> str:
+    return hashlib.sha1("".join(sorted([token, *parts])).encode()).hexdigest()
+
+
+def test_sign_matches_reference():
+    for token in ("token", "0token", "~"):
+        verifier = SignatureVerifier(token)
+        assert verifier.sign("1700000000", "nonce") == _reference(
+            token, "1700000000", "nonce"
+        )
+        assert verifier.sign("1700000000", "nonce", "enc") == _reference(
+            token, "1700000000", "nonce", "enc"
+        )
+
+
+def test_check_request():
+    verifier = SignatureVerifier("token", max_skew=60)
+    now = str(int(time.time()))
+    signature = verifier.sign(now, "n1")
+    assert verifier.check_request(signature, now, "n1")
+    # Same nonce again is a replay.
+    assert not verifier.check_request(signature, now, "n1")
+    # A forged signature does not poison the nonce set.
+    assert not verifier.check_request("0" * 40, now, "n2")
+    assert verifier.check_request(verifier.sign(now, "n2"), now, "n2")
+
+    old = str(int(time.time()) - 120)
+    assert not verifier.check_request(verifier.sign(old, "n3"), old, "n3")
+    assert not verifier.check_request("short", now, "n4")
+    assert verifier.stats.verified == 2
+    assert verifier.stats.replayed == 1
+    assert verifier.stats.stale == 1
+    assert verifier.stats.invalid == 2
+
+
+def test_nonce_set_is_bounded():
+    verifier = SignatureVerifier("token", max_nonces=10)
+    now = str(int(time.time()))
+    for i in range(100):
+        assert verifier.check_request(verifier.sign(now, str(i)), now, str(i))
+    assert len(verifier._nonces) <= 10
@@ -0,0 +1,86 @@
+import time
+import httpx
+import pytest
+from pywechat.api.base import WechatAPIError
+from pywechat.router import MessageRouter
+from pywechat.simulator.api import (
+    API_FREQ_OUT_OF_LIMIT,
+    REFRESH_TOKEN_TTL,
+    MockWechatAPI,
+)
+from pywechat.simulator.load import asgi_sender, run_load
+from pywechat.simulator.pushes import PushFactory, sample_messages
+
+
+def _transport(api: MockWechatAPI) -> httpx.ASGITransport:
+    return httpx.ASGITransport(api)
+
+
+@pytest.mark.asyncio
+async def test_mock_api_serves_the_client(offline_async_client):
+    api = MockWechatAPI(followers=250, latency=0.001)
+    client = offline_async_client(api.appid, api.app_secret, _transport(api))
+    openids = [user.openid async for user in client.iter_follower_profiles()]
+    assert openids == api.openids
+    upload = await client.media.upload("image", b"\xff\xd8" * 1000, "a.jpg")
+    assert await client.media.download(upload.media_id) == b"\xff\xd8" * 1000
+    token = await client.oauth.exchange_code(api.openids[3])
+    assert (await client.oauth.userinfo(token.openid)).openid == api.openids[3]
+
+    api.expire_tokens()
+    await client.menus.create({"button": []})
+    assert client.request_stats.token_retries == 1
+
+    api.errcodes["/cgi-bin/qrcode/create"] = 40001
+    with pytest.raises(WechatAPIError):
+        await client.qrcode.create(1)
+    await client.aclose()
+
+
+def test_mock_api_rate_limit_with_sync_client(offline_client):
+    api = MockWechatAPI(rate_limit=5)
+    client = offline_client(api.appid, api.app_secret, api.transport())
+    with pytest.raises(WechatAPIError) as e:
+        for _ in range(10):
+            client.templates.list()
+    assert e.value.errcode == API_FREQ_OUT_OF_LIMIT
+    assert api.stats.rate_limited == 1
+    client.close()
+
+
+def test_mock_api_prunes_expired_tokens(monkeypatch):
+    api = MockWechatAPI()
+    token_query = {"appid": api.appid, "secret": api.app_secret}
+    oauth_query = {"secret": api.app_secret, "code": "code"}
+    for _ in range(3):
+        api.handle("GET", "/cgi-bin/token", token_query, {}, b"")
+        api.handle("GET", "/sns/oauth2/access_token", oauth_query, {}, b"")
+    later = time.time() + REFRESH_TOKEN_TTL + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    api.handle("GET", "/cgi-bin/token", token_query, {}, b"")
+    api.handle("GET", "/sns/oauth2/access_token", oauth_query, {}, b"")
+    assert len(api._tokens) == 1
+    assert len(api._oauth_tokens) == 1
+    assert len(api._refresh_tokens) == 1
+
+
+@pytest.mark.asyncio
+async def test_load_generator_against_router(offline_async_client, offline_key):
+    api = MockWechatAPI()
+    client = offline_async_client(api.appid, api.app_secret, _transport(api))
+    router = MessageRouter(client)
+    factory = PushFactory("token", offline_key, api.appid)
+    report = await run_load(
+        asgi_sender(router),
+        factory.pushes(encrypted_ratio=0.5),
+        rate=400,
+        duration=0.25,
+    )
+    assert report.sent == 100 and report.failed == 0
+    assert 0 < report.p50 <= report.p99 <= report.max
+    assert report.throughput > 0
+
+    pushes = list(zip(range(2 * len(sample_messages())), factory.pushes(0.5)))
+    assert {push.kind for _, push in pushes} == set(sample_messages())
+    assert sum(push.encrypted for _, push in pushes) == len(sample_messages())
+    await client.aclose()
@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+import pytest
+from pywechat.deferred import ACK_DEADLINE
+from pywechat.router import MessageRouter
+from pywechat.simulator.pushes import PushFactory, sample_messages
+from pywechat.sink import (
+    BLOCK,
+    BaseEventSink,
+    GzipNDJSONSink,
+    JSONLSink,
+    ParquetSink,
+    PushArchive,
+)
+
+
+class _SlowSink(BaseEventSink):
+    def __init__(self):
+        self.release = threading.Event()
+        self.records = []
+
+    def write(self, records):
+        self.release.wait(5)
+        self.records.extend(records)
+
+
+async def _handle(router: MessageRouter, push):
+    query = dict(part.split("=", 1) for part in push.query.split("&"))
+    return await router.handle(
+        push.body, query["signature"], query["timestamp"], query["nonce"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_router_archives_without_waiting_for_the_sink(
+    tmp_path, offline_async_client, offline_key
+):
+    client = offline_async_client()
+    sink = _SlowSink()
+    archive = PushArchive(sink, batch_size=4, flush_interval=0.05)
+    router = MessageRouter(client, archive=archive)
+    factory = PushFactory("token", offline_key, "appid")
+    pushes = factory.pushes()
+    started = time.monotonic()
+    for _ in range(10):
+        assert await _handle(router, next(pushes)) == "success"
+    # The sink blocks, the handler does not.
+    assert time.monotonic() - started < 1
+    sink.release.set()
+    await archive.stop()
+    assert len(sink.records) == 10 and archive.stats.batches >= 3
+    assert {record["MsgType"] for record in sink.records} >= {"text", "event"}
+    assert all("received_at" in record for record in sink.records)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_or_blocks():
+    message = sample_messages()["text"]
+    sink = _SlowSink()
+    archive = PushArchive(sink, max_size=2, batch_size=1, flush_interval=0.01)
+    for _ in range(5):
+        await archive.put(message)
+    await asyncio.sleep(0.05)
+    assert archive.stats.dropped >= 2
+    sink.release.set()
+    await archive.stop()
+    assert archive.stats.written + archive.stats.dropped == 5
+
+    sink = _SlowSink()
+    archive = PushArchive(
+        sink, max_size=1, batch_size=1, policy=BLOCK, block_timeout=0.05
+    )
+    results = [await archive.put(message) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    sink.release.set()
+    # Room frees up once the sink returns, blocked puts then go through.
+    assert await archive.put(message)
+    await archive.stop()
+    assert results[0] and archive.stats.blocked_seconds > 0
+    assert archive.stats.written == results.count(True) + 1
+
+
+def test_block_policy_requires_timeout_below_reply_deadline():
+    for block_timeout in (None, ACK_DEADLINE):
+        with pytest.raises(Exception, match="block_timeout"):
+            PushArchive(_SlowSink(), policy=BLOCK, block_timeout=block_timeout)
+
+
+@pytest.mark.asyncio
+async def test_file_sinks(tmp_path):
+    messages = list(sample_messages().values())
+    for sink, read in [
+        (JSONLSink(str(tmp_path / "a.jsonl")), open),
+        (GzipNDJSONSink(str(tmp_path / "a.ndjson.gz")), gzip.open),
+    ]:
+        archive = PushArchive(sink, batch_size=5, flush_interval=0.01)
+        for message in messages:
+            await archive.put(message)
+        await archive.stop()
+        with read(sink._path, "rt") as f:
+            records = [json.loads(line) for line in f]
+        assert [record["MsgType"] for record in records] == [
+            message.MsgType.value for message in messages
+        ]
+
+
+@pytest.mark.asyncio
+async def test_parquet_sink(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    archive = PushArchive(ParquetSink(str(tmp_path / "pushes")), batch_size=100)
+    for message in sample_messages().values():
+        await archive.put(message)
+    await archive.stop()
+    table = parquet.read_table(str(tmp_path / "pushes"))
+    assert table.num_rows == len(sample_messages())